@@ -1,112 +1,125 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g, send_from_directory
 import sqlite3
 from datetime import datetime, date
 import os
-import pandas as pd
+import base64
+import concurrent.futures
+import hmac
+import json
+import mimetypes
+import re
+import time
 from werkzeug.utils import secure_filename
+import archive
+import assets
+import cache
+import database
+import importer
+import jobs
+import metrics
+import pubsub
+import registrations
+import replica
+import reports
 
 app = Flask(__name__)
-app.secret_key = 'your_secret_key_here'
+DEV_SECRET_KEY = 'your_secret_key_here'
+app.secret_key = DEV_SECRET_KEY
 DATABASE = 'college_portal.db'
 UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
+ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['DATABASE'] = DATABASE
+
+# Connection pool settings (see database.ConnectionPool)
+app.config['DB_POOL_SIZE'] = 8
+app.config['DB_PRAGMAS'] = dict(database.DEFAULT_PRAGMAS)
+app.config['DB_STATEMENT_CACHE_SIZE'] = database.DEFAULT_STATEMENT_CACHE_SIZE
+
+# Bulk user imports run as background jobs in a process pool and insert
+# this many rows per executemany batch
+app.config['IMPORT_CHUNK_SIZE'] = importer.DEFAULT_CHUNK_SIZE
+app.config['IMPORT_WORKERS'] = 2
+app.config['IMPORT_JOB_CHECK_SECONDS'] = jobs.DEFAULT_CHECK_SECONDS
+
+# Request and SQL timing, exposed at /metrics. Statements slower than
+# SLOW_QUERY_SECONDS are logged with their query plan. /metrics answers
+# admins and a scraper sending "Authorization: Bearer <METRICS_TOKEN>".
+# It does not go by client address: behind a reverse proxy every request
+# comes from the proxy's. Each worker process shares its numbers every
+# METRICS_SHARE_SECONDS, so whichever worker a scrape reaches reports all
+# of them: counters summed, gauges one series per worker (label pid).
+app.config['METRICS_ENABLED'] = True
+app.config['SLOW_QUERY_SECONDS'] = metrics.DEFAULT_SLOW_QUERY_SECONDS
+app.config['METRICS_TOKEN'] = None
+app.config['METRICS_SHARE_SECONDS'] = metrics.DEFAULT_SHARE_SECONDS
+
+# Rendered dashboards are cached per user until a write changes something
+# they show (see cache.VersionStamps), within a memory cap
+app.config['RENDER_CACHE_BYTES'] = cache.DEFAULT_RENDER_CACHE_BYTES
+app.config['RENDER_CACHE_SECONDS'] = cache.DEFAULT_RENDER_CACHE_SECONDS
+
+# Static files are linked through asset_url(), which points at the
+# fingerprinted build from `python assets.py build` when there is one.
+# Those never change under the same name, so browsers keep them for a year
+# without revalidating. In debug mode the plain sources are used.
+app.config['ASSET_MAX_AGE'] = 365 * 24 * 3600
+
+# Live updates over /api/stream: an idle stream gets a comment line this
+# often, which keeps proxies from closing it and notices gone clients
+app.config['STREAM_KEEPALIVE_SECONDS'] = 15
+# Every open stream holds a server thread. A process takes at most
+# STREAM_MAX_OPEN of them (gunicorn.conf.py adds that many threads); past
+# that a browser is told to retry in STREAM_BUSY_RETRY_SECONDS, perhaps on
+# another worker. Streams end after STREAM_MAX_SECONDS and the browser
+# reconnects where it left off, so long-open pages spread over the workers.
+app.config['STREAM_MAX_OPEN'] = pubsub.DEFAULT_MAX_SUBSCRIBERS
+app.config['STREAM_MAX_SECONDS'] = 300
+app.config['STREAM_BUSY_RETRY_SECONDS'] = 10
+
+# Report-class reads (the admin statistics and the report exports) go to a
+# read-only snapshot of the database, refreshed every
+# REPLICA_INTERVAL_SECONDS with the online backup API (see replica.py), so
+# they do not compete with the writers. They fall back to the live
+# database while there is no snapshot younger than
+# REPLICA_MAX_STALENESS_SECONDS. REPLICA_PATH defaults to <database>.replica.db;
+# keep it in the same directory as the database, since archived terms are
+# found relative to it.
+app.config['REPLICA_ENABLED'] = True
+app.config['REPLICA_PATH'] = None
+app.config['REPLICA_INTERVAL_SECONDS'] = replica.DEFAULT_INTERVAL_SECONDS
+app.config['REPLICA_MAX_STALENESS_SECONDS'] = replica.DEFAULT_MAX_STALENESS_SECONDS
+
+# Event registrations are queued to one writer thread per process, which
+# commits whatever has queued up in one transaction of up to
+# REGISTRATION_BATCH_SIZE (see registrations.py). With REGISTRATION_QUEUE
+# off each request writes its own registration.
+app.config['REGISTRATION_QUEUE'] = True
+app.config['REGISTRATION_BATCH_SIZE'] = registrations.DEFAULT_BATCH_SIZE
+app.config['REGISTRATION_TIMEOUT_SECONDS'] = registrations.DEFAULT_TIMEOUT_SECONDS
+
+# Attendance storage: 'rows' keeps one attendance row per student and
+# session; 'bitmap' keeps one attendance_sessions row per class session
+# (see bitmaps.py). Run `python bitmaps.py convert` before switching to
+# 'bitmap'; term archives hold rows either way (archive.py writes the
+# sessions out as rows).
+app.config['ATTENDANCE_STORAGE'] = 'rows'
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # Initialize database
 def init_db():
-    conn = sqlite3.connect(DATABASE)
+    conn = sqlite3.connect(app.config['DATABASE'])
     c = conn.cursor()
     
-    # Create tables
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL,
-            name TEXT NOT NULL,
-            email TEXT,
-            department TEXT,
-            class TEXT
-        )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS permissions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER,
-            faculty_id INTEGER,
-            date DATE NOT NULL,
-            reason TEXT NOT NULL,
-            proof TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (student_id) REFERENCES users (id),
-            FOREIGN KEY (faculty_id) REFERENCES users (id)
-        )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS attendance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER,
-            class_id INTEGER,
-            date DATE NOT NULL,
-            status TEXT NOT NULL,
-            FOREIGN KEY (student_id) REFERENCES users (id)
-        )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS classes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            faculty_id INTEGER,
-            schedule TEXT,
-            room TEXT,
-            FOREIGN KEY (faculty_id) REFERENCES users (id)
-        )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            date DATE NOT NULL,
-            time TEXT,
-            venue TEXT,
-            description TEXT
-        )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS student_events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER,
-            event_id INTEGER,
-            FOREIGN KEY (student_id) REFERENCES users (id),
-            FOREIGN KEY (event_id) REFERENCES events (id)
-        )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS clubs_events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            type TEXT NOT NULL,
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    # Bring the schema up to date; nothing to do (and no DDL run) when current
+    applied = database.migrate(conn)
     
     # Insert default data
-    # Check if admin already exists
-    c.execute("SELECT * FROM users WHERE username = 'admin'")
-    if not c.fetchone():
+    # Check if admin already exists (only needed right after a migration)
+    if applied and not c.execute("SELECT 1 FROM users WHERE username = 'admin'").fetchone():
         c.execute("INSERT INTO users (username, password, role, name, email) VALUES (?, ?, ?, ?, ?)",
                  ('admin', 'admin123', 'admin', 'System Administrator', 'admin@college.edu'))
         
@@ -148,6 +161,10 @@ def init_db():
         for name, type in clubs_events:
             c.execute("INSERT INTO clubs_events (name, type) VALUES (?, ?)", (name, type))
         
+        # Enroll the sample students
+        c.execute("INSERT INTO class_enrollments (class_id, student_id) VALUES (?, ?)", (1, 4))
+        c.execute("INSERT INTO class_enrollments (class_id, student_id) VALUES (?, ?)", (1, 5))
+        
         # Add sample attendance
         today = date.today().isoformat()
         c.execute("INSERT INTO attendance (student_id, class_id, date, status) VALUES (?, ?, ?, ?)",
@@ -160,17 +177,276 @@ def init_db():
                  (4, 2, '2023-10-25', 'Medical appointment', 'pending'))
     
     # Create uploads directory if it doesn't exist
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
+    if not os.path.exists(app.config['UPLOAD_FOLDER']):
+        os.makedirs(app.config['UPLOAD_FOLDER'])
     
     conn.commit()
     conn.close()
 
-# Database helper function
+# Application factory: what a server process runs once before taking
+# requests. On a database whose schema is current this is a single
+# version lookup; pandas and openpyxl are not loaded until an upload or
+# an xlsx export needs them (check_startup.py keeps that within budget).
+# Settings are read from PORTAL_* environment variables first, e.g.
+# PORTAL_DATABASE, PORTAL_UPLOAD_FOLDER, PORTAL_SECRET_KEY or
+# PORTAL_DB_POOL_SIZE=16 (values are parsed as JSON where possible).
+# It leaves no SQLite connection open, so a server may call it before
+# forking its workers (see gunicorn.conf.py).
+def create_app(config=None):
+    app.config.from_prefixed_env('PORTAL')
+    if config:
+        app.config.update(config)
+    if app.secret_key == DEV_SECRET_KEY and not app.debug:
+        app.logger.warning('Using the development secret key; set PORTAL_SECRET_KEY')
+    render_cache.max_bytes = app.config['RENDER_CACHE_BYTES']
+    render_cache.max_age = app.config['RENDER_CACHE_SECONDS']
+    stream_relay.poll_seconds = app.config['STREAM_POLL_SECONDS']
+    shared_metrics.interval = app.config['METRICS_SHARE_SECONDS']
+    broker.max_subscribers = app.config['STREAM_MAX_OPEN']
+    if not app.extensions.get('db_initialized'):
+        init_db()
+        app.extensions['db_initialized'] = True
+    return app
+
+# Database helper functions
+def get_db_pool():
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        pool = database.ConnectionPool(app.config['DATABASE'],
+                                       size=app.config['DB_POOL_SIZE'],
+                                       pragmas=app.config['DB_PRAGMAS'],
+                                       statement_cache_size=app.config['DB_STATEMENT_CACHE_SIZE'],
+                                       factory=(metrics.TimedConnection if app.config['METRICS_ENABLED']
+                                                else sqlite3.Connection))
+        metrics.registry.slow_query_seconds = app.config['SLOW_QUERY_SECONDS']
+        app.extensions['db_pool'] = pool
+    return pool
+
+def get_replica():
+    snapshots = app.extensions.get('replica')
+    if snapshots is None:
+        snapshots = replica.Replica(app.config['DATABASE'], app.config['REPLICA_PATH'],
+                                    interval=app.config['REPLICA_INTERVAL_SECONDS'],
+                                    max_staleness=app.config['REPLICA_MAX_STALENESS_SECONDS'],
+                                    connect_options={'pragmas': app.config['DB_PRAGMAS'],
+                                                     'statement_cache_size': app.config['DB_STATEMENT_CACHE_SIZE'],
+                                                     'factory': (metrics.TimedConnection
+                                                                 if app.config['METRICS_ENABLED']
+                                                                 else sqlite3.Connection)},
+                                    on_snapshot=snapshot_taken)
+        app.extensions['replica'] = snapshots
+    snapshots.start()
+    return snapshots
+
+def snapshot_taken(taken_at):
+    # Pages that show snapshot data are re-rendered from the new one
+    conn = database.connect(app.config['DATABASE'])
+    try:
+        cache.bump_versions(conn, ('snapshot',))
+        conn.commit()
+    finally:
+        conn.close()
+
+# A connection for report-class reads: (connection, snapshot time) on the
+# snapshot, or (None, None) when the caller should use the live database
+def report_connection():
+    if not app.config['REPLICA_ENABLED']:
+        return None, None
+    return get_replica().connect()
+
+# Active clubs/events, cached in-process until a write invalidates it.
+# Anything that changes clubs_events must call catalog_cache.invalidate()
+# and bump 'catalog', which reaches the copies in other processes.
+catalog_cache = cache.CatalogCache()
+
+def get_catalog():
+    return catalog_cache.get(
+        lambda: get_db_connection().execute('SELECT * FROM clubs_events WHERE is_active = 1').fetchall(),
+        version=stamps.current(('catalog',))
+    )
+
+# Page cache. Each cached view names the entities it is built from:
+#   users, classes (classes and enrollments), permissions, catalog, events,
+#   permissions:<user id>, attendance:<student id>, events:<student id>,
+#   snapshot (a new report snapshot was taken)
+# and every write bumps the entities it changed, after committing. The
+# versions are kept in the database, so a write served by one worker
+# process invalidates the pages cached by all of them.
+stamps = cache.SharedVersionStamps(lambda: get_db_connection())
+render_cache = cache.RenderCache(app.config['RENDER_CACHE_BYTES'], app.config['RENDER_CACHE_SECONDS'])
+
+def cached_page(view, entities, render):
+    # Flashed messages are shown once, so such a page must not be reused
+    if '_flashes' in session:
+        return render()
+    versions = stamps.current(entities)
+    key = (view, session['user_id'], session.get('name'))
+    body = render_cache.get(key, versions)
+    if body is None:
+        body = render().encode('utf-8')
+        render_cache.put(key, versions, body)
+    return body
+
+def bump_permissions(permissions):
+    entities = {'permissions'}
+    for permission in permissions:
+        entities.update(f'permissions:{permission[column]}' for column in ('student_id', 'faculty_id'))
+    stamps.bump(*entities)
+
+# Permission requests and decisions are pushed to the open dashboards of
+# the users involved; each user listens on their own channel. Messages go
+# through the stream_messages table, which every worker process relays to
+# its own subscribers, so message ids are shared by all of them.
+app.config['STREAM_POLL_SECONDS'] = pubsub.DEFAULT_POLL_SECONDS
+broker = pubsub.Broker(boot='log')
+stream_relay = pubsub.LogRelay(broker, lambda: database.connect(app.config['DATABASE']),
+                               poll_seconds=app.config['STREAM_POLL_SECONDS'])
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+def permission_payloads(conn, permission_ids):
+    return [dict(row) for row in conn.execute('''
+        SELECT p.id, p.student_id, p.faculty_id, p.date, p.reason, p.status,
+               s.name as student_name, f.name as faculty_name
+        FROM permissions p
+        LEFT JOIN users s ON s.id = p.student_id
+        LEFT JOIN users f ON f.id = p.faculty_id
+        WHERE p.id IN (SELECT value FROM json_each(?))
+        ORDER BY p.id
+    ''', (json.dumps(list(permission_ids)),))]
+
+def permission_payload(conn, permission_id):
+    permissions = permission_payloads(conn, [permission_id])
+    return permissions[0] if permissions else None
+
+def pending_count(conn, role, user_id):
+    column = 'faculty_id' if role == 'faculty' else 'student_id'
+    return conn.execute(f'SELECT COUNT(*) FROM permissions WHERE {column} = ? AND status = "pending"',
+                        (user_id,)).fetchone()[0]
+
+def publish_permissions(conn, event, permissions):
+    # Both sides get each row and their own new pending count, counted
+    # once per user however many of their rows changed
+    counts = {}
+    messages = []
+    for permission in permissions:
+        for role in ('student', 'faculty'):
+            user_id = permission[f'{role}_id']
+            if user_id is None:
+                continue
+            if (role, user_id) not in counts:
+                counts[(role, user_id)] = pending_count(conn, role, user_id)
+            messages.append((user_channel(user_id), event,
+                             {'permission': permission, 'pending': counts[(role, user_id)]}))
+    pubsub.LogRelay.append(conn, messages)
+    conn.commit()
+
+def publish_permission(conn, event, permission):
+    publish_permissions(conn, event, [permission])
+
+# One pooled connection per request, returned to the pool on teardown
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    if 'db' not in g:
+        g.db = get_db_pool().acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_db_pool().release(conn)
+
+def metrics_gauges():
+    # Pool, stream, cache and snapshot figures of this process
+    pool = get_db_pool().stats()
+    stream = broker.stats()
+    pages = render_cache.stats()
+    snapshots = app.extensions.get('replica')
+    gauges = {
+        'portal_db_pool_idle': ('gauge', 'Idle pooled connections', pool['idle']),
+        'portal_db_pool_hits_total': ('counter', 'Connections handed out from the pool', pool['hits']),
+        'portal_db_pool_misses_total': ('counter', 'Connections opened because the pool was empty', pool['misses']),
+        'portal_db_pool_discarded_total': ('counter', 'Connections closed because the pool was full',
+                                           pool['discarded']),
+        'portal_stream_subscribers': ('gauge', 'Open live update streams', stream['subscribers']),
+        'portal_stream_dropped_total': ('counter', 'Streams dropped for falling behind', stream['dropped']),
+        'portal_stream_refused_total': ('counter', 'Streams refused at STREAM_MAX_OPEN', stream['refused']),
+        'portal_render_cache_bytes': ('gauge', 'Size of the cached pages', pages['bytes']),
+        'portal_render_cache_hits_total': ('counter', 'Pages served from the render cache', pages['hits']),
+        'portal_render_cache_misses_total': ('counter', 'Pages rendered because no current copy was cached',
+                                             pages['misses']),
+        'portal_render_cache_evictions_total': ('counter', 'Cached pages evicted to stay under the memory cap',
+                                                pages['evictions']),
+    }
+    if snapshots is not None:
+        age = snapshots.age()
+        if age is not None:
+            gauges['portal_replica_age_seconds'] = ('gauge', 'Age of the report snapshot', round(age, 1))
+        gauges['portal_replica_snapshots_total'] = ('counter', 'Report snapshots taken',
+                                                    snapshots.snapshots)
+        gauges['portal_replica_failures_total'] = ('counter', 'Report snapshots that failed', snapshots.failures)
+    return gauges
+
+shared_metrics = metrics.SharedMetrics(metrics.registry, lambda: database.connect(app.config['DATABASE']),
+                                       metrics_gauges, interval=app.config['METRICS_SHARE_SECONDS'])
+
+# Request timing; queries run while serving a request are tagged with its
+# endpoint
+@app.before_request
+def start_request_timer():
+    if app.config['METRICS_ENABLED']:
+        shared_metrics.start()
+    g.request_started = time.perf_counter()
+    g.metrics_token = metrics.current_route.set(request.endpoint or '-')
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.registry.observe_request(request.endpoint or '-', request.method, response.status_code,
+                                         time.perf_counter() - started)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exception):
+    # after_request is skipped when a view raises
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.registry.observe_request(request.endpoint or '-', request.method, 500,
+                                         time.perf_counter() - started)
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        metrics.current_route.reset(token)
+
+def get_asset_manifest():
+    manifest = app.extensions.get('asset_manifest')
+    if manifest is None:
+        manifest = {} if app.debug else assets.load_manifest(app.static_folder)
+        app.extensions['asset_manifest'] = manifest
+    return manifest
+
+@app.template_global()
+def asset_url(filename):
+    built = get_asset_manifest().get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=built)
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    # Send the precompressed copy the client accepts, if the build made one
+    dist_dir = os.path.join(app.static_folder, assets.DIST_DIR)
+    send_name, encoding = assets.choose_encoding(dist_dir, filename,
+                                                 lambda e: request.accept_encodings[e] > 0)
+    response = send_from_directory(dist_dir, send_name, max_age=app.config['ASSET_MAX_AGE'])
+    if encoding:
+        response.content_encoding = encoding
+        # Typed by the uncompressed name, not as .gz/.br
+        response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
 
 # Routes
 @app.route('/')
@@ -188,7 +464,6 @@ def login():
         'SELECT * FROM users WHERE username = ? AND password = ? AND role = ?',
         (username, password, role)
     ).fetchone()
-    conn.close()
     
     if user:
         session['user_id'] = user['id']
@@ -216,65 +491,81 @@ def admin_dashboard():
     if 'user_id' not in session or session['role'] != 'admin':
         return redirect(url_for('index'))
     
+    return cached_page('admin_dashboard', ('users', 'classes', 'permissions', 'events', 'snapshot'),
+                       render_admin_dashboard)
+
+def render_admin_dashboard():
     conn = get_db_connection()
     
-    # Get statistics
-    students_count = conn.execute('SELECT COUNT(*) FROM users WHERE role = "student"').fetchone()[0]
-    faculty_count = conn.execute('SELECT COUNT(*) FROM users WHERE role = "faculty"').fetchone()[0]
-    pending_permissions = conn.execute('SELECT COUNT(*) FROM permissions WHERE status = "pending"').fetchone()[0]
-    events_count = conn.execute('SELECT COUNT(*) FROM events').fetchone()[0]
-    
-    # Get users
-    students = conn.execute('SELECT * FROM users WHERE role = "student"').fetchall()
-    faculty = conn.execute('SELECT * FROM users WHERE role = "faculty"').fetchall()
+    # Get statistics in a single round trip, from the report snapshot
+    # when there is a fresh one
+    stats_conn, stats_taken_at = report_connection()
+    try:
+        stats = (stats_conn or conn).execute('''
+        SELECT
+            (SELECT COUNT(*) FROM users WHERE role = 'student') as students_count,
+            (SELECT COUNT(*) FROM users WHERE role = 'faculty') as faculty_count,
+            (SELECT COUNT(*) FROM permissions WHERE status = 'pending') as pending_permissions,
+            (SELECT COUNT(*) FROM events) as events_count
+        ''').fetchone()
+    finally:
+        if stats_conn is not None:
+            stats_conn.close()
     
-    conn.close()
+    # Classes with their enrollment counts, read off the primary key index
+    classes = conn.execute('''
+        SELECT c.id, c.name, u.name as faculty_name,
+            (SELECT COUNT(*) FROM class_enrollments e WHERE e.class_id = c.id) as enrolled
+        FROM classes c
+        LEFT JOIN users u ON u.id = c.faculty_id
+        ORDER BY c.name
+    ''').fetchall()
     
+    # User tables are paged in by the page itself from /api/users
     return render_template('admin_dashboard.html', 
-                         students_count=students_count,
-                         faculty_count=faculty_count,
-                         pending_permissions=pending_permissions,
-                         events_count=events_count,
-                         students=students,
-                         faculty=faculty)
+                         classes=classes,
+                         students_count=stats['students_count'],
+                         faculty_count=stats['faculty_count'],
+                         pending_permissions=stats['pending_permissions'],
+                         events_count=stats['events_count'],
+                         stats_taken_at=(datetime.fromtimestamp(stats_taken_at).strftime('%Y-%m-%d %H:%M')
+                                         if stats_taken_at else None))
 
 @app.route('/faculty/dashboard')
 def faculty_dashboard():
     if 'user_id' not in session or session['role'] != 'faculty':
         return redirect(url_for('index'))
     
+    return cached_page('faculty_dashboard', ('users', 'classes', f"permissions:{session['user_id']}"),
+                       render_faculty_dashboard)
+
+def render_faculty_dashboard():
     conn = get_db_connection()
     faculty_id = session['user_id']
     
     # Get statistics
     classes_count = conn.execute('SELECT COUNT(*) FROM classes WHERE faculty_id = ?', (faculty_id,)).fetchone()[0]
     students_count = conn.execute('''
-        SELECT COUNT(DISTINCT u.id) 
-        FROM users u 
-        JOIN attendance a ON u.id = a.student_id 
-        JOIN classes c ON a.class_id = c.id 
+        SELECT COUNT(DISTINCT e.student_id) 
+        FROM classes c 
+        JOIN class_enrollments e ON e.class_id = c.id 
         WHERE c.faculty_id = ?
     ''', (faculty_id,)).fetchone()[0]
     pending_permissions = conn.execute('SELECT COUNT(*) FROM permissions WHERE faculty_id = ? AND status = "pending"', (faculty_id,)).fetchone()[0]
     
-    # Get permissions
-    permissions = conn.execute('''
-        SELECT p.*, u.name as student_name 
-        FROM permissions p 
-        JOIN users u ON p.student_id = u.id 
-        WHERE p.faculty_id = ?
-    ''', (faculty_id,)).fetchall()
+    # Only the first page of pending requests is rendered; the rest, and
+    # the decided ones, are loaded from /api/permissions as the table scrolls
+    permissions, permissions_cursor = faculty_permissions_page(conn, faculty_id, ['pending'])
     
     # Get classes
     classes = conn.execute('SELECT * FROM classes WHERE faculty_id = ?', (faculty_id,)).fetchall()
     
-    conn.close()
-    
     return render_template('faculty_dashboard.html',
                          classes_count=classes_count,
                          students_count=students_count,
                          pending_permissions=pending_permissions,
                          permissions=permissions,
+                         permissions_cursor=permissions_cursor,
                          classes=classes)
 
 @app.route('/student/dashboard')
@@ -282,50 +573,42 @@ def student_dashboard():
     if 'user_id' not in session or session['role'] != 'student':
         return redirect(url_for('index'))
     
+    student_id = session['user_id']
+    return cached_page('student_dashboard',
+                       ('classes', 'catalog', f'permissions:{student_id}', f'attendance:{student_id}',
+                        registrations.entity(student_id)),
+                       render_student_dashboard)
+
+def render_student_dashboard():
     conn = get_db_connection()
     student_id = session['user_id']
     
     # Get clubs and events for permission form
-    clubs_events = conn.execute('SELECT * FROM clubs_events WHERE is_active = 1').fetchall()
-    clubs = [ce for ce in clubs_events if ce['type'] == 'club']
-    events = [ce for ce in clubs_events if ce['type'] == 'event']
+    catalog = get_catalog()
+    clubs = catalog.clubs
+    events = catalog.events
     
     # Get statistics
-    attendance_percentage = conn.execute('''
-        SELECT 
-            COUNT(CASE WHEN status = 'present' THEN 1 END) * 100.0 / COUNT(*) as percentage
-        FROM attendance 
-        WHERE student_id = ?
-    ''', (student_id,)).fetchone()[0] or 0
+    attendance_percentage, attendance = student_attendance(conn, student_id)
     
     pending_permissions = conn.execute('SELECT COUNT(*) FROM permissions WHERE student_id = ? AND status = "pending"', (student_id,)).fetchone()[0]
-    events_count = conn.execute('SELECT COUNT(*) FROM student_events WHERE student_id = ?', (student_id,)).fetchone()[0]
-    
-    # Get attendance
-    attendance = conn.execute('''
-        SELECT c.name, 
-               COUNT(CASE WHEN a.status = 'present' THEN 1 END) as present,
-               COUNT(CASE WHEN a.status = 'absent' THEN 1 END) as absent,
-               COUNT(CASE WHEN a.status = 'present' THEN 1 END) * 100.0 / COUNT(*) as percentage
-        FROM attendance a
-        JOIN classes c ON a.class_id = c.id
-        WHERE a.student_id = ?
-        GROUP BY c.name
-    ''', (student_id,)).fetchall()
+    events_count = conn.execute('SELECT COUNT(*) FROM student_events WHERE student_id = ? AND status = "registered"', (student_id,)).fetchone()[0]
     
     # Get permissions
     permissions = conn.execute('SELECT * FROM permissions WHERE student_id = ?', (student_id,)).fetchall()
     
-    # Get events
+    # Get events, with the place on the waitlist where there is one
     events_list = conn.execute('''
-        SELECT e.* 
+        SELECT e.*, se.status,
+            CASE WHEN se.status = 'waitlisted' THEN
+                (SELECT COUNT(*) FROM student_events w
+                 WHERE w.event_id = se.event_id AND w.status = 'waitlisted' AND w.id <= se.id)
+            END as position
         FROM events e
         JOIN student_events se ON e.id = se.event_id
         WHERE se.student_id = ?
     ''', (student_id,)).fetchall()
     
-    conn.close()
-    
     return render_template('student_dashboard.html',
                          clubs=clubs,
                          events=events,
@@ -336,7 +619,175 @@ def student_dashboard():
                          permissions=permissions,
                          events_list=events_list)
 
+# A student's overall attendance percentage and per-class figures (by
+# class name). With row storage they come from attendance_summary, which
+# triggers keep in step with the raw attendance rows; with bitmap storage
+# they are counted from the session bitmaps.
+def student_attendance(conn, student_id):
+    if app.config['ATTENDANCE_STORAGE'] != 'bitmap':
+        percentage = conn.execute('''
+            SELECT SUM(present) * 100.0 / SUM(total) as percentage
+            FROM attendance_summary
+            WHERE student_id = ?
+        ''', (student_id,)).fetchone()[0] or 0
+        attendance = conn.execute('''
+            SELECT c.name, 
+                   SUM(s.present) as present,
+                   SUM(s.absent) as absent,
+                   SUM(s.present) * 100.0 / SUM(s.total) as percentage
+            FROM attendance_summary s
+            JOIN classes c ON s.class_id = c.id
+            WHERE s.student_id = ?
+            GROUP BY c.name
+        ''', (student_id,)).fetchall()
+        return percentage, attendance
+    
+    # bitmaps needs NumPy, which only bitmap storage loads
+    import bitmaps
+    summary = bitmaps.student_summary(conn, student_id)
+    present = sum(row[1] for row in summary)
+    total = sum(row[3] for row in summary)
+    names = dict(conn.execute('SELECT id, name FROM classes WHERE id IN (SELECT value FROM json_each(?))',
+                              (json.dumps([row[0] for row in summary]),)).fetchall())
+    by_name = {}
+    for class_id, class_present, class_absent, class_total in summary:
+        if class_id in names:
+            counts = by_name.setdefault(names[class_id], [0, 0, 0])
+            counts[0] += class_present
+            counts[1] += class_absent
+            counts[2] += class_total
+    attendance = [{'name': name, 'present': p, 'absent': a, 'percentage': p * 100.0 / t}
+                  for name, (p, a, t) in sorted(by_name.items())]
+    return (present * 100.0 / total if total else 0), attendance
+
 # API Routes for AJAX operations
+USER_LIST_COLUMNS = 'id, username, role, name, email, department, class'
+USER_SORT_COLUMNS = {'id', 'name', 'username'}
+USER_PAGE_SIZE = 50
+USER_MAX_PAGE_SIZE = 200
+
+# Full-text search (users_fts and events_fts, kept in step by triggers).
+# Every word typed is matched as a prefix. Ranking scores every match, so
+# a query matching more than SEARCH_RANK_LIMIT users (a letter or two)
+# returns its first matches unranked instead, which stays fast however
+# many users there are.
+SEARCH_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+SEARCH_MAX_TERMS = 8
+SEARCH_RANK_LIMIT = 2000
+SEARCH_TYPES = {'all', 'users', 'events'}
+
+def search_match(text):
+    # Only letters and digits reach MATCH, so user input cannot form FTS5
+    # syntax; the tokenizer splits on everything else anyway
+    terms = re.findall(r'[^\W_]+', text)[:SEARCH_MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms) or None
+
+def search_users(conn, match, role=None, limit=SEARCH_LIMIT):
+    role_filter, params = ('AND u.role = ?', [role]) if role else ('', [])
+    candidates = conn.execute('SELECT COUNT(*) FROM (SELECT 1 FROM users_fts WHERE users_fts MATCH ? LIMIT ?)',
+                              (match, SEARCH_RANK_LIMIT + 1)).fetchone()[0]
+    ranked = candidates <= SEARCH_RANK_LIMIT
+    rows = conn.execute(f'''
+        SELECT {', '.join(f'u.{c}' for c in USER_LIST_COLUMNS.split(', '))}
+        FROM users_fts f JOIN users u ON u.id = f.rowid
+        WHERE users_fts MATCH ? {role_filter}
+        {'ORDER BY f.rank' if ranked else ''}
+        LIMIT ?
+    ''', [match] + params + [limit]).fetchall()
+    return [dict(row) for row in rows], ranked
+
+def search_events(conn, match, limit=SEARCH_LIMIT):
+    return [dict(row) for row in conn.execute('''
+        SELECT e.id, e.name, e.date, e.time, e.venue
+        FROM events_fts f JOIN events e ON e.id = f.rowid
+        WHERE events_fts MATCH ?
+        ORDER BY f.rank
+        LIMIT ?
+    ''', (match, limit))]
+
+@app.route('/api/search')
+def search():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    kind = request.args.get('type', 'all')
+    role = request.args.get('role') or None
+    limit = min(request.args.get('limit', SEARCH_LIMIT, type=int), SEARCH_MAX_LIMIT)
+    if kind not in SEARCH_TYPES or limit < 1:
+        return jsonify({'success': False, 'message': 'Invalid type or limit'})
+    
+    result = {'success': True, 'users': [], 'events': [], 'ranked': True}
+    match = search_match(request.args.get('q', ''))
+    if match is None:
+        return jsonify(result)
+    conn = get_db_connection()
+    if kind in ('all', 'users'):
+        result['users'], result['ranked'] = search_users(conn, match, role, limit)
+    if kind in ('all', 'events'):
+        result['events'] = search_events(conn, match, limit)
+    return jsonify(result)
+
+# Opaque keyset-pagination cursors: the sort key of the last row returned
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+@app.route('/api/users')
+def list_users():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    role = request.args.get('role', 'student')
+    sort = request.args.get('sort', 'id')
+    descending = request.args.get('order', 'asc') == 'desc'
+    limit = min(request.args.get('limit', USER_PAGE_SIZE, type=int), USER_MAX_PAGE_SIZE)
+    if sort not in USER_SORT_COLUMNS or limit < 1:
+        return jsonify({'success': False, 'message': 'Invalid sort or limit'})
+    
+    where = ['role = ?']
+    params = [role]
+    for column in ('class', 'department'):
+        if request.args.get(column):
+            where.append(f'{column} = ?')
+            params.append(request.args[column])
+    
+    # Keyset pagination: continue strictly after the last (sort key, id) seen,
+    # so every page is an index range scan regardless of how deep it is
+    op = '<' if descending else '>'
+    direction = 'DESC' if descending else 'ASC'
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            after = None
+        if not isinstance(after, list) or len(after) != (1 if sort == 'id' else 2):
+            return jsonify({'success': False, 'message': 'Invalid cursor'})
+        if sort == 'id':
+            where.append(f'id {op} ?')
+            params.append(after[-1])
+        else:
+            where.append(f'({sort}, id) {op} (?, ?)')
+            params.extend(after)
+    order_by = f'id {direction}' if sort == 'id' else f'{sort} {direction}, id {direction}'
+    
+    conn = get_db_connection()
+    rows = conn.execute(
+        f'SELECT {USER_LIST_COLUMNS} FROM users WHERE {" AND ".join(where)} ORDER BY {order_by} LIMIT ?',
+        params + [limit + 1]
+    ).fetchall()
+    
+    users = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = users[-1]
+        next_cursor = encode_cursor([last['id']] if sort == 'id' else [last[sort], last['id']])
+    
+    return jsonify({'success': True, 'users': users, 'next_cursor': next_cursor})
+
 @app.route('/api/add_user', methods=['POST'])
 def add_user():
     if 'user_id' not in session or session['role'] != 'admin':
@@ -350,12 +801,84 @@ def add_user():
                     (data['username'], data['password'], 'student', data['name'], 
                      data.get('email'), data.get('class')))
         conn.commit()
-        conn.close()
+        stamps.bump('users')
         return jsonify({'success': True, 'message': 'Student added successfully'})
     except sqlite3.IntegrityError:
-        conn.close()
         return jsonify({'success': False, 'message': 'Username already exists'})
 
+# Faculty permissions, newest first, a page at a time
+PERMISSION_STATUSES = ('pending', 'approved', 'rejected')
+PERMISSION_PAGE_SIZE = 50
+PERMISSION_MAX_PAGE_SIZE = 200
+
+def faculty_permissions_page(conn, faculty_id, statuses=None, date_from=None, date_to=None, after=None,
+                             limit=PERMISSION_PAGE_SIZE):
+    """Return (permissions, next_cursor) for one page of a faculty member's permissions.
+    
+    Keyset pagination on (created_at, id): ``after`` is the decoded cursor
+    of the previous page, and each page is a range scan of the
+    (faculty_id[, status], created_at) indexes.
+    """
+    where = ['p.faculty_id = ?']
+    params = [faculty_id]
+    if statuses:
+        where.append(f'p.status IN ({", ".join("?" * len(statuses))})')
+        params.extend(statuses)
+    if date_from:
+        where.append('p.date >= ?')
+        params.append(date_from)
+    if date_to:
+        where.append('p.date <= ?')
+        params.append(date_to)
+    if after:
+        where.append('(p.created_at, p.id) < (?, ?)')
+        params.extend(after)
+    
+    rows = conn.execute(f'''
+        SELECT p.id, p.student_id, p.faculty_id, p.date, p.reason, p.status, p.created_at,
+               u.name as student_name
+        FROM permissions p
+        JOIN users u ON p.student_id = u.id
+        WHERE {" AND ".join(where)}
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+    
+    permissions = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = permissions[-1]
+        next_cursor = encode_cursor([last['created_at'], last['id']])
+    return permissions, next_cursor
+
+@app.route('/api/permissions')
+def list_permissions():
+    if 'user_id' not in session or session['role'] != 'faculty':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    statuses = [s for s in request.args.get('status', '').split(',') if s]
+    limit = min(request.args.get('limit', PERMISSION_PAGE_SIZE, type=int), PERMISSION_MAX_PAGE_SIZE)
+    if any(s not in PERMISSION_STATUSES for s in statuses) or limit < 1:
+        return jsonify({'success': False, 'message': 'Invalid status or limit'})
+    try:
+        filters = report_args()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'})
+    
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            after = None
+        if not isinstance(after, list) or len(after) != 2:
+            return jsonify({'success': False, 'message': 'Invalid cursor'})
+    
+    permissions, next_cursor = faculty_permissions_page(get_db_connection(), session['user_id'], statuses,
+                                                        after=after, limit=limit, **filters)
+    return jsonify({'success': True, 'permissions': permissions, 'next_cursor': next_cursor})
+
 @app.route('/api/update_permission_status', methods=['POST'])
 def update_permission_status():
     if 'user_id' not in session or session['role'] != 'faculty':
@@ -363,10 +886,79 @@ def update_permission_status():
     
     data = request.json
     conn = get_db_connection()
-    conn.execute('UPDATE permissions SET status = ? WHERE id = ?', (data['status'], data['permission_id']))
+    updated = conn.execute('UPDATE permissions SET status = ? WHERE id = ? AND faculty_id = ?',
+                           (data['status'], data['permission_id'], session['user_id'])).rowcount
     conn.commit()
-    conn.close()
-    return jsonify({'success': True, 'message': 'Permission updated successfully'})
+    if not updated:
+        return jsonify({'success': False, 'message': 'Permission not found'})
+    
+    permission = permission_payload(conn, data['permission_id'])
+    bump_permissions([permission])
+    publish_permission(conn, 'permission_updated', permission)
+    return jsonify({'success': True, 'message': 'Permission updated successfully', 'permission': permission})
+
+# Approve or reject many requests at once. Every id is checked against the
+# calling faculty member and all changes are committed together; the
+# result for each id is one of updated, unchanged, not_found, forbidden.
+PERMISSION_BATCH_LIMIT = 500
+
+@app.route('/api/permissions/status', methods=['POST'])
+def update_permission_statuses():
+    if 'user_id' not in session or session['role'] != 'faculty':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    data = request.json
+    try:
+        status = data['status']
+        permission_ids = list(dict.fromkeys(int(i) for i in data['permission_ids']))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Expected status and a list of permission_ids'})
+    if status not in ('approved', 'rejected'):
+        return jsonify({'success': False, 'message': 'Status must be approved or rejected'})
+    if not permission_ids or len(permission_ids) > PERMISSION_BATCH_LIMIT:
+        return jsonify({'success': False, 'message': f'Send between 1 and {PERMISSION_BATCH_LIMIT} permission_ids'})
+    
+    faculty_id = session['user_id']
+    ids_json = json.dumps(permission_ids)
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        current = {row['id']: row for row in conn.execute(
+            'SELECT id, faculty_id, status FROM permissions WHERE id IN (SELECT value FROM json_each(?))',
+            (ids_json,)
+        )}
+        conn.execute('''
+            UPDATE permissions SET status = ?
+            WHERE id IN (SELECT value FROM json_each(?)) AND faculty_id = ? AND status IS NOT ?
+        ''', (status, ids_json, faculty_id, status))
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        return jsonify({'success': False, 'message': f'Error updating permissions: {str(e)}'})
+    
+    results = []
+    for permission_id in permission_ids:
+        row = current.get(permission_id)
+        if row is None:
+            result = 'not_found'
+        elif row['faculty_id'] != faculty_id:
+            result = 'forbidden'
+        elif row['status'] == status:
+            result = 'unchanged'
+        else:
+            result = 'updated'
+        results.append({'id': permission_id, 'result': result})
+    
+    updated_ids = [r['id'] for r in results if r['result'] == 'updated']
+    permissions = permission_payloads(conn, updated_ids) if updated_ids else []
+    bump_permissions(permissions)
+    publish_permissions(conn, 'permission_updated', permissions)
+    return jsonify({
+        'success': True,
+        'message': f'{status.title()} {len(updated_ids)} of {len(permission_ids)} requests',
+        'results': results,
+        'permissions': permissions
+    })
 
 @app.route('/api/add_permission', methods=['POST'])
 def add_permission():
@@ -380,68 +972,126 @@ def add_permission():
     faculty = conn.execute('SELECT id FROM users WHERE role = "faculty" LIMIT 1').fetchone()
     
     if faculty:
-        conn.execute('INSERT INTO permissions (student_id, faculty_id, date, reason, proof) VALUES (?, ?, ?, ?, ?)',
+        cursor = conn.execute('INSERT INTO permissions (student_id, faculty_id, date, reason, proof) VALUES (?, ?, ?, ?, ?)',
                     (session['user_id'], faculty['id'], data['date'], data['reason'], data.get('proof', '')))
         conn.commit()
-        conn.close()
-        return jsonify({'success': True, 'message': 'Permission request submitted successfully'})
+        permission = permission_payload(conn, cursor.lastrowid)
+        bump_permissions([permission])
+        publish_permission(conn, 'permission_created', permission)
+        return jsonify({'success': True, 'message': 'Permission request submitted successfully',
+                        'permission': permission})
     
-    conn.close()
     return jsonify({'success': False, 'message': 'No faculty found'})
 
-@app.route('/api/upload_students', methods=['POST'])
-def upload_students():
-    if 'user_id' not in session or session['role'] != 'admin':
-        return jsonify({'success': False, 'message': 'Unauthorized'})
-    
-    if 'file' not in request.files:
-        return jsonify({'success': False, 'message': 'No file uploaded'})
+# Server-Sent Events stream of the logged-in user's updates. A reconnecting
+# browser sends the id of the last message it saw (Last-Event-ID) and is
+# sent what it missed; if that is no longer available it gets a "resync"
+# with fresh counts instead.
+@app.route('/api/stream')
+def event_stream():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
     
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'success': False, 'message': 'No file selected'})
+    channels = {user_channel(session['user_id'])}
+    stream_relay.start()
+    try:
+        subscription = broker.subscribe(channels)
+    except pubsub.Busy:
+        # An empty stream: EventSource retries after the given delay
+        response = app.response_class(f"retry: {app.config['STREAM_BUSY_RETRY_SECONDS'] * 1000}\n\n",
+                                      mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    last_id = request.headers.get('Last-Event-ID')
+    missed, resync = [], None
+    if last_id:
+        missed = stream_relay.replay(get_db_connection(), channels, last_id)
+        if missed is None:
+            missed = []
+            resync = {'pending': pending_count(get_db_connection(), session['role'], session['user_id'])}
+    keepalive = app.config['STREAM_KEEPALIVE_SECONDS']
+    deadline = time.monotonic() + app.config['STREAM_MAX_SECONDS']
     
-    if file and allowed_file(file.filename):
+    def generate():
         try:
-            # Read Excel file
-            df = pd.read_excel(file)
-            required_columns = ['name', 'username', 'password', 'class']
-            
-            # Check required columns
-            for col in required_columns:
-                if col not in df.columns:
-                    return jsonify({'success': False, 'message': f'Missing required column: {col}'})
-            
-            conn = get_db_connection()
-            success_count = 0
-            error_count = 0
-            
-            for _, row in df.iterrows():
+            yield b'retry: 3000\n\n'
+            if resync is not None:
+                yield pubsub.format_sse('resync', resync)
+            # Every later message is on the subscription's queue
+            last_seq = subscription.since
+            for message in missed:
+                last_seq = max(last_seq, message.seq)
+                yield pubsub.format_sse(message.event, message.data, broker.message_id(message.seq))
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Time to reconnect; the browser resumes after last_seq
+                    yield pubsub.format_sse(None, None, broker.message_id(last_seq))
+                    return
                 try:
-                    conn.execute(
-                        'INSERT INTO users (username, password, role, name, email, class) VALUES (?, ?, ?, ?, ?, ?)',
-                        (row['username'], row['password'], 'student', row['name'], 
-                         row.get('email', ''), row['class'])
-                    )
-                    success_count += 1
-                except sqlite3.IntegrityError:
-                    error_count += 1
-            
-            conn.commit()
-            conn.close()
-            
-            return jsonify({
-                'success': True, 
-                'message': f'Successfully added {success_count} students. {error_count} failed due to duplicate usernames.'
-            })
-            
-        except Exception as e:
-            return jsonify({'success': False, 'message': f'Error processing file: {str(e)}'})
+                    message = subscription.get(timeout=min(keepalive, remaining))
+                except pubsub.Dropped:
+                    # Fell behind; the browser reconnects and catches up
+                    return
+                if message is None:
+                    yield b': keepalive\n\n'
+                elif message.seq > last_seq:
+                    last_seq = message.seq
+                    yield pubsub.format_sse(message.event, message.data, broker.message_id(message.seq))
+        finally:
+            subscription.close()
     
-    return jsonify({'success': False, 'message': 'Invalid file type'})
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    # The generator's finally never runs if the client leaves before the
+    # first chunk
+    response.call_on_close(subscription.close)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
-@app.route('/api/upload_faculty', methods=['POST'])
-def upload_faculty():
+def get_import_runner():
+    runner = app.extensions.get('import_runner')
+    if runner is None:
+        # Jobs bump the cache versions of users and classes with every
+        # chunk they commit (see jobs.CACHE_ENTITIES)
+        runner = jobs.ImportJobRunner(app.config['DATABASE'], workers=app.config['IMPORT_WORKERS'],
+                                      check_seconds=app.config['IMPORT_JOB_CHECK_SECONDS'])
+        app.extensions['import_runner'] = runner
+    return runner
+
+# Pick up imports whose process went away (the server stopped, or a
+# worker died), now and every IMPORT_JOB_CHECK_SECONDS
+def resume_import_jobs():
+    get_import_runner().start()
+
+# Graceful shutdown of a server process. Open event streams never finish
+# on their own, so they are ended first (close_streams, as soon as the
+# shutdown starts); browsers reconnect to another worker and catch up
+# from the shared message ids. Import jobs still running are resumed by
+# another process once this one is gone (resume_import_jobs).
+def close_streams():
+    broker.close()
+
+def shutdown():
+    close_streams()
+    stream_relay.stop()
+    shared_metrics.stop()
+    snapshots = app.extensions.pop('replica', None)
+    if snapshots is not None:
+        snapshots.stop()
+    registration_queue = app.extensions.pop('registration_queue', None)
+    if registration_queue is not None:
+        registration_queue.stop()
+    runner = app.extensions.pop('import_runner', None)
+    if runner is not None:
+        runner.shutdown(wait=False)
+    pool = app.extensions.pop('db_pool', None)
+    if pool is not None:
+        pool.close()
+
+# Uploads are spooled to disk and imported by a background job; the caller
+# polls /api/jobs/<id> for progress
+def import_upload(kind):
     if 'user_id' not in session or session['role'] != 'admin':
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
@@ -453,42 +1103,43 @@ def upload_faculty():
         return jsonify({'success': False, 'message': 'No file selected'})
     
     if file and allowed_file(file.filename):
-        try:
-            df = pd.read_excel(file)
-            required_columns = ['name', 'username', 'password', 'department']
-            
-            for col in required_columns:
-                if col not in df.columns:
-                    return jsonify({'success': False, 'message': f'Missing required column: {col}'})
-            
-            conn = get_db_connection()
-            success_count = 0
-            error_count = 0
-            
-            for _, row in df.iterrows():
-                try:
-                    conn.execute(
-                        'INSERT INTO users (username, password, role, name, email, department) VALUES (?, ?, ?, ?, ?, ?)',
-                        (row['username'], row['password'], 'faculty', row['name'], 
-                         row.get('email', ''), row['department'])
-                    )
-                    success_count += 1
-                except sqlite3.IntegrityError:
-                    error_count += 1
-            
-            conn.commit()
-            conn.close()
-            
-            return jsonify({
-                'success': True, 
-                'message': f'Successfully added {success_count} faculty. {error_count} failed due to duplicate usernames.'
-            })
-            
-        except Exception as e:
-            return jsonify({'success': False, 'message': f'Error processing file: {str(e)}'})
+        filename = secure_filename(file.filename) or f"upload.{file.filename.rsplit('.', 1)[1].lower()}"
+        upload_folder = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        os.makedirs(upload_folder, exist_ok=True)
+        path = os.path.join(upload_folder, f'{os.urandom(8).hex()}-{filename}')
+        file.save(path)
+        
+        conn = get_db_connection()
+        job_id = jobs.create_import_job(conn, path, filename, kind, app.config['IMPORT_CHUNK_SIZE'],
+                                        created_by=session['user_id'])
+        get_import_runner().submit(job_id)
+        
+        return jsonify({'success': True, 'message': 'Import started', 'job_id': job_id})
     
     return jsonify({'success': False, 'message': 'Invalid file type'})
 
+@app.route('/api/upload_students', methods=['POST'])
+def upload_students():
+    return import_upload('student')
+
+@app.route('/api/upload_faculty', methods=['POST'])
+def upload_faculty():
+    return import_upload('faculty')
+
+@app.route('/api/upload_enrollments', methods=['POST'])
+def upload_enrollments():
+    return import_upload('enrollment')
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    job = jobs.get_job(get_db_connection(), job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
 @app.route('/api/add_faculty', methods=['POST'])
 def add_faculty():
     if 'user_id' not in session or session['role'] != 'admin':
@@ -504,10 +1155,9 @@ def add_faculty():
              data.get('email'), data.get('department'))
         )
         conn.commit()
-        conn.close()
+        stamps.bump('users')
         return jsonify({'success': True, 'message': 'Faculty added successfully'})
     except sqlite3.IntegrityError:
-        conn.close()
         return jsonify({'success': False, 'message': 'Username already exists'})
 
 @app.route('/api/delete_user/<int:user_id>', methods=['DELETE'])
@@ -517,26 +1167,25 @@ def delete_user(user_id):
     
     conn = get_db_connection()
     try:
+        conn.execute('DELETE FROM class_enrollments WHERE student_id = ?', (user_id,))
         conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
         conn.commit()
-        conn.close()
+        stamps.bump('users', 'classes')
         return jsonify({'success': True, 'message': 'User deleted successfully'})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'message': f'Error deleting user: {str(e)}'})
 
 @app.route('/api/get_clubs_events')
 def get_clubs_events():
-    conn = get_db_connection()
-    clubs_events = conn.execute('SELECT * FROM clubs_events WHERE is_active = 1').fetchall()
-    conn.close()
-    
-    clubs = [{'id': ce['id'], 'name': ce['name'], 'type': ce['type']} 
-             for ce in clubs_events if ce['type'] == 'club']
-    events = [{'id': ce['id'], 'name': ce['name'], 'type': ce['type']} 
-              for ce in clubs_events if ce['type'] == 'event']
+    catalog = get_catalog()
     
-    return jsonify({'clubs': clubs, 'events': events})
+    # Clients revalidate with If-None-Match / If-Modified-Since and get a
+    # 304 while their copy is current
+    response = app.response_class(catalog.body, mimetype='application/json')
+    response.set_etag(catalog.etag)
+    response.last_modified = catalog.last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route('/api/add_club_event', methods=['POST'])
 def add_club_event():
@@ -552,12 +1201,384 @@ def add_club_event():
             (data['name'], data['type'])
         )
         conn.commit()
-        conn.close()
+        catalog_cache.invalidate()
+        stamps.bump('catalog')
         return jsonify({'success': True, 'message': f'{data["type"].title()} added successfully'})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+@app.route('/api/add_event', methods=['POST'])
+def add_event():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    data = request.json
+    capacity = data.get('capacity')
+    try:
+        event_date = date.fromisoformat(data['date']).isoformat()
+        capacity = int(capacity) if capacity not in (None, '') else None
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Date must be YYYY-MM-DD and capacity a number'})
+    if capacity is not None and capacity < 0:
+        return jsonify({'success': False, 'message': 'Capacity cannot be negative'})
+    
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            'INSERT INTO events (name, date, time, venue, description, capacity) VALUES (?, ?, ?, ?, ?, ?)',
+            (data['name'], event_date, data.get('time'), data.get('venue'), data.get('description'), capacity)
+        )
+        conn.commit()
+        stamps.bump('events')
+        return jsonify({'success': True, 'message': 'Event added successfully', 'event_id': cursor.lastrowid})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@app.route('/api/events')
+def list_events():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    # Upcoming events with their head counts and the student's own status
+    conn = get_db_connection()
+    events = conn.execute('''
+        SELECT e.id, e.name, e.date, e.time, e.venue, e.capacity,
+            (SELECT COUNT(*) FROM student_events r WHERE r.event_id = e.id AND r.status = 'registered') as registered,
+            (SELECT COUNT(*) FROM student_events r WHERE r.event_id = e.id AND r.status = 'waitlisted') as waitlisted,
+            (SELECT status FROM student_events r WHERE r.event_id = e.id AND r.student_id = ?) as status
+        FROM events e
+        WHERE e.date >= ?
+        ORDER BY e.date, e.id
+    ''', (session['user_id'], date.today().isoformat())).fetchall()
+    return jsonify({'success': True, 'events': [dict(event) for event in events]})
+
+REGISTRATION_MESSAGES = {
+    registrations.REGISTERED: 'You are registered for this event',
+    registrations.WAITLISTED: 'The event is full; you are number {position} on the waitlist',
+    registrations.ALREADY_REGISTERED: 'You are already registered for this event',
+    registrations.ALREADY_WAITLISTED: 'You are already on the waitlist for this event',
+    registrations.CANCELLED: 'Your registration was cancelled',
+    registrations.NOT_REGISTERED: 'You are not registered for this event',
+    registrations.NO_EVENT: 'Event not found',
+    registrations.CLOSED: 'Registration for this event has closed',
+}
+
+def get_registration_queue():
+    registration_queue = app.extensions.get('registration_queue')
+    if registration_queue is None:
+        registration_queue = registrations.RegistrationQueue(
+            lambda: database.connect(app.config['DATABASE'], pragmas=app.config['DB_PRAGMAS']),
+            batch_size=app.config['REGISTRATION_BATCH_SIZE'])
+        app.extensions['registration_queue'] = registration_queue
+    return registration_queue
+
+def change_registration(op, event_id):
+    if 'user_id' not in session or session['role'] != 'student':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    request_args = (op, session['user_id'], event_id)
+    try:
+        if app.config['REGISTRATION_QUEUE']:
+            result = get_registration_queue().submit(*request_args).result(
+                timeout=app.config['REGISTRATION_TIMEOUT_SECONDS'])
+        else:
+            result = registrations.apply(get_db_connection(), [request_args])[0]
+    except concurrent.futures.TimeoutError:
+        return jsonify({'success': False, 'message': 'Registration is busy; please check your dashboard shortly'})
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+    
+    return jsonify({'success': result['result'] in (registrations.REGISTERED, registrations.WAITLISTED,
+                                                    registrations.CANCELLED),
+                    'message': REGISTRATION_MESSAGES[result['result']].format(**result),
+                    'status': result['result'], 'position': result.get('position')})
+
+@app.route('/api/events/<int:event_id>/register', methods=['POST'])
+def register_for_event(event_id):
+    return change_registration(registrations.REGISTER, event_id)
+
+@app.route('/api/events/<int:event_id>/cancel', methods=['POST'])
+def cancel_registration(event_id):
+    return change_registration(registrations.CANCEL, event_id)
+
+ATTENDANCE_STATUSES = {'present', 'absent'}
+
+def faculty_owns_class(conn, class_id, faculty_id):
+    return conn.execute('SELECT 1 FROM classes WHERE id = ? AND faculty_id = ?',
+                        (class_id, faculty_id)).fetchone() is not None
+
+@app.route('/api/attendance/roster')
+def attendance_roster():
+    if 'user_id' not in session or session['role'] != 'faculty':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    class_id = request.args.get('class_id', type=int)
+    session_date = request.args.get('date', date.today().isoformat())
+    conn = get_db_connection()
+    if not faculty_owns_class(conn, class_id, session['user_id']):
+        return jsonify({'success': False, 'message': 'Class not found'})
+    
+    # Students enrolled in the class, with their mark for the requested
+    # date (if any)
+    if app.config['ATTENDANCE_STORAGE'] == 'bitmap':
+        import bitmaps
+        marks = bitmaps.session_marks(conn, class_id, session_date)
+        students = [dict(s, status=marks.get(s['id'])) for s in conn.execute('''
+            SELECT u.id, u.name, u.username
+            FROM class_enrollments e
+            JOIN users u ON u.id = e.student_id
+            WHERE e.class_id = ?
+            ORDER BY u.name
+        ''', (class_id,))]
+    else:
+        students = [dict(s) for s in conn.execute('''
+            SELECT u.id, u.name, u.username, a.status
+            FROM class_enrollments e
+            JOIN users u ON u.id = e.student_id
+            LEFT JOIN attendance a ON a.student_id = u.id AND a.class_id = ? AND a.date = ?
+            WHERE e.class_id = ?
+            ORDER BY u.name
+        ''', (class_id, session_date, class_id))]
+    
+    return jsonify({'success': True, 'date': session_date, 'students': students})
+
+@app.route('/api/attendance', methods=['POST'])
+def mark_attendance():
+    if 'user_id' not in session or session['role'] != 'faculty':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    data = request.json
+    try:
+        class_id = int(data['class_id'])
+        session_date = date.fromisoformat(data['date']).isoformat()
+        records = {int(r['student_id']): r['status'] for r in data['records']}
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Expected class_id, date and a list of records'})
+    if any(status not in ATTENDANCE_STATUSES for status in records.values()):
+        return jsonify({'success': False, 'message': 'Status must be present or absent'})
+    
+    conn = get_db_connection()
+    if not faculty_owns_class(conn, class_id, session['user_id']):
+        return jsonify({'success': False, 'message': 'Class not found'})
+    not_enrolled = [row[0] for row in conn.execute('''
+        SELECT value FROM json_each(?)
+        WHERE value NOT IN (SELECT student_id FROM class_enrollments WHERE class_id = ?)
+    ''', (json.dumps(list(records)), class_id))]
+    if not_enrolled:
+        return jsonify({'success': False, 'message': 'Students not enrolled in this class',
+                        'student_ids': not_enrolled})
+    
+    # The whole roster is written in one transaction. Re-submitting a
+    # session replaces it: marks are upserted and students no longer on
+    # the roster are removed. attendance_summary follows via triggers.
+    # With bitmap storage the session is a single row.
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        if app.config['ATTENDANCE_STORAGE'] == 'bitmap':
+            import bitmaps
+            removed = bitmaps.write_session(conn, class_id, session_date, records)
+        else:
+            conn.executemany('''
+                INSERT INTO attendance (student_id, class_id, date, status) VALUES (?, ?, ?, ?)
+                ON CONFLICT (student_id, class_id, date) DO UPDATE SET status = excluded.status
+                WHERE status IS NOT excluded.status
+            ''', [(student_id, class_id, session_date, status) for student_id, status in records.items()])
+            removed = [row[0] for row in conn.execute(
+                'DELETE FROM attendance WHERE class_id = ? AND date = ? '
+                'AND student_id NOT IN (SELECT value FROM json_each(?)) RETURNING student_id',
+                (class_id, session_date, json.dumps(list(records)))
+            )]
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        return jsonify({'success': False, 'message': f'Error saving attendance: {str(e)}'})
+    stamps.bump(*(f'attendance:{student_id}' for student_id in [*records, *removed]))
+    
+    present = sum(1 for status in records.values() if status == 'present')
+    return jsonify({
+        'success': True,
+        'message': f'Attendance saved: {present} present, {len(records) - present} absent',
+        'present': present,
+        'absent': len(records) - present,
+        'removed': len(removed)
+    })
+
+@app.route('/api/enrollments', methods=['POST', 'DELETE'])
+def manage_enrollments():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    data = request.json or {}
+    try:
+        class_id = int(data['class_id'])
+        usernames = [str(u).strip() for u in data.get('usernames', [])]
+        student_ids = [int(s) for s in data.get('student_ids', [])]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Expected class_id and a list of usernames or student_ids'})
+    
+    conn = get_db_connection()
+    if conn.execute('SELECT 1 FROM classes WHERE id = ?', (class_id,)).fetchone() is None:
+        return jsonify({'success': False, 'message': 'Class not found'})
+    
+    # Resolve both kinds of reference in one query
+    students = conn.execute('''
+        SELECT id, username FROM users
+        WHERE role = 'student'
+        AND (username IN (SELECT value FROM json_each(?)) OR id IN (SELECT value FROM json_each(?)))
+    ''', (json.dumps(usernames), json.dumps(student_ids))).fetchall()
+    found_usernames = {s['username'] for s in students}
+    found_ids = {s['id'] for s in students}
+    unknown = ([u for u in usernames if u not in found_usernames] +
+               [s for s in student_ids if s not in found_ids])
+    pairs = [(class_id, s['id']) for s in students]
+    
+    try:
+        if request.method == 'DELETE':
+            cursor = conn.executemany('DELETE FROM class_enrollments WHERE class_id = ? AND student_id = ?', pairs)
+        else:
+            cursor = conn.executemany('INSERT INTO class_enrollments (class_id, student_id) VALUES (?, ?) '
+                                      'ON CONFLICT DO NOTHING', pairs)
+        changed = cursor.rowcount
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        return jsonify({'success': False, 'message': f'Error updating enrollments: {str(e)}'})
+    if changed:
+        stamps.bump('classes')
+    
+    action = 'Unenrolled' if request.method == 'DELETE' else 'Enrolled'
+    return jsonify({
+        'success': True,
+        'message': f'{action} {changed} students. {len(unknown)} not found.',
+        'changed': changed,
+        'unknown': unknown
+    })
+
+# Report exports. Admins may export everything; faculty only their own
+# classes and the permission requests addressed to them.
+REPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+def report_args():
+    args = {}
+    for key in ('date_from', 'date_to'):
+        if request.args.get(key):
+            args[key] = date.fromisoformat(request.args[key]).isoformat()
+    return args
+
+def stream_report(name, build, filters, columns, fmt):
+    pool = get_db_pool()
+    
+    # The export runs on its own connection for as long as the client
+    # keeps reading, independent of the request's g.db: one to the report
+    # snapshot if it is fresh enough, a pooled one otherwise. Archived
+    # terms in the requested range are attached one after another, then
+    # the live tables are read.
+    route = request.endpoint
+    snapshot_conn, taken_at = report_connection()
+    
+    def generate():
+        conn = snapshot_conn or pool.acquire()
+        queries = archive.queries(conn, lambda schema: build(schema=schema, **filters),
+                                  filters.get('date_from'), filters.get('date_to'))
+        try:
+            # The body is produced after the request has ended, so tag
+            # its queries with the route explicitly
+            with metrics.tagged(route):
+                if fmt == 'xlsx':
+                    # Sent only once the whole workbook is built (see
+                    # reports.write_xlsx); CSV is sent as it is read
+                    path = reports.write_xlsx(conn, queries, columns, name.title(), summary=name)
+                    yield from reports.iter_file(path)
+                else:
+                    yield from reports.iter_csv(conn, queries, columns)
+        finally:
+            queries.close()
+            if snapshot_conn is not None:
+                snapshot_conn.close()
+            else:
+                pool.release(conn)
+    
+    filename = f'{name}-{date.today().isoformat()}.{fmt}'
+    response = app.response_class(generate(), mimetype=REPORT_FORMATS[fmt])
+    if snapshot_conn is not None:
+        # The generator's finally never runs if the client leaves before
+        # the first chunk; closing twice is harmless
+        response.call_on_close(snapshot_conn.close)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if taken_at is not None:
+        response.headers['X-Snapshot-Time'] = datetime.fromtimestamp(taken_at).isoformat(timespec='seconds')
+    return response
+
+@app.route('/api/reports/attendance')
+def attendance_report():
+    if 'user_id' not in session or session['role'] not in ('admin', 'faculty'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    faculty_id = session['user_id'] if session['role'] == 'faculty' else None
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in REPORT_FORMATS:
+        return jsonify({'success': False, 'message': 'Format must be csv or xlsx'})
+    try:
+        args = report_args()
+        class_id = request.args.get('class_id', type=int)
+        student_id = request.args.get('student_id', type=int)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'})
+    
+    filters = dict(args, class_id=class_id, student_id=student_id, faculty_id=faculty_id)
+    build = reports.attendance_query
+    if app.config['ATTENDANCE_STORAGE'] == 'bitmap':
+        # Live sessions are read through the attendance_marks view;
+        # archived terms are still rows
+        build = lambda schema, **filters: reports.attendance_query(
+            schema, table='attendance_marks' if schema == 'main' else 'attendance', **filters)
+    return stream_report('attendance', build, filters, reports.ATTENDANCE_COLUMNS, fmt)
+
+@app.route('/api/reports/permissions')
+def permissions_report():
+    if 'user_id' not in session or session['role'] not in ('admin', 'faculty'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    faculty_id = session['user_id'] if session['role'] == 'faculty' else None
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in REPORT_FORMATS:
+        return jsonify({'success': False, 'message': 'Format must be csv or xlsx'})
+    try:
+        args = report_args()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'})
+    
+    filters = dict(args, status=request.args.get('status'), faculty_id=faculty_id)
+    return stream_report('permissions', reports.permissions_query, filters, reports.PERMISSION_COLUMNS, fmt)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    token = app.config['METRICS_TOKEN']
+    if session.get('role') != 'admin' and not (
+            token and hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                         f'Bearer {token}'.encode())):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    return app.response_class(shared_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/slow_queries')
+def slow_queries():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    return jsonify({'success': True, 'threshold_ms': app.config['SLOW_QUERY_SECONDS'] * 1000,
+                    'queries': shared_metrics.recent_slow_queries()})
+
+@app.route('/api/db_pool_stats')
+def db_pool_stats():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    return jsonify({'success': True, 'pool': get_db_pool().stats()})
+
 @app.route('/api/change_password', methods=['POST'])
 def change_password():
     if 'user_id' not in session:
@@ -570,22 +1591,21 @@ def change_password():
     user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
     
     if not user or user['password'] != data['current_password']:
-        conn.close()
         return jsonify({'success': False, 'message': 'Current password is incorrect'})
     
     if data['new_password'] != data['confirm_password']:
-        conn.close()
         return jsonify({'success': False, 'message': 'New passwords do not match'})
     
     try:
         conn.execute('UPDATE users SET password = ? WHERE id = ?', (data['new_password'], user_id))
         conn.commit()
-        conn.close()
         return jsonify({'success': True, 'message': 'Password changed successfully'})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'message': f'Error changing password: {str(e)}'})
 
 if __name__ == '__main__':
-    init_db()
+    create_app()
+    # With the reloader on, only the child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        resume_import_jobs()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,234 @@
+import os
+import re
+import sqlite3
+from datetime import date
+
+import database
+
+# Archives are attached one at a time under this schema name
+ARCHIVE_SCHEMA = 'archive'
+DEFAULT_ARCHIVE_DIR = 'archives'
+
+TERM_NAME = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+ARCHIVE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS archive.attendance (
+        id INTEGER PRIMARY KEY,
+        student_id INTEGER,
+        class_id INTEGER,
+        date DATE NOT NULL,
+        status TEXT NOT NULL
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS archive.idx_attendance_class_date ON attendance (class_id, date)',
+    """
+    CREATE TABLE IF NOT EXISTS archive.permissions (
+        id INTEGER PRIMARY KEY,
+        student_id INTEGER,
+        faculty_id INTEGER,
+        date DATE NOT NULL,
+        reason TEXT NOT NULL,
+        proof TEXT,
+        status TEXT,
+        created_at TIMESTAMP
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS archive.idx_permissions_faculty_status ON permissions (faculty_id, status)',
+]
+
+
+def _main_dir(conn):
+    for _, name, path in conn.execute('PRAGMA database_list').fetchall():
+        if name == 'main':
+            return os.path.dirname(path) if path else os.getcwd()
+    return os.getcwd()
+
+
+def _archive_path(conn, path):
+    # Stored relative to the live database, so the pair can be moved together
+    return path if os.path.isabs(path) else os.path.join(_main_dir(conn), path)
+
+
+def terms(conn, date_from=None, date_to=None):
+    """Archived terms overlapping [date_from, date_to], oldest first."""
+    return conn.execute('''
+        SELECT * FROM archive_terms
+        WHERE (? IS NULL OR date_to >= ?) AND (? IS NULL OR date_from <= ?)
+        ORDER BY date_from
+    ''', (date_from, date_from, date_to, date_to)).fetchall()
+
+
+def sources(conn, date_from=None, date_to=None):
+    """Yield the schema to read for every database that may hold rows in the range.
+
+    Each archive whose term overlaps the range is attached while the
+    caller consumes its schema and detached before the next one, then the
+    live database ('main') comes last. A range that only covers open terms
+    attaches nothing.
+    """
+    for term in terms(conn, date_from, date_to):
+        path = _archive_path(conn, term['path'])
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Archive for term {term['term']} is missing: {path}")
+        conn.execute('ATTACH DATABASE ? AS ' + ARCHIVE_SCHEMA, (path,))
+        try:
+            yield ARCHIVE_SCHEMA
+        finally:
+            conn.execute('DETACH DATABASE ' + ARCHIVE_SCHEMA)
+    yield 'main'
+
+
+def queries(conn, build, date_from=None, date_to=None):
+    """Yield ``build(schema)`` -> (sql, params) for each source of the range."""
+    for schema in sources(conn, date_from, date_to):
+        yield build(schema)
+
+
+# Live bitmap sessions of the term whose every mark is in the archive
+ARCHIVED_SESSIONS = '''
+    SELECT s.class_id, s.date FROM main.attendance_sessions s
+    WHERE s.date BETWEEN ? AND ? AND NOT EXISTS (
+        SELECT 1 FROM main.attendance_marks m
+        WHERE m.class_id = s.class_id AND m.date = s.date AND NOT EXISTS (
+            SELECT 1 FROM archive.attendance a
+            WHERE a.class_id = m.class_id AND a.date = m.date AND a.student_id = m.student_id
+                AND a.status = m.status
+        )
+    )
+'''
+
+
+def archive_term(conn, term, date_from, date_to, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """Move a closed term's attendance and settled permissions into its own file.
+
+    Rows are first copied into the archive and committed, then deleted from
+    the live tables only if they are present in the archive. Running it
+    again for the same term is safe and picks up rows recorded late.
+    Attendance kept as bitmap sessions (see bitmaps.py) is archived as
+    rows too; those have no live id, so they are numbered down from -1.
+    Returns (attendance_moved, permissions_moved), counting marks.
+    """
+    if not TERM_NAME.match(term):
+        raise ValueError('Term names may only contain letters, digits, ".", "_" and "-"')
+    date_from = date.fromisoformat(date_from).isoformat()
+    date_to = date.fromisoformat(date_to).isoformat()
+    if date_from > date_to:
+        raise ValueError('date_from must not be after date_to')
+
+    existing = conn.execute('SELECT * FROM archive_terms WHERE term = ?', (term,)).fetchone()
+    if existing and (existing['date_from'], existing['date_to']) != (date_from, date_to):
+        raise ValueError(f'Term {term} was archived for {existing["date_from"]}..{existing["date_to"]}')
+    if any(t['term'] != term for t in terms(conn, date_from, date_to)):
+        raise ValueError('Date range overlaps another archived term')
+
+    path = existing['path'] if existing else os.path.join(archive_dir, f'{term}.db')
+    full_path = _archive_path(conn, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+    conn.commit()
+    conn.execute('ATTACH DATABASE ? AS ' + ARCHIVE_SCHEMA, (full_path,))
+    try:
+        # Step 1: copy. With WAL a transaction spanning two files is not
+        # atomic as a whole, so the archive is committed on its own first.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for statement in ARCHIVE_TABLES:
+                conn.execute(statement)
+            conn.execute('''
+                INSERT OR IGNORE INTO archive.attendance (id, student_id, class_id, date, status)
+                SELECT id, student_id, class_id, date, status FROM main.attendance
+                WHERE date BETWEEN ? AND ?
+            ''', (date_from, date_to))
+            conn.execute('''
+                INSERT INTO archive.attendance (id, student_id, class_id, date, status)
+                SELECT (SELECT MIN(COALESCE(MIN(id), 0), 0) FROM archive.attendance)
+                           - ROW_NUMBER() OVER (ORDER BY m.class_id, m.date, m.student_id),
+                       m.student_id, m.class_id, m.date, m.status
+                FROM main.attendance_marks m
+                WHERE m.date BETWEEN ? AND ? AND NOT EXISTS (
+                    SELECT 1 FROM archive.attendance a
+                    WHERE a.class_id = m.class_id AND a.date = m.date AND a.student_id = m.student_id
+                )
+            ''', (date_from, date_to))
+            # Pending requests still need a decision, so they stay live
+            conn.execute('''
+                INSERT OR IGNORE INTO archive.permissions
+                    (id, student_id, faculty_id, date, reason, proof, status, created_at)
+                SELECT id, student_id, faculty_id, date, reason, proof, status, created_at
+                FROM main.permissions
+                WHERE date BETWEEN ? AND ? AND status != 'pending'
+            ''', (date_from, date_to))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        # Step 2: drop what the archive now holds and record the term
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            attendance_moved = conn.execute('''
+                DELETE FROM main.attendance
+                WHERE date BETWEEN ? AND ? AND id IN (SELECT id FROM archive.attendance)
+            ''', (date_from, date_to)).rowcount
+            attendance_moved += conn.execute(f'''
+                SELECT COUNT(*) FROM main.attendance_marks
+                WHERE (class_id, date) IN ({ARCHIVED_SESSIONS})
+            ''', (date_from, date_to)).fetchone()[0]
+            conn.execute(f'''
+                DELETE FROM main.attendance_sessions
+                WHERE (class_id, date) IN ({ARCHIVED_SESSIONS})
+            ''', (date_from, date_to))
+            permissions_moved = conn.execute('''
+                DELETE FROM main.permissions
+                WHERE date BETWEEN ? AND ? AND id IN (SELECT id FROM archive.permissions)
+            ''', (date_from, date_to)).rowcount
+            conn.execute('''
+                INSERT INTO archive_terms (term, path, date_from, date_to, attendance_rows, permission_rows)
+                VALUES (?, ?, ?, ?, (SELECT COUNT(*) FROM archive.attendance),
+                        (SELECT COUNT(*) FROM archive.permissions))
+                ON CONFLICT (term) DO UPDATE SET
+                    attendance_rows = excluded.attendance_rows,
+                    permission_rows = excluded.permission_rows,
+                    archived_at = CURRENT_TIMESTAMP
+            ''', (term, path, date_from, date_to))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute('DETACH DATABASE ' + ARCHIVE_SCHEMA)
+    return attendance_moved, permissions_moved
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Move closed terms out of the live college portal database')
+    parser.add_argument('command', choices=['archive', 'list'])
+    parser.add_argument('--db', default='college_portal.db', help='path to the SQLite database')
+    parser.add_argument('--term', help='name of the term, e.g. 2025-odd')
+    parser.add_argument('--from', dest='date_from', help='first day of the term (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='date_to', help='last day of the term (YYYY-MM-DD)')
+    parser.add_argument('--dir', default=DEFAULT_ARCHIVE_DIR,
+                        help='directory for archive files, relative to the database')
+    parser.add_argument('--vacuum', action='store_true', help='compact the live database afterwards')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+    database.migrate(conn)
+    if args.command == 'archive':
+        if not (args.term and args.date_from and args.date_to):
+            parser.error('archive needs --term, --from and --to')
+        attendance_moved, permissions_moved = archive_term(conn, args.term, args.date_from, args.date_to,
+                                                           args.dir)
+        print(f'Archived {args.term}: {attendance_moved} attendance rows, {permissions_moved} permissions')
+        if args.vacuum:
+            conn.execute('VACUUM')
+            print('Live database compacted')
+    elif args.command == 'list':
+        for term in terms(conn):
+            print(f"{term['term']:<16} {term['date_from']}..{term['date_to']}  "
+                  f"{term['attendance_rows']:>8} attendance  {term['permission_rows']:>6} permissions  {term['path']}")
+    conn.close()
@@ -0,0 +1,283 @@
+"""Static asset pipeline.
+
+    python assets.py build [--static static] [--clean]
+
+minifies the CSS and JavaScript under static/, writes every file to
+static/dist/ under a content-hashed name (css/style.3f9c1e2a7b.css)
+together with .gz and, if the brotli package is installed, .br copies,
+and records the names in static/dist/manifest.json. The app links to
+those names through asset_url() and serves them with far-future,
+immutable cache headers. Run it again whenever a static file changes.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 10
+# Files smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+COMPRESSIBLE = {'.css', '.js', '.json', '.svg', '.txt', '.html', '.map'}
+
+# Content-Encoding -> suffix of the precompressed copy, in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+# CSS: comments and quoted strings are matched first so that nothing
+# inside a string is touched
+_CSS_TOKENS = re.compile(r'(/\*.*?\*/|"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', re.S)
+
+
+def minify_css(source):
+    parts, code = [], []
+    for i, part in enumerate(_CSS_TOKENS.split(source)):
+        if i % 2 == 0:
+            code.append(part)
+        elif not part.startswith('/*'):
+            parts.append(_squeeze_css(''.join(code)))
+            parts.append(part)
+            code = []
+    parts.append(_squeeze_css(''.join(code)))
+    return ''.join(parts).replace(';}', '}').strip() + '\n'
+
+
+def _squeeze_css(code):
+    code = re.sub(r'\s+', ' ', code)
+    code = re.sub(r'\s*([{};,>])\s*', r'\1', code)
+    return re.sub(r':\s+', ':', code)
+
+
+# Characters after which a "/" starts a regular expression, not a division
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = ('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'void', 'throw', 'delete', 'new')
+
+
+def minify_js(source):
+    """Strip comments, indentation and blank lines from JavaScript.
+
+    Deliberately conservative: strings, template literals and regular
+    expressions are copied as they are, and line breaks are kept so that
+    automatic semicolon insertion works out exactly as before.
+    """
+    out = []
+    code = []
+    i, n = 0, len(source)
+
+    def verbatim(end):
+        out.append(_squeeze_js(''.join(code)))
+        code.clear()
+        out.append(source[i:end])
+        return end
+
+    while i < n:
+        c = source[i]
+        if c in '"\'':
+            i = verbatim(_skip_string(source, i))
+        elif c == '`':
+            i = verbatim(_skip_template(source, i))
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end == -1 else end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            code.append(' ')
+        elif c == '/' and _starts_regex(''.join(out[-4:]) + ''.join(code[-16:])):
+            i = verbatim(_skip_regex(source, i))
+        else:
+            code.append(c)
+            i += 1
+    out.append(_squeeze_js(''.join(code)))
+    return ''.join(out).strip() + '\n'
+
+
+def _squeeze_js(code):
+    # Drop indentation and blank lines and collapse runs of spaces
+    code = re.sub(r'[ \t]*\n\s*', '\n', code)
+    return re.sub(r'[ \t]{2,}', ' ', code)
+
+
+def _starts_regex(before):
+    before = before.rstrip()
+    if not before:
+        return True
+    if before[-1] in _REGEX_PRECEDERS:
+        return True
+    word = re.search(r'[A-Za-z_$][\w$]*$', before)
+    return bool(word) and word.group() in _REGEX_KEYWORDS
+
+
+def _skip_string(source, i):
+    quote, i = source[i], i + 1
+    while i < len(source):
+        if source[i] == '\\':
+            i += 2
+        elif source[i] == quote or source[i] == '\n':
+            return i + 1
+        else:
+            i += 1
+    return i
+
+
+def _skip_template(source, i):
+    i += 1
+    while i < len(source):
+        c = source[i]
+        if c == '\\':
+            i += 2
+        elif c == '`':
+            return i + 1
+        elif source.startswith('${', i):
+            i = _skip_braces(source, i + 2)
+        else:
+            i += 1
+    return i
+
+
+def _skip_braces(source, i):
+    # Skip the expression of a ${...} placeholder, which may itself hold
+    # strings, templates and braces
+    depth = 1
+    while i < len(source):
+        c = source[i]
+        if c in '"\'':
+            i = _skip_string(source, i)
+        elif c == '`':
+            i = _skip_template(source, i)
+        elif c == '{':
+            depth += 1
+            i += 1
+        elif c == '}':
+            depth -= 1
+            i += 1
+            if depth == 0:
+                return i
+        else:
+            i += 1
+    return i
+
+
+def _skip_regex(source, i):
+    i += 1
+    in_class = False
+    while i < len(source):
+        c = source[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            i += 1
+            while i < len(source) and (source[i].isalnum() or source[i] == '_'):
+                i += 1
+            return i
+        elif c == '\n':
+            return i
+        i += 1
+    return i
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def fingerprinted(name, data):
+    root, ext = os.path.splitext(name)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}'
+
+
+def _compressors():
+    compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        compressors.append(('.br', lambda data: brotli.compress(data, quality=11)))
+    return compressors
+
+
+def build(static_dir, clean=False, log=print):
+    """Build static_dir/dist and its manifest; return the manifest."""
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    compressors = _compressors()
+    if not any(suffix == '.br' for suffix, _ in compressors):
+        log('brotli is not installed; writing gzip copies only')
+
+    manifest = {}
+    written = {os.path.join(dist_dir, MANIFEST)}
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir) and DIST_DIR in dirs:
+            dirs.remove(DIST_DIR)
+        for filename in sorted(files):
+            source_path = os.path.join(root, filename)
+            name = os.path.relpath(source_path, static_dir).replace(os.sep, '/')
+            ext = os.path.splitext(filename)[1].lower()
+            with open(source_path, 'rb') as f:
+                data = f.read()
+            if ext in MINIFIERS:
+                data = MINIFIERS[ext](data.decode('utf-8')).encode('utf-8')
+
+            target = fingerprinted(name, data)
+            target_path = os.path.join(dist_dir, *target.split('/'))
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            outputs = [('', data)]
+            if ext in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+                outputs += [(suffix, compress(data)) for suffix, compress in compressors]
+            for suffix, content in outputs:
+                with open(target_path + suffix, 'wb') as f:
+                    f.write(content)
+                written.add(target_path + suffix)
+            manifest[name] = target
+            log(f'{name} -> {target} (' + ', '.join(f'{suffix or ext} {len(content)} B'
+                                                    for suffix, content in outputs) + ')')
+
+    with open(os.path.join(dist_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    # Earlier builds are kept by default: pages rendered before a restart
+    # still link to them
+    if clean:
+        for root, _, files in os.walk(dist_dir):
+            for filename in files:
+                path = os.path.join(root, filename)
+                if path not in written:
+                    os.remove(path)
+    return manifest
+
+
+def load_manifest(static_dir):
+    """Return the manifest of the last build, or {} if there is none."""
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def choose_encoding(dist_dir, filename, accepted):
+    """Return (filename to send, Content-Encoding or None) for a request.
+
+    ``accepted(encoding)`` tells whether the client accepts an encoding.
+    """
+    for encoding, suffix in ENCODINGS:
+        if accepted(encoding) and os.path.isfile(os.path.join(dist_dir, filename + suffix)):
+            return filename + suffix, encoding
+    return filename, None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build fingerprinted, precompressed static assets')
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--static', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'),
+                        help='static directory to build from')
+    parser.add_argument('--clean', action='store_true', help='delete files left over from earlier builds')
+    args = parser.parse_args()
+    build(args.static, clean=args.clean)
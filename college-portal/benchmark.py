@@ -0,0 +1,480 @@
+"""Benchmark every route of the portal against a (generated) database.
+
+    python generate_data.py --db benchmark.db
+    python benchmark.py --db benchmark.db --save baseline.json
+    python benchmark.py --db benchmark.db --compare baseline.json
+    python benchmark.py --db benchmark.db --concurrency 8 --duration 30
+
+Each route is first timed on its own through the Flask test client. With
+--concurrency a load phase follows, with that many threads sending a
+read-heavy mix of requests for --duration seconds. Latency percentiles
+and throughput are printed and can be saved as a baseline JSON.
+--compare diffs a run against a saved baseline and exits with status 1
+when a route got slower than --tolerance allows.
+
+The database is copied to a temporary file first (unless --in-place),
+because many routes write.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+# Differences below this many milliseconds are treated as noise
+NOISE_FLOOR_MS = 1.0
+
+# Relative weights of the concurrent load mix
+LOAD_MIX = {
+    'GET /student/dashboard': 30,
+    'GET /faculty/dashboard': 10,
+    'GET /admin/dashboard': 5,
+    'GET /api/get_clubs_events': 20,
+    'GET /api/users': 10,
+    'GET /api/attendance/roster': 10,
+    'POST /api/attendance': 5,
+    'POST /api/add_permission': 5,
+    'POST /login': 5,
+}
+
+
+def _xlsx(header, rows):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+class Context:
+    """Accounts and ids the scenarios work with, looked up once up front."""
+
+    def __init__(self, db_path, upload_rows):
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        one = lambda sql, *params: conn.execute(sql, params).fetchone()
+
+        # Prefer generated accounts: they have realistic amounts of data
+        faculty = (one("SELECT u.username, u.password, u.id FROM users u JOIN classes c ON c.faculty_id = u.id "
+                       "WHERE u.username LIKE 'gen_faculty%' GROUP BY u.id ORDER BY COUNT(*) DESC LIMIT 1")
+                   or one("SELECT username, password, id FROM users WHERE username = 'faculty1'"))
+        student = (one("SELECT u.username, u.password, u.id FROM users u "
+                       "WHERE u.username LIKE 'gen_student%' ORDER BY u.id LIMIT 1")
+                   or one("SELECT username, password, id FROM users WHERE username = 'student1'"))
+        self.accounts = {
+            'admin': ('admin', 'admin123'),
+            'faculty': (faculty['username'], faculty['password']),
+            'student': (student['username'], student['password']),
+        }
+        self.faculty_id = faculty['id']
+        self.student_id = student['id']
+        self.class_id = one('SELECT c.id FROM classes c JOIN class_enrollments e ON e.class_id = c.id '
+                            'WHERE c.faculty_id = ? GROUP BY c.id ORDER BY COUNT(*) DESC LIMIT 1',
+                            self.faculty_id)[0]
+        self.roster = [r[0] for r in conn.execute('SELECT student_id FROM class_enrollments WHERE class_id = ?',
+                                                  (self.class_id,))]
+        self.other_class_id = one('SELECT id FROM classes WHERE id != ? ORDER BY id LIMIT 1', self.class_id)[0]
+        self.permission_id = one('SELECT id FROM permissions WHERE faculty_id = ? ORDER BY id DESC LIMIT 1',
+                                 self.faculty_id)
+        self.permission_id = self.permission_id[0] if self.permission_id else 1
+        self.permission_ids = [r[0] for r in conn.execute(
+            'SELECT id FROM permissions WHERE faculty_id = ? ORDER BY id DESC LIMIT 50', (self.faculty_id,))]
+        self.enroll_usernames = [r[0] for r in conn.execute(
+            "SELECT username FROM users WHERE role = 'student' ORDER BY id LIMIT ?", (upload_rows,))]
+        # An upcoming event without a capacity, for registering and cancelling
+        self.event_id = conn.execute(
+            'INSERT INTO events (name, date, venue) VALUES (?, ?, ?)',
+            ('Benchmark event', date(date.today().year + 1, 1, 1).isoformat(), 'Bench Hall')).lastrowid
+        conn.commit()
+        name = one('SELECT name FROM users WHERE id = ?', self.student_id)['name'].split()
+        self.search_query = ' '.join([name[0], name[-1][:2]]) if len(name) > 1 else name[0][:3]
+        self.counts = {table: one(f'SELECT COUNT(*) FROM {table}')[0]
+                       for table in ('users', 'classes', 'class_enrollments', 'attendance', 'permissions')}
+        conn.close()
+
+        self.upload_rows = upload_rows
+        self.sequence = itertools.count()
+        self.last_job_id = None
+
+    def unique(self, prefix):
+        return f'{prefix}{os.getpid()}_{next(self.sequence)}'
+
+
+def _scenarios():
+    """(name, role, send[, setup]) for every route but /api/stream, which
+    does not end, and /assets, which only serves files.
+
+    ``setup(client, ctx)``, when given, runs untimed before each request and
+    its result is passed to ``send(client, ctx, prepared)``.
+    """
+
+    def attendance_records(ctx):
+        return [{'student_id': s, 'status': 'present' if i % 5 else 'absent'} for i, s in enumerate(ctx.roster)]
+
+    def add_user(client, ctx, _):
+        return client.post('/api/add_user', json={'username': ctx.unique('bench_student'), 'password': 'x',
+                                                  'name': 'Bench Student', 'class': 'Bench'})
+
+    def create_user(client, ctx):
+        client.post('/api/add_user', json={'username': ctx.unique('bench_delete'), 'password': 'x',
+                                           'name': 'Delete Me'})
+        return client.get('/api/users?role=student&sort=id&order=desc&limit=1').get_json()['users'][0]['id']
+
+    def upload(kind):
+        def send(client, ctx, _):
+            if kind == 'students':
+                header = ['name', 'username', 'password', 'class']
+                rows = ((f'Upload {i}', ctx.unique('bench_upload'), 'x', 'Bench') for i in range(ctx.upload_rows))
+            elif kind == 'enrollments':
+                # Enrolled already after the first run; the job still checks every row
+                header = ['username', 'class_id']
+                rows = ((username, ctx.other_class_id) for username in ctx.enroll_usernames)
+            else:
+                header = ['name', 'username', 'password', 'department']
+                rows = ((f'Upload {i}', ctx.unique('bench_fupload'), 'x', 'Bench') for i in range(ctx.upload_rows))
+            data = {'file': (io.BytesIO(_xlsx(header, rows)), f'{kind}.xlsx')}
+            response = client.post(f'/api/upload_{kind}', data=data, content_type='multipart/form-data')
+            ctx.last_job_id = (response.get_json() or {}).get('job_id') or ctx.last_job_id
+            return response
+        return send
+
+    def first_page_cursor(client, ctx):
+        return client.get('/api/users?role=student&limit=50').get_json()['next_cursor']
+
+    def first_permissions_cursor(client, ctx):
+        return client.get('/api/permissions?status=approved,rejected').get_json()['next_cursor']
+
+    def catalog_etag(client, ctx):
+        return client.get('/api/get_clubs_events').headers.get('ETag')
+
+    # Each registration is undone (untimed) before the next, and the other way round
+    def cancelled(client, ctx):
+        client.post(f'/api/events/{ctx.event_id}/cancel')
+
+    def registered(client, ctx):
+        client.post(f'/api/events/{ctx.event_id}/register')
+
+    today = date.today().isoformat()
+    return [
+        ('GET /', None, lambda c, ctx, _: c.get('/')),
+        ('POST /login', None, lambda c, ctx, _: c.post('/login', data={
+            'username': ctx.accounts['student'][0], 'password': ctx.accounts['student'][1], 'role': 'student'})),
+        ('GET /logout', None, lambda c, ctx, _: c.get('/logout')),
+        ('GET /admin/dashboard', 'admin', lambda c, ctx, _: c.get('/admin/dashboard')),
+        ('GET /faculty/dashboard', 'faculty', lambda c, ctx, _: c.get('/faculty/dashboard')),
+        ('GET /student/dashboard', 'student', lambda c, ctx, _: c.get('/student/dashboard')),
+        ('GET /api/users', 'admin', lambda c, ctx, _: c.get('/api/users?role=student&limit=50')),
+        ('GET /api/users (page 2)', 'admin', lambda c, ctx, cursor: c.get(
+            f'/api/users?role=student&limit=50&cursor={cursor}'), first_page_cursor),
+        ('GET /api/users (filtered)', 'admin', lambda c, ctx, _: c.get('/api/users?role=student&class=B.Tech%20CSE')),
+        # A short prefix matches most users and comes back unranked; two
+        # words narrow it down to a ranked handful
+        ('GET /api/search (prefix)', 'admin', lambda c, ctx, _: c.get('/api/search?q=st')),
+        ('GET /api/search (words)', 'admin', lambda c, ctx, _: c.get(
+            f'/api/search?q={ctx.search_query}')),
+        ('POST /api/add_user', 'admin', add_user),
+        ('POST /api/add_faculty', 'admin', lambda c, ctx, _: c.post('/api/add_faculty', json={
+            'username': ctx.unique('bench_faculty'), 'password': 'x', 'name': 'Bench Faculty',
+            'department': 'Bench'})),
+        ('DELETE /api/delete_user', 'admin', lambda c, ctx, user_id: c.delete(f'/api/delete_user/{user_id}'),
+         create_user),
+        ('GET /api/permissions (history)', 'faculty', lambda c, ctx, _: c.get(
+            '/api/permissions?status=approved,rejected')),
+        ('GET /api/permissions (page 2)', 'faculty', lambda c, ctx, cursor: c.get(
+            f'/api/permissions?status=approved,rejected&cursor={cursor}'), first_permissions_cursor),
+        ('POST /api/update_permission_status', 'faculty', lambda c, ctx, _: c.post(
+            '/api/update_permission_status', json={'permission_id': ctx.permission_id, 'status': 'approved'})),
+        # Flips the faculty's 50 latest requests each time, so every call writes
+        ('POST /api/permissions/status (50)', 'faculty', lambda c, ctx, _: c.post('/api/permissions/status', json={
+            'permission_ids': ctx.permission_ids,
+            'status': 'approved' if next(ctx.sequence) % 2 else 'rejected'})),
+        ('POST /api/add_permission', 'student', lambda c, ctx, _: c.post('/api/add_permission', json={
+            'date': today, 'reason': 'Benchmark'})),
+        ('POST /api/upload_students', 'admin', upload('students')),
+        ('POST /api/upload_faculty', 'admin', upload('faculty')),
+        ('POST /api/upload_enrollments', 'admin', upload('enrollments')),
+        ('GET /api/jobs/<id>', 'admin', lambda c, ctx, _: c.get(f'/api/jobs/{ctx.last_job_id}')),
+        ('GET /api/get_clubs_events', 'student', lambda c, ctx, _: c.get('/api/get_clubs_events')),
+        ('GET /api/get_clubs_events (304)', 'student', lambda c, ctx, etag: c.get(
+            '/api/get_clubs_events', headers={'If-None-Match': etag}), catalog_etag),
+        ('POST /api/add_club_event', 'admin', lambda c, ctx, _: c.post('/api/add_club_event', json={
+            'name': ctx.unique('Bench Club '), 'type': 'club'})),
+        ('POST /api/add_event', 'admin', lambda c, ctx, _: c.post('/api/add_event', json={
+            'name': ctx.unique('Bench Event '), 'date': today, 'venue': 'Bench Hall', 'capacity': 100})),
+        ('GET /api/events', 'student', lambda c, ctx, _: c.get('/api/events')),
+        ('POST /api/events/<id>/register', 'student', lambda c, ctx, _: c.post(
+            f'/api/events/{ctx.event_id}/register'), cancelled),
+        ('POST /api/events/<id>/cancel', 'student', lambda c, ctx, _: c.post(
+            f'/api/events/{ctx.event_id}/cancel'), registered),
+        ('GET /api/attendance/roster', 'faculty', lambda c, ctx, _: c.get(
+            f'/api/attendance/roster?class_id={ctx.class_id}&date={today}')),
+        ('POST /api/attendance', 'faculty', lambda c, ctx, _: c.post('/api/attendance', json={
+            'class_id': ctx.class_id, 'date': today, 'records': attendance_records(ctx)})),
+        ('POST /api/enrollments', 'admin', lambda c, ctx, _: c.post('/api/enrollments', json={
+            'class_id': ctx.other_class_id, 'student_ids': [ctx.student_id]})),
+        ('DELETE /api/enrollments', 'admin', lambda c, ctx, _: c.delete('/api/enrollments', json={
+            'class_id': ctx.other_class_id, 'student_ids': [ctx.student_id]})),
+        ('GET /api/reports/attendance', 'faculty', lambda c, ctx, _: c.get(
+            f'/api/reports/attendance?class_id={ctx.class_id}')),
+        ('GET /api/reports/permissions', 'faculty', lambda c, ctx, _: c.get('/api/reports/permissions')),
+        ('GET /api/db_pool_stats', 'admin', lambda c, ctx, _: c.get('/api/db_pool_stats')),
+        ('GET /metrics', 'admin', lambda c, ctx, _: c.get('/metrics')),
+        ('GET /api/slow_queries', 'admin', lambda c, ctx, _: c.get('/api/slow_queries')),
+        ('POST /api/change_password', 'student', lambda c, ctx, _: c.post('/api/change_password', json={
+            'current_password': ctx.accounts['student'][1], 'new_password': ctx.accounts['student'][1],
+            'confirm_password': ctx.accounts['student'][1]})),
+    ]
+
+
+def _failed(response):
+    if response.status_code >= 400:
+        return True
+    if response.is_json:
+        body = response.get_json(silent=True)
+        return isinstance(body, dict) and body.get('success') is False
+    return False
+
+
+def _summarize(latencies, errors, elapsed):
+    values = np.array(latencies) * 1000
+    summary = {'requests': len(latencies), 'errors': errors,
+               'throughput': round(len(latencies) / elapsed, 1) if elapsed else None,
+               'mean_ms': round(float(values.mean()), 3) if len(values) else None}
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = round(float(np.percentile(values, p)), 3) if len(values) else None
+    return summary
+
+
+class Bench:
+    def __init__(self, app_module, ctx):
+        self.app = app_module.app
+        self.ctx = ctx
+        self.scenarios = {name: (role, send, setup[0] if setup else None)
+                          for name, role, send, *setup in _scenarios()}
+
+    def client(self, role):
+        client = self.app.test_client()
+        if role:
+            username, password = self.ctx.accounts[role]
+            response = client.post('/login', data={'username': username, 'password': password, 'role': role})
+            if response.status_code != 302 or 'dashboard' not in response.headers.get('Location', ''):
+                raise RuntimeError(f'Could not log in as {role} ({username})')
+        return client
+
+    def _call(self, client, name):
+        _, send, setup = self.scenarios[name]
+        prepared = setup(client, self.ctx) if setup else None
+        started = time.perf_counter()
+        response = send(client, self.ctx, prepared)
+        response.get_data()  # streamed responses are only produced when read
+        elapsed = time.perf_counter() - started
+        failed = _failed(response)
+        response.close()
+        return elapsed, failed
+
+    def run_routes(self, requests, warmup, only=None):
+        results = {}
+        for name, (role, _, _) in self.scenarios.items():
+            if only and name not in only:
+                continue
+            client = self.client(role)
+            for _ in range(warmup):
+                self._call(client, name)
+            latencies, errors = [], 0
+            for _ in range(requests):
+                elapsed, failed = self._call(client, name)
+                latencies.append(elapsed)
+                errors += failed
+            # Throughput over the timed requests only, not the untimed setup
+            results[name] = _summarize(latencies, errors, sum(latencies))
+        return results
+
+    def run_load(self, concurrency, duration, seed=0):
+        names = list(LOAD_MIX)
+        weights = np.array([LOAD_MIX[n] for n in names], dtype=float)
+        weights /= weights.sum()
+        latencies = {name: [] for name in names}
+        errors = dict.fromkeys(names, 0)
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+        barrier = threading.Barrier(concurrency)
+
+        def worker(index):
+            rng = np.random.default_rng(seed + index)
+            clients = {role: self.client(role) for role in ('admin', 'faculty', 'student')}
+            anonymous = self.app.test_client()
+            local = {name: [] for name in names}
+            local_errors = dict.fromkeys(names, 0)
+            barrier.wait()
+            while time.perf_counter() < deadline:
+                name = names[rng.choice(len(names), p=weights)]
+                role = self.scenarios[name][0]
+                elapsed, failed = self._call(clients[role] if role else anonymous, name)
+                local[name].append(elapsed)
+                local_errors[name] += failed
+            with lock:
+                for name in names:
+                    latencies[name].extend(local[name])
+                    errors[name] += local_errors[name]
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        everything = [value for values in latencies.values() for value in values]
+        return {
+            'concurrency': concurrency,
+            'duration': round(elapsed, 2),
+            'total': _summarize(everything, sum(errors.values()), elapsed),
+            'routes': {name: _summarize(latencies[name], errors[name], elapsed)
+                       for name in names if latencies[name]},
+        }
+
+
+def print_table(title, results):
+    print(f'\n{title}')
+    header = f"{'route':<36} {'n':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9}"
+    print(header)
+    print('-' * len(header))
+    for name, r in results.items():
+        print(f"{name:<36} {r['requests']:>6} {r['errors']:>4} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+              f"{r['p99_ms']:>9.2f} {r['throughput']:>9.1f}")
+
+
+def compare(baseline, current, tolerance):
+    """Print per-route changes against a baseline; return the regressed routes."""
+    regressions = []
+    sections = [('routes', baseline.get('routes', {}), current.get('routes', {}))]
+    if baseline.get('load') and current.get('load'):
+        sections.append(('load', baseline['load']['routes'], current['load']['routes']))
+
+    print(f'\nCompared with baseline from {baseline["meta"]["created"]} (tolerance {tolerance:.0%})')
+    print(f"{'route':<43} {'p50 ms':>17} {'p95 ms':>17}")
+    for section, before_routes, after_routes in sections:
+        for name, after in after_routes.items():
+            before = before_routes.get(name)
+            if not before:
+                print(f'{section}: {name:<35} (new)')
+                continue
+            cells, slower = [], False
+            for key in ('p50_ms', 'p95_ms'):
+                old, new = before[key], after[key]
+                change = (new - old) / old if old else 0.0
+                cells.append(f'{old:>7.2f} > {new:>7.2f}')
+                if change > tolerance and new - old > NOISE_FLOOR_MS:
+                    slower = True
+            flag = '  REGRESSION' if slower else ''
+            print(f'{section}: {name:<35} {cells[0]:>17} {cells[1]:>17}{flag}')
+            if slower:
+                regressions.append(f'{section}: {name}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the college portal routes')
+    parser.add_argument('--db', default='benchmark.db', help='database to benchmark (see generate_data.py)')
+    parser.add_argument('--in-place', action='store_true', help='run against the database itself, not a copy')
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per route first')
+    parser.add_argument('--route', action='append', help='only benchmark this route (repeatable)')
+    parser.add_argument('--upload-rows', type=int, default=500, help='rows per uploaded spreadsheet')
+    parser.add_argument('--concurrency', type=int, default=0, help='threads for the load phase (0 skips it)')
+    parser.add_argument('--duration', type=float, default=20, help='seconds the load phase runs')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before flagging, e.g. 0.2')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f'{args.db} does not exist; create it with generate_data.py')
+
+    workdir = None
+    db_path = os.path.abspath(args.db)
+    if not args.in_place:
+        workdir = tempfile.mkdtemp(prefix='portal-bench-')
+        copy = os.path.join(workdir, os.path.basename(db_path))
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(copy)
+        source.backup(target)
+        target.close()
+        source.close()
+        db_path = copy
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+
+    app_module.app.config['DATABASE'] = db_path
+    if workdir:
+        app_module.app.config['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    app_module.init_db()
+
+    try:
+        ctx = Context(db_path, args.upload_rows)
+        bench = Bench(app_module, ctx)
+        results = {
+            'meta': {
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'database': os.path.abspath(args.db),
+                'rows': ctx.counts,
+                'requests': args.requests,
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'machine': platform.machine(),
+            },
+            'routes': bench.run_routes(args.requests, args.warmup, only=args.route),
+        }
+        print(f"Database: {args.db} ({', '.join(f'{k}={v}' for k, v in ctx.counts.items())})")
+        print_table('Per-route latency', results['routes'])
+
+        if args.concurrency:
+            results['load'] = bench.run_load(args.concurrency, args.duration)
+            load = results['load']
+            print_table(f"Load: {args.concurrency} threads for {load['duration']}s", load['routes'])
+            total = load['total']
+            print(f"total: {total['requests']} requests, {total['throughput']} req/s, "
+                  f"p50 {total['p50_ms']} ms, p95 {total['p95_ms']} ms, p99 {total['p99_ms']} ms, "
+                  f"{total['errors']} errors")
+
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f'\nSaved results to {args.save}')
+
+        regressions = []
+        if args.compare:
+            with open(args.compare) as f:
+                regressions = compare(json.load(f), results, args.tolerance)
+            if regressions:
+                print(f"\n{len(regressions)} route(s) regressed: {', '.join(regressions)}")
+    finally:
+        runner = app_module.app.extensions.get('import_runner')
+        if runner is not None:
+            runner.shutdown()
+        app_module.get_db_pool().close()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
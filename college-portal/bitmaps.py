@@ -0,0 +1,321 @@
+"""Attendance stored as one bitmap row per class session.
+
+    python bitmaps.py convert [--db college_portal.db]
+    python bitmaps.py compare [--db benchmark.db] [--students 200]
+
+Instead of one attendance row per student, class and date, a session is
+one attendance_sessions row holding two bitsets over the class roster:
+``marked`` (the student has a mark for the session) and ``present``.
+Bit i (least significant first) belongs to the student at position i of
+class_rosters. Positions are handed out in order and never reused, so a
+student's bit means the same in every session of the class; sessions
+recorded before a student joined are simply shorter.
+
+The helpers count with NumPy over whole columns of bitsets at a time.
+attendance_marks is a view that turns the bitmaps back into
+(class_id, date, student_id, status) rows for exports.
+
+`convert` moves the rows of the attendance table into bitmaps (set
+ATTENDANCE_STORAGE = 'bitmap' in the app afterwards). `compare` converts
+a temporary copy of a database and prints the sizes and timings of both
+layouts, after checking that they give the same percentages.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+import database
+
+PRESENT = 'present'
+ABSENT = 'absent'
+
+if hasattr(np, 'bitwise_count'):
+    popcount = np.bitwise_count
+else:
+    # NumPy < 2.0: bits set in every byte value
+    _POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+    def popcount(values):
+        return _POPCOUNT[values]
+
+
+def pack(positions, size):
+    """Bitset of ``size`` bits with the bits at ``positions`` set."""
+    bits = np.zeros(size, dtype=bool)
+    bits[np.asarray(positions, dtype=np.int64)] = True
+    return np.packbits(bits, bitorder='little').tobytes()
+
+
+def unpack(bitset, size):
+    """Boolean array of the first ``size`` bits of ``bitset``."""
+    bits = np.unpackbits(np.frombuffer(bitset, dtype=np.uint8), bitorder='little')
+    return np.pad(bits, (0, max(size - len(bits), 0)))[:size].astype(bool)
+
+
+def roster_positions(conn, class_id, student_ids):
+    """Return {student_id: position} in the class, adding new students at the end."""
+    positions = dict(conn.execute(
+        'SELECT student_id, position FROM class_rosters WHERE class_id = ? '
+        'AND student_id IN (SELECT value FROM json_each(?))', (class_id, json.dumps(list(student_ids)))))
+    missing = sorted(set(student_ids) - set(positions))
+    if missing:
+        start = conn.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM class_rosters WHERE class_id = ?',
+                             (class_id,)).fetchone()[0]
+        added = {student_id: start + i for i, student_id in enumerate(missing)}
+        conn.executemany('INSERT INTO class_rosters (class_id, position, student_id) VALUES (?, ?, ?)',
+                         [(class_id, position, student_id) for student_id, position in added.items()])
+        positions.update(added)
+    return positions
+
+
+def write_session(conn, class_id, session_date, records):
+    """Store the marks of one session, replacing any earlier ones.
+
+    ``records`` is {student_id: 'present' | 'absent'}. Returns the students
+    whose earlier mark was dropped because they are no longer in records.
+    Runs in the caller's transaction.
+    """
+    positions = roster_positions(conn, class_id, records)
+    size = conn.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM class_rosters WHERE class_id = ?',
+                        (class_id,)).fetchone()[0]
+    before = session_marks(conn, class_id, session_date)
+    conn.execute('''
+        INSERT INTO attendance_sessions (class_id, date, size, marked, present) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (class_id, date) DO UPDATE SET
+            size = excluded.size, marked = excluded.marked, present = excluded.present
+    ''', (class_id, session_date, size, pack([positions[s] for s in records], size),
+          pack([positions[s] for s, status in records.items() if status == PRESENT], size)))
+    return [student_id for student_id in before if student_id not in records]
+
+
+def session_marks(conn, class_id, session_date):
+    """Return {student_id: 'present' | 'absent'} for one session."""
+    row = conn.execute('SELECT size, marked, present FROM attendance_sessions WHERE class_id = ? AND date = ?',
+                       (class_id, session_date)).fetchone()
+    if row is None:
+        return {}
+    size, marked, present = row
+    marked, present = unpack(marked, size), unpack(present, size)
+    return {student_id: PRESENT if present[position] else ABSENT
+            for position, student_id in conn.execute(
+                'SELECT position, student_id FROM class_rosters WHERE class_id = ? AND position < ?',
+                (class_id, size))
+            if marked[position]}
+
+
+def student_summary(conn, student_id):
+    """Return [(class_id, present, absent, total)] for a student, by class_id.
+
+    One query fetches the student's byte of every session of their
+    classes; the bits are then picked out and counted per class at once.
+    """
+    rows = conn.execute('''
+        SELECT r.class_id, r.position % 8,
+               substr(s.marked, r.position / 8 + 1, 1), substr(s.present, r.position / 8 + 1, 1)
+        FROM class_rosters r
+        JOIN attendance_sessions s ON s.class_id = r.class_id AND s.size > r.position
+        WHERE r.student_id = ?
+    ''', (student_id,)).fetchall()
+    if not rows:
+        return []
+    class_ids, shifts, marked, present = zip(*rows)
+    classes, index = np.unique(np.array(class_ids), return_inverse=True)
+    shifts = np.array(shifts, dtype=np.uint8)
+    marked = (np.frombuffer(b''.join(marked), dtype=np.uint8) >> shifts) & 1
+    present = (np.frombuffer(b''.join(present), dtype=np.uint8) >> shifts) & 1 & marked
+    totals = np.bincount(index, weights=marked, minlength=len(classes)).astype(np.int64)
+    presents = np.bincount(index, weights=present, minlength=len(classes)).astype(np.int64)
+    return [(int(c), int(p), int(t - p), int(t)) for c, p, t in zip(classes, presents, totals) if t]
+
+
+def class_summary(conn, class_id):
+    """Return (per-student {student_id: (present, total)}, class percentage).
+
+    All sessions of the class are stacked into one byte matrix: the class
+    figure is a popcount over all of it, the per-student figures are
+    column sums of the unpacked bits.
+    """
+    sessions = conn.execute('SELECT size, marked, present FROM attendance_sessions WHERE class_id = ?',
+                            (class_id,)).fetchall()
+    if not sessions:
+        return {}, None
+    width = max((size + 7) // 8 for size, _, _ in sessions)
+    marked = _stack([row[1] for row in sessions], width)
+    present = _stack([row[2] for row in sessions], width) & marked
+    marks = int(popcount(marked).sum(dtype=np.int64))
+    percentage = int(popcount(present).sum(dtype=np.int64)) * 100.0 / marks if marks else None
+
+    totals = np.unpackbits(marked, axis=1, bitorder='little').sum(axis=0, dtype=np.int64)
+    presents = np.unpackbits(present, axis=1, bitorder='little').sum(axis=0, dtype=np.int64)
+    students = {student_id: (int(presents[position]), int(totals[position]))
+                for position, student_id in conn.execute(
+                    'SELECT position, student_id FROM class_rosters WHERE class_id = ?', (class_id,))
+                if position < len(totals) and totals[position]}
+    return students, percentage
+
+
+def _stack(bitsets, width):
+    matrix = np.zeros((len(bitsets), width), dtype=np.uint8)
+    for i, bitset in enumerate(bitsets):
+        matrix[i, :len(bitset)] = np.frombuffer(bitset, dtype=np.uint8)
+    return matrix
+
+
+def convert(conn):
+    """Move the attendance rows into bitmap sessions, in one transaction.
+
+    Sessions already stored as bitmaps are merged with the rows for the
+    same class and date. Rows with a status other than present/absent,
+    or without a student or class, are left where they are. Returns
+    (rows moved, sessions written).
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        moved = sessions = 0
+        class_ids = [row[0] for row in conn.execute(
+            "SELECT DISTINCT class_id FROM attendance WHERE class_id IS NOT NULL "
+            "AND student_id IS NOT NULL AND status IN ('present', 'absent')")]
+        for class_id in class_ids:
+            rows = conn.execute('''
+                SELECT date, student_id, status FROM attendance
+                WHERE class_id = ? AND student_id IS NOT NULL AND status IN ('present', 'absent')
+                ORDER BY date
+            ''', (class_id,)).fetchall()
+            dates, student_ids, statuses = (np.array(column) for column in zip(*rows))
+            positions = roster_positions(conn, class_id, sorted(set(student_ids.tolist())))
+            # The whole roster, so merging never cuts off students of an
+            # existing session who have no leftover rows
+            size = conn.execute('SELECT COALESCE(MAX(position), -1) + 1 FROM class_rosters WHERE class_id = ?',
+                                (class_id,)).fetchone()[0]
+            session_dates, row_session = np.unique(dates, return_inverse=True)
+            columns = np.array([positions[s] for s in student_ids.tolist()])
+            marked = np.zeros((len(session_dates), size), dtype=bool)
+            present = np.zeros_like(marked)
+            marked[row_session, columns] = True
+            present[row_session, columns] = statuses == PRESENT
+            for i, session_date in enumerate(session_dates.tolist()):
+                existing = conn.execute(
+                    'SELECT size, marked, present FROM attendance_sessions WHERE class_id = ? AND date = ?',
+                    (class_id, session_date)).fetchone()
+                if existing is not None:
+                    # Marks made as bitmaps are newer than leftover rows
+                    old_marked = unpack(existing[1], size)
+                    present[i] = np.where(old_marked, unpack(existing[2], size), present[i])
+                    marked[i] |= old_marked
+            conn.executemany('''
+                INSERT OR REPLACE INTO attendance_sessions (class_id, date, size, marked, present)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(class_id, session_date, size,
+                   np.packbits(marked[i], bitorder='little').tobytes(),
+                   np.packbits(present[i], bitorder='little').tobytes())
+                  for i, session_date in enumerate(session_dates.tolist())])
+            moved += conn.execute(
+                "DELETE FROM attendance WHERE class_id = ? AND student_id IS NOT NULL "
+                "AND status IN ('present', 'absent')", (class_id,)).rowcount
+            sessions += len(session_dates)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return moved, sessions
+
+
+def table_bytes(conn, tables):
+    """Bytes used by ``tables`` and their indexes (needs the dbstat table)."""
+    return conn.execute('''
+        SELECT COALESCE(SUM(d.pgsize), 0) FROM dbstat d
+        JOIN sqlite_master m ON m.name = d.name
+        WHERE m.tbl_name IN (SELECT value FROM json_each(?))
+    ''', (json.dumps(list(tables)),)).fetchone()[0]
+
+
+def _timed(fn, items):
+    started = time.perf_counter()
+    results = [fn(item) for item in items]
+    return results, (time.perf_counter() - started) * 1000 / max(len(items), 1)
+
+
+def compare(db_path, student_count):
+    """Convert a copy of ``db_path`` and print sizes, timings and mismatches."""
+    workdir = tempfile.mkdtemp(prefix='portal-bitmaps-')
+    try:
+        copy = os.path.join(workdir, 'compare.db')
+        source, conn = sqlite3.connect(db_path), sqlite3.connect(copy)
+        source.backup(conn)
+        source.close()
+        conn.execute('PRAGMA journal_mode = WAL')
+        database.migrate(conn)
+        students = [row[0] for row in conn.execute(
+            'SELECT DISTINCT student_id FROM attendance_summary ORDER BY student_id LIMIT ?', (student_count,))]
+        classes = [row[0] for row in conn.execute(
+            'SELECT DISTINCT class_id FROM attendance_summary ORDER BY class_id LIMIT ?', (student_count,))]
+
+        def rows_student(student_id):
+            return [tuple(row) for row in conn.execute('''
+                SELECT class_id, SUM(status = 'present'), SUM(status = 'absent'), COUNT(*)
+                FROM attendance WHERE student_id = ? GROUP BY class_id ORDER BY class_id
+            ''', (student_id,))]
+
+        def summary_student(student_id):
+            return [tuple(row) for row in conn.execute(
+                'SELECT class_id, present, absent, total FROM attendance_summary WHERE student_id = ? '
+                'ORDER BY class_id', (student_id,))]
+
+        def rows_class(class_id):
+            return conn.execute("SELECT SUM(status = 'present') * 100.0 / COUNT(*) FROM attendance "
+                                "WHERE class_id = ?", (class_id,)).fetchone()[0]
+
+        expected, rows_ms = _timed(rows_student, students)
+        _, summary_ms = _timed(summary_student, students)
+        expected_classes, rows_class_ms = _timed(rows_class, classes)
+        rows_size = table_bytes(conn, ['attendance', 'attendance_summary'])
+
+        started = time.perf_counter()
+        moved, sessions = convert(conn)
+        convert_s = time.perf_counter() - started
+        conn.execute('VACUUM')
+        bitmap_size = table_bytes(conn, ['attendance_sessions', 'class_rosters'])
+
+        actual, bitmap_ms = _timed(lambda s: student_summary(conn, s), students)
+        actual_classes, bitmap_class_ms = _timed(lambda c: class_summary(conn, c)[1], classes)
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    mismatches = sum(a != e for a, e in zip(actual, expected))
+    mismatches += sum(a is None or abs(a - e) > 1e-9 for a, e in zip(actual_classes, expected_classes))
+    print(f'{moved} attendance rows -> {sessions} sessions in {convert_s:.1f}s')
+    print(f'size:              rows + summary {rows_size / 1e6:9.2f} MB   bitmaps {bitmap_size / 1e6:7.2f} MB '
+          f'({rows_size / max(bitmap_size, 1):.0f}x smaller)')
+    print(f'student (n={len(students)}):   rows {rows_ms:7.3f} ms   summary table {summary_ms:7.3f} ms   '
+          f'bitmaps {bitmap_ms:7.3f} ms')
+    print(f'class (n={len(classes)}):     rows {rows_class_ms:7.3f} ms   bitmaps {bitmap_class_ms:7.3f} ms')
+    print(f'mismatches: {mismatches}')
+    return mismatches
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Store attendance as bitmaps per class session')
+    parser.add_argument('command', choices=['convert', 'compare'])
+    parser.add_argument('--db', default='college_portal.db', help='database to work on')
+    parser.add_argument('--students', type=int, default=200, help='students and classes to time (compare)')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        conn = database.connect(args.db)
+        try:
+            database.migrate(conn)
+            moved, sessions = convert(conn)
+        finally:
+            conn.close()
+        print(f'Moved {moved} attendance rows into {sessions} sessions')
+    else:
+        sys.exit(1 if compare(args.db, args.students) else 0)
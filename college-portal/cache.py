@@ -0,0 +1,181 @@
+import hashlib
+import json
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+CatalogEntry = namedtuple('CatalogEntry', 'version clubs events body etag last_modified')
+RenderEntry = namedtuple('RenderEntry', 'versions body expires')
+
+DEFAULT_RENDER_CACHE_BYTES = 32 * 1024 * 1024
+# Entries are also dropped after this long, which bounds how stale a page
+# can get when the database is changed from outside the app (archive.py)
+DEFAULT_RENDER_CACHE_SECONDS = 300
+
+
+class CatalogCache:
+    """In-process copy of the active clubs/events catalog.
+
+    Writers call invalidate() after changing clubs_events; the next reader
+    reloads it. Until then reads cost no queries at all.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._entry = None
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._entry = None
+
+    def get(self, load, version=None):
+        """Return the catalog, calling ``load`` for its rows when needed.
+
+        ``version`` is the catalog's shared version stamp, for when other
+        processes change it too; a copy loaded at another version is
+        reloaded.
+        """
+        entry = self._entry
+        if entry is not None and entry.version == version:
+            return entry
+
+        with self._lock:
+            generation = self.generation
+        rows = load()
+        clubs = [{'id': r['id'], 'name': r['name'], 'type': r['type']} for r in rows if r['type'] == 'club']
+        events = [{'id': r['id'], 'name': r['name'], 'type': r['type']} for r in rows if r['type'] == 'event']
+        body = json.dumps({'clubs': clubs, 'events': events})
+        # The ETag is derived from the content, so it stays valid across
+        # restarts and is the same in every worker process
+        etag = hashlib.sha1(body.encode()).hexdigest()
+        entry = CatalogEntry(version, clubs, events, body, etag,
+                             datetime.now(timezone.utc).replace(microsecond=0))
+
+        with self._lock:
+            # Don't store a copy that was loaded while a writer invalidated it
+            if self.generation == generation:
+                self._entry = entry
+        return entry
+
+
+class VersionStamps:
+    """Version counters for the entities cached pages are built from.
+
+    Writers bump() an entity after committing a change to it, and a cached
+    page is only served while the versions it was rendered with are
+    current.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = Counter()
+
+    def bump(self, *entities):
+        with self._lock:
+            for entity in entities:
+                self._versions[entity] += 1
+
+    def current(self, entities):
+        """Return the versions of ``entities``."""
+        with self._lock:
+            return tuple(self._versions[entity] for entity in entities)
+
+
+def bump_versions(conn, entities):
+    """Bump ``entities`` in the cache_versions table, inside the caller's transaction."""
+    conn.executemany(
+        'INSERT INTO cache_versions (entity, version) VALUES (?, 1) '
+        'ON CONFLICT (entity) DO UPDATE SET version = version + 1',
+        [(entity,) for entity in entities]
+    )
+
+
+class SharedVersionStamps(VersionStamps):
+    """VersionStamps kept in the database, so every process sees them.
+
+    With several worker processes each has its own page cache, and a
+    write served by one must invalidate the pages cached by all of them.
+    The versions live in the cache_versions table: current() costs one
+    indexed lookup and bump() a small write. ``connection()`` returns the
+    connection to use.
+    """
+
+    def __init__(self, connection):
+        super().__init__()
+        self.connection = connection
+
+    def bump(self, *entities):
+        conn = self.connection()
+        bump_versions(conn, entities)
+        conn.commit()
+
+    def current(self, entities):
+        versions = dict(self.connection().execute(
+            'SELECT entity, version FROM cache_versions WHERE entity IN (SELECT value FROM json_each(?))',
+            (json.dumps(list(entities)),)
+        ).fetchall())
+        return tuple(versions.get(entity, 0) for entity in entities)
+
+
+class RenderCache:
+    """LRU cache of rendered pages, capped by the total size of their bodies.
+
+    An entry is stored with the versions it was rendered from; get() only
+    returns it while the caller passes the same versions.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_RENDER_CACHE_BYTES, max_age=DEFAULT_RENDER_CACHE_SECONDS):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.versions == versions and entry.expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.body
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, versions, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = RenderEntry(versions, body, time.monotonic() + self.max_age)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.size -= len(self._entries.pop(key).body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,107 @@
+"""Check that a server process still starts quickly and small.
+
+    python check_startup.py
+    python check_startup.py --import-ms 350 --init-ms 50 --rss-mb 50
+
+Starts fresh interpreters the way a new worker starts: each imports app
+and calls create_app() on a database whose schema is already current.
+Reports the import time, the create_app() time and the peak resident
+memory (median of --runs), and exits with status 1 when any of them is
+over budget or when a module that should load on demand (pandas,
+openpyxl) was imported at startup.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Budgets, with headroom over what a current build measures
+# (about 200 ms, 1 ms and 34 MB); importing pandas at startup alone
+# costs about 200 ms and 45 MB more
+IMPORT_BUDGET_MS = 350
+INIT_BUDGET_MS = 50
+RSS_BUDGET_MB = 50
+
+LAZY_MODULES = ('pandas', 'numpy', 'openpyxl')
+
+# Runs in the child interpreter; prints one JSON line
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {app_dir!r})
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+initialized = time.perf_counter()
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+except ImportError:
+    rss_mb = None
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'init_ms': (initialized - imported) * 1000,
+    'rss_mb': rss_mb,
+    'loaded': [name for name in {lazy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure(workdir):
+    code = CHILD.format(app_dir=APP_DIR, lazy=LAZY_MODULES)
+    result = subprocess.run([sys.executable, '-c', code], cwd=workdir, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f'startup failed:\n{result.stderr}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the cold-start time and memory of the portal')
+    parser.add_argument('--runs', type=int, default=5, help='interpreters to start; the median is used')
+    parser.add_argument('--import-ms', type=float, default=IMPORT_BUDGET_MS, help='budget for importing app')
+    parser.add_argument('--init-ms', type=float, default=INIT_BUDGET_MS, help='budget for create_app()')
+    parser.add_argument('--rss-mb', type=float, default=RSS_BUDGET_MB, help='budget for peak resident memory')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='portal-startup-')
+    try:
+        # The first start creates the schema and warms the OS file cache
+        measure(workdir)
+        runs = [measure(workdir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failures = []
+    for key, budget, unit in (('import_ms', args.import_ms, 'ms'), ('init_ms', args.init_ms, 'ms'),
+                              ('rss_mb', args.rss_mb, 'MB')):
+        values = [run[key] for run in runs if run[key] is not None]
+        if not values:
+            print(f'{key:<10} not available on this platform')
+            continue
+        median = statistics.median(values)
+        over = median > budget
+        print(f'{key:<10} {median:8.1f} {unit}  (budget {budget:g} {unit}){"  OVER BUDGET" if over else ""}')
+        if over:
+            failures.append(key)
+
+    loaded = sorted({name for run in runs for name in run['loaded']})
+    if loaded:
+        print(f"loaded at startup: {', '.join(loaded)} (should be imported on demand)")
+        failures.append('lazy imports')
+
+    if failures:
+        print(f"\nStartup budget exceeded: {', '.join(failures)}")
+        return 1
+    print('\nStartup is within budget')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,687 @@
+import os
+import queue
 import sqlite3
+import threading
+import urllib.parse
 
-def init_db():
-    conn = sqlite3.connect('college_portal.db')
-    c = conn.cursor()
-    
-    # Create tables (same as in app.py)
-    # This is a backup initialization script
-    
+# Connection tuning applied to every pooled connection. WAL lets the
+# dashboards keep reading while a write (e.g. a permission approval)
+# commits, and NORMAL sync is durable enough in WAL mode.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,        # negative = KiB, ~16 MB page cache per connection
+    'mmap_size': 134217728,      # 128 MB memory-mapped reads
+    'busy_timeout': 5000,        # ms to wait for a lock instead of failing
+    'temp_store': 'MEMORY',
+}
+
+DEFAULT_STATEMENT_CACHE_SIZE = 128
+
+
+# Pragmas that change the file, which a read-only connection must not set
+WRITE_PRAGMAS = {'journal_mode', 'synchronous'}
+
+
+def connect(path, pragmas=None, statement_cache_size=DEFAULT_STATEMENT_CACHE_SIZE, factory=sqlite3.Connection,
+            read_only=False):
+    # cached_statements keeps compiled statements on the connection, so a
+    # pooled connection reuses them across requests
+    pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+    if read_only:
+        path = f'file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro'
+        pragmas = {name: value for name, value in pragmas.items() if name not in WRITE_PRAGMAS}
+    conn = sqlite3.connect(path, check_same_thread=False, uri=read_only,
+                           cached_statements=statement_cache_size, factory=factory)
+    conn.row_factory = sqlite3.Row
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+# Connections a forked process inherited from its parent's pool
+_inherited = []
+
+
+class ConnectionPool:
+    """Keeps up to ``size`` idle connections for reuse between requests.
+
+    Fork-safe: a process forked from the one that filled the pool never
+    uses (or closes) the connections it inherited, and opens its own.
+    """
+
+    def __init__(self, path, size=8, pragmas=None,
+                 statement_cache_size=DEFAULT_STATEMENT_CACHE_SIZE, factory=sqlite3.Connection):
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas
+        self.statement_cache_size = statement_cache_size
+        self.factory = factory
+        # LIFO so the most recently used (warmest) connection is handed out first
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # SQLite handles must not cross a fork, and closing one in the
+            # child could checkpoint or remove the parent's WAL; keep them
+            # referenced so they are never closed, and start over
+            _inherited.extend(self._idle.queue)
+            self._idle = queue.LifoQueue(maxsize=self.size)
+            self._pid = os.getpid()
+
+    def acquire(self):
+        self._check_pid()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.misses += 1
+            return connect(self.path, self.pragmas, self.statement_cache_size, self.factory)
+        with self._lock:
+            self.hits += 1
+        return conn
+
+    def release(self, conn):
+        if self._pid != os.getpid():
+            _inherited.append(conn)
+            return
+        # Never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            with self._lock:
+                self.discarded += 1
+            conn.close()
+
+    def close(self):
+        self._check_pid()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'idle': self._idle.qsize(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'discarded': self.discarded,
+            }
+
+
+class BackgroundThread:
+    """A daemon thread running ``target(stop, *args)``, at most one per process.
+
+    Threads do not survive a fork: start() in a forked child starts the
+    child's own thread, and stop() there leaves the parent's alone.
+    ``target`` should return soon after the ``stop`` event is set.
+    """
+
+    def __init__(self, target, name):
+        self.target = target
+        self.name = name
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        # Process that started the thread, None if never started
+        self.pid = None
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and self.pid == os.getpid()
+
+    def start(self, prepare=None):
+        """Start the thread unless it is running in this process.
+
+        ``prepare()``, if given, is called first (under the lock) and
+        returns the extra arguments for ``target``. Returns whether a
+        thread was started.
+        """
+        if self.running():
+            return False
+        with self._lock:
+            if self.running():
+                return False
+            args = prepare() if prepare is not None else ()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self.target, args=(self._stop, *args),
+                                            name=self.name, daemon=True)
+            self.pid = os.getpid()
+            self._thread.start()
+            return True
+
+    def stop(self, timeout=5, wake=None):
+        """Stop the thread and wait up to ``timeout`` seconds for it.
+
+        ``wake()``, if given, is called to interrupt a thread blocked on
+        something other than the stop event.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stop.set()
+        if thread is not None and self.pid == os.getpid():
+            if wake is not None:
+                wake()
+            thread.join(timeout)
+
+
+# Schema migrations, applied in order. Each entry is (version, description,
+# step) where step is either an SQL script or a callable taking the
+# connection. Never edit a released migration; append a new one instead.
+MIGRATIONS = [
+    (1, 'initial schema', """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL,
+            name TEXT NOT NULL,
+            email TEXT,
+            department TEXT,
+            class TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS permissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER,
+            faculty_id INTEGER,
+            date DATE NOT NULL,
+            reason TEXT NOT NULL,
+            proof TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (student_id) REFERENCES users (id),
+            FOREIGN KEY (faculty_id) REFERENCES users (id)
+        );
+
+        CREATE TABLE IF NOT EXISTS attendance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER,
+            class_id INTEGER,
+            date DATE NOT NULL,
+            status TEXT NOT NULL,
+            FOREIGN KEY (student_id) REFERENCES users (id)
+        );
+
+        CREATE TABLE IF NOT EXISTS classes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            faculty_id INTEGER,
+            schedule TEXT,
+            room TEXT,
+            FOREIGN KEY (faculty_id) REFERENCES users (id)
+        );
+
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            date DATE NOT NULL,
+            time TEXT,
+            venue TEXT,
+            description TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS student_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER,
+            event_id INTEGER,
+            FOREIGN KEY (student_id) REFERENCES users (id),
+            FOREIGN KEY (event_id) REFERENCES events (id)
+        );
+
+        CREATE TABLE IF NOT EXISTS clubs_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """),
+    (2, 'indexes for dashboard queries', """
+        CREATE INDEX IF NOT EXISTS idx_attendance_student_class_date
+            ON attendance (student_id, class_id, date);
+        CREATE INDEX IF NOT EXISTS idx_attendance_class_date
+            ON attendance (class_id, date);
+        CREATE INDEX IF NOT EXISTS idx_classes_faculty
+            ON classes (faculty_id);
+        CREATE INDEX IF NOT EXISTS idx_permissions_faculty_status
+            ON permissions (faculty_id, status);
+        CREATE INDEX IF NOT EXISTS idx_permissions_student_status
+            ON permissions (student_id, status);
+
+        -- A student can only be signed up for an event once. The unique
+        -- index also serves "WHERE student_id = ?" lookups.
+        DELETE FROM student_events
+        WHERE id NOT IN (SELECT MIN(id) FROM student_events GROUP BY student_id, event_id);
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_student_events_student_event
+            ON student_events (student_id, event_id);
+        CREATE INDEX IF NOT EXISTS idx_student_events_event
+            ON student_events (event_id);
+    """),
+    (3, 'attendance summary maintained by triggers', """
+        CREATE TABLE IF NOT EXISTS attendance_summary (
+            student_id INTEGER NOT NULL,
+            class_id INTEGER NOT NULL,
+            present INTEGER NOT NULL DEFAULT 0,
+            absent INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (student_id, class_id)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_summary_insert
+        AFTER INSERT ON attendance
+        WHEN NEW.student_id IS NOT NULL AND NEW.class_id IS NOT NULL
+        BEGIN
+            INSERT INTO attendance_summary (student_id, class_id, present, absent, total)
+            VALUES (NEW.student_id, NEW.class_id, NEW.status = 'present', NEW.status = 'absent', 1)
+            ON CONFLICT (student_id, class_id) DO UPDATE SET
+                present = present + excluded.present,
+                absent = absent + excluded.absent,
+                total = total + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_summary_delete
+        AFTER DELETE ON attendance
+        WHEN OLD.student_id IS NOT NULL AND OLD.class_id IS NOT NULL
+        BEGIN
+            UPDATE attendance_summary
+            SET present = present - (OLD.status = 'present'),
+                absent = absent - (OLD.status = 'absent'),
+                total = total - 1
+            WHERE student_id = OLD.student_id AND class_id = OLD.class_id;
+            DELETE FROM attendance_summary
+            WHERE student_id = OLD.student_id AND class_id = OLD.class_id AND total <= 0;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_summary_update
+        AFTER UPDATE OF student_id, class_id, status ON attendance
+        BEGIN
+            UPDATE attendance_summary
+            SET present = present - (OLD.status = 'present'),
+                absent = absent - (OLD.status = 'absent'),
+                total = total - 1
+            WHERE student_id = OLD.student_id AND class_id = OLD.class_id;
+            DELETE FROM attendance_summary
+            WHERE student_id = OLD.student_id AND class_id = OLD.class_id AND total <= 0;
+            INSERT INTO attendance_summary (student_id, class_id, present, absent, total)
+            SELECT NEW.student_id, NEW.class_id, NEW.status = 'present', NEW.status = 'absent', 1
+            WHERE NEW.student_id IS NOT NULL AND NEW.class_id IS NOT NULL
+            ON CONFLICT (student_id, class_id) DO UPDATE SET
+                present = present + excluded.present,
+                absent = absent + excluded.absent,
+                total = total + 1;
+        END;
+
+        INSERT INTO attendance_summary (student_id, class_id, present, absent, total)
+        SELECT student_id, class_id, SUM(status = 'present'), SUM(status = 'absent'), COUNT(*)
+        FROM attendance
+        WHERE student_id IS NOT NULL AND class_id IS NOT NULL
+        GROUP BY student_id, class_id;
+    """),
+    (4, 'indexes for admin statistics and user listing', """
+        CREATE INDEX IF NOT EXISTS idx_users_role_name ON users (role, name);
+        CREATE INDEX IF NOT EXISTS idx_users_role_username ON users (role, username);
+        CREATE INDEX IF NOT EXISTS idx_users_role_class ON users (role, class);
+        CREATE INDEX IF NOT EXISTS idx_users_role_department ON users (role, department);
+        CREATE INDEX IF NOT EXISTS idx_permissions_status ON permissions (status);
+    """),
+    (5, 'background import jobs', """
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id TEXT PRIMARY KEY,
+            role TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            chunk_size INTEGER NOT NULL,
+            rows_total INTEGER,
+            rows_processed INTEGER NOT NULL DEFAULT 0,
+            rows_inserted INTEGER NOT NULL DEFAULT 0,
+            rows_failed INTEGER NOT NULL DEFAULT 0,
+            message TEXT,
+            owner_pid INTEGER,
+            created_by INTEGER,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            updated_at REAL NOT NULL,
+            finished_at REAL,
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_import_jobs_status ON import_jobs (status);
+
+        CREATE TABLE IF NOT EXISTS import_job_errors (
+            job_id TEXT NOT NULL,
+            row INTEGER NOT NULL,
+            username TEXT,
+            error TEXT NOT NULL,
+            PRIMARY KEY (job_id, row),
+            FOREIGN KEY (job_id) REFERENCES import_jobs (id)
+        ) WITHOUT ROWID;
+    """),
+    (6, 'one attendance row per student, class and date', """
+        -- Keep the most recent mark where a session was recorded twice; the
+        -- delete trigger keeps attendance_summary in step
+        DELETE FROM attendance
+        WHERE id NOT IN (SELECT MAX(id) FROM attendance GROUP BY student_id, class_id, date);
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_attendance_student_class_date
+            ON attendance (student_id, class_id, date);
+        DROP INDEX IF EXISTS idx_attendance_student_class_date;
+    """),
+    (7, 'class enrollments', """
+        CREATE TABLE IF NOT EXISTS class_enrollments (
+            class_id INTEGER NOT NULL,
+            student_id INTEGER NOT NULL,
+            enrolled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (class_id, student_id),
+            FOREIGN KEY (class_id) REFERENCES classes (id),
+            FOREIGN KEY (student_id) REFERENCES users (id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_class_enrollments_student ON class_enrollments (student_id);
+        -- Until now a class's students were whoever had attendance in it
+        INSERT OR IGNORE INTO class_enrollments (class_id, student_id)
+            SELECT DISTINCT class_id, student_id FROM attendance;
+        -- Import jobs now load enrollments as well as users
+        ALTER TABLE import_jobs RENAME COLUMN role TO kind;
+    """),
+    (8, 'term archives', """
+        -- Closed terms whose attendance and permissions were moved out to
+        -- their own database file (see archive.py)
+        CREATE TABLE IF NOT EXISTS archive_terms (
+            term TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            date_from DATE NOT NULL,
+            date_to DATE NOT NULL,
+            attendance_rows INTEGER NOT NULL DEFAULT 0,
+            permission_rows INTEGER NOT NULL DEFAULT 0,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_archive_terms_dates ON archive_terms (date_from, date_to);
+    """),
+    (9, 'keyset pagination of permissions', """
+        -- Faculty page through their permissions newest first by
+        -- (created_at, id); id is the rowid, which every index ends with.
+        -- The status index supersedes idx_permissions_faculty_status.
+        UPDATE permissions SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_permissions_faculty_created
+            ON permissions (faculty_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_permissions_faculty_status_created
+            ON permissions (faculty_id, status, created_at);
+        DROP INDEX IF EXISTS idx_permissions_faculty_status;
+    """),
+    (10, 'state shared between worker processes', """
+        -- Version stamps of the entities cached pages are built from
+        -- (see cache.SharedVersionStamps)
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            entity TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        -- Live update messages, relayed to the subscribers in every
+        -- process (see pubsub.LogRelay) and pruned after a while
+        CREATE TABLE IF NOT EXISTS stream_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            event TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+    """),
+    (11, 'full-text search of users and events', """
+        -- External-content FTS5 indexes: the text stays in users/events
+        -- and the triggers keep the index in step with every insert,
+        -- update and delete, whichever code path makes it. prefix='1 2 3 4 5 6 7 8'
+        -- serves the typeahead's short prefixes from the index directly.
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            name, username, email, class, department,
+            content='users', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='1 2 3 4 5 6 7 8'
+        );
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, name, username, email, class, department)
+            VALUES (new.id, new.name, new.username, new.email, new.class, new.department);
+        END;
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, name, username, email, class, department)
+            VALUES ('delete', old.id, old.name, old.username, old.email, old.class, old.department);
+        END;
+        CREATE TRIGGER IF NOT EXISTS users_fts_update
+        AFTER UPDATE OF name, username, email, class, department ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, name, username, email, class, department)
+            VALUES ('delete', old.id, old.name, old.username, old.email, old.class, old.department);
+            INSERT INTO users_fts (rowid, name, username, email, class, department)
+            VALUES (new.id, new.name, new.username, new.email, new.class, new.department);
+        END;
+        INSERT INTO users_fts (users_fts) VALUES ('rebuild');
+        -- Rank name matches above username, email, class and department
+        INSERT INTO users_fts (users_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 2.0, 1.0, 1.0)');
+
+        CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+            name, venue, description,
+            content='events', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='1 2 3 4 5 6 7 8'
+        );
+        CREATE TRIGGER IF NOT EXISTS events_fts_insert AFTER INSERT ON events BEGIN
+            INSERT INTO events_fts (rowid, name, venue, description)
+            VALUES (new.id, new.name, new.venue, new.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS events_fts_delete AFTER DELETE ON events BEGIN
+            INSERT INTO events_fts (events_fts, rowid, name, venue, description)
+            VALUES ('delete', old.id, old.name, old.venue, old.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS events_fts_update AFTER UPDATE OF name, venue, description ON events BEGIN
+            INSERT INTO events_fts (events_fts, rowid, name, venue, description)
+            VALUES ('delete', old.id, old.name, old.venue, old.description);
+            INSERT INTO events_fts (rowid, name, venue, description)
+            VALUES (new.id, new.name, new.venue, new.description);
+        END;
+        INSERT INTO events_fts (events_fts) VALUES ('rebuild');
+        INSERT INTO events_fts (events_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 1.0)');
+    """),
+    (12, 'event capacity and waitlist', """
+        -- NULL capacity means unlimited; registrations past it are
+        -- waitlisted, first come first served by id (see registrations.py)
+        ALTER TABLE events ADD COLUMN capacity INTEGER;
+        ALTER TABLE student_events ADD COLUMN status TEXT NOT NULL DEFAULT 'registered';
+        -- Counts an event's registered and waitlisted students from the
+        -- index alone; supersedes idx_student_events_event
+        CREATE INDEX IF NOT EXISTS idx_student_events_event_status
+            ON student_events (event_id, status);
+        DROP INDEX IF EXISTS idx_student_events_event;
+    """),
+    (13, 'attendance sessions stored as bitmaps', """
+        -- Alternative attendance storage, one row per class session (see
+        -- bitmaps.py). A student keeps their roster position for good.
+        CREATE TABLE IF NOT EXISTS class_rosters (
+            class_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            student_id INTEGER NOT NULL,
+            PRIMARY KEY (class_id, position)
+        ) WITHOUT ROWID;
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_class_rosters_student_class
+            ON class_rosters (student_id, class_id);
+        -- Bit i of marked/present is roster position i; size is the roster
+        -- length when the session was written
+        CREATE TABLE IF NOT EXISTS attendance_sessions (
+            class_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            size INTEGER NOT NULL,
+            marked BLOB NOT NULL,
+            present BLOB NOT NULL,
+            PRIMARY KEY (class_id, date)
+        ) WITHOUT ROWID;
+        -- The sessions as attendance rows. SQLite has no function for a
+        -- byte of a blob, so the byte is read back from its hex digits.
+        CREATE VIEW IF NOT EXISTS attendance_marks AS
+        SELECT class_id, date, student_id,
+               CASE WHEN (present_byte >> bit) & 1 THEN 'present' ELSE 'absent' END AS status
+        FROM (
+            SELECT s.class_id, s.date, r.student_id, r.position % 8 AS bit,
+                   instr('123456789ABCDEF', substr(hex(substr(s.marked, r.position / 8 + 1, 1)), 1, 1)) * 16
+                   + instr('123456789ABCDEF', substr(hex(substr(s.marked, r.position / 8 + 1, 1)), 2, 1))
+                       AS marked_byte,
+                   instr('123456789ABCDEF', substr(hex(substr(s.present, r.position / 8 + 1, 1)), 1, 1)) * 16
+                   + instr('123456789ABCDEF', substr(hex(substr(s.present, r.position / 8 + 1, 1)), 2, 1))
+                       AS present_byte
+            FROM attendance_sessions s
+            JOIN class_rosters r ON r.class_id = s.class_id AND r.position < s.size
+        )
+        WHERE (marked_byte >> bit) & 1;
+    """),
+    (14, 'metrics shared between worker processes', """
+        -- Each process's request and query metrics, merged by /metrics in
+        -- whichever process a scrape reaches (see metrics.SharedMetrics)
+        CREATE TABLE IF NOT EXISTS metrics_processes (
+            process TEXT PRIMARY KEY,
+            run TEXT NOT NULL,
+            pid INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            live INTEGER NOT NULL,
+            state TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """),
+]
+
+# Recomputes attendance_summary from the raw attendance rows
+ATTENDANCE_SUMMARY_SQL = """
+    SELECT student_id, class_id, SUM(status = 'present') AS present,
+           SUM(status = 'absent') AS absent, COUNT(*) AS total
+    FROM attendance
+    WHERE student_id IS NOT NULL AND class_id IS NOT NULL
+    GROUP BY student_id, class_id
+"""
+
+
+def _split_statements(script):
+    # complete_statement() knows about trigger bodies, so this only splits
+    # on semicolons that really end a statement
+    statement = ''
+    for piece in script.split(';'):
+        statement += piece + ';'
+        if sqlite3.complete_statement(statement):
+            if statement.strip(' \t\r\n;'):
+                yield statement
+            statement = ''
+
+
+def schema_version(conn):
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone():
+        return 0
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Apply pending migrations and return the versions that were applied.
+
+    A database that is already current costs a single lookup and runs no DDL.
+    """
+    latest = migrations[-1][0] if migrations else 0
+    if schema_version(conn) >= latest:
+        return []
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
     conn.commit()
-    conn.close()
+
+    applied = []
+    for version, description, step in migrations:
+        # IMMEDIATE takes the write lock up front, so two processes starting
+        # together cannot both apply the same migration
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            if callable(step):
+                step(conn)
+            else:
+                for statement in _split_statements(step):
+                    conn.execute(statement)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def check_attendance_summary(conn):
+    """Return the number of (student, class) rows where the summary is wrong."""
+    return conn.execute(f"""
+        SELECT
+            (SELECT COUNT(*) FROM ({ATTENDANCE_SUMMARY_SQL}) r
+             LEFT JOIN attendance_summary s
+                ON s.student_id = r.student_id AND s.class_id = r.class_id
+             WHERE s.present IS NOT r.present OR s.absent IS NOT r.absent
+                OR s.total IS NOT r.total) +
+            (SELECT COUNT(*) FROM attendance_summary s
+             WHERE NOT EXISTS (SELECT 1 FROM attendance a
+                               WHERE a.student_id = s.student_id AND a.class_id = s.class_id))
+    """).fetchone()[0]
+
+
+def rebuild_attendance_summary(conn):
+    """Recompute attendance_summary from scratch in one bulk pass.
+
+    Returns (rows, mismatched) where mismatched is how many rows were wrong
+    before the rebuild. Raises RuntimeError if the rebuilt table still
+    disagrees with the raw attendance rows.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        mismatched = check_attendance_summary(conn)
+        conn.execute('DELETE FROM attendance_summary')
+        conn.execute(f"""
+            INSERT INTO attendance_summary (student_id, class_id, present, absent, total)
+            {ATTENDANCE_SUMMARY_SQL}
+        """)
+        if check_attendance_summary(conn):
+            raise RuntimeError('attendance_summary does not match attendance after rebuild')
+        rows = conn.execute('SELECT COUNT(*) FROM attendance_summary').fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rows, mismatched
+
 
 if __name__ == '__main__':
-    init_db()
-    print("Database initialized successfully!")
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description='College portal database maintenance')
+    parser.add_argument('command', nargs='?', default='migrate', choices=['migrate', 'status', 'rebuild-summary'])
+    parser.add_argument('--db', default='college_portal.db', help='path to the SQLite database')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.command == 'migrate':
+        applied = migrate(conn)
+        if applied:
+            print(f"Applied migrations: {', '.join(map(str, applied))}")
+        print(f"Database schema is at version {schema_version(conn)}")
+    elif args.command == 'status':
+        current = schema_version(conn)
+        for version, description, _ in MIGRATIONS:
+            state = 'applied' if version <= current else 'pending'
+            print(f'{version:>4}  {state:<8} {description}')
+    elif args.command == 'rebuild-summary':
+        rows, mismatched = rebuild_attendance_summary(conn)
+        print(f'Rebuilt attendance_summary: {rows} rows, {mismatched} were out of date')
+    conn.close()
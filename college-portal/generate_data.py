@@ -0,0 +1,200 @@
+"""Fill a database with a synthetic population for benchmarking.
+
+    python generate_data.py --db benchmark.db --students 30000 --faculty 800 \\
+        --classes 2000 --attendance 10000000 --permissions 200000
+
+The demo accounts from init_db (admin/admin123, faculty1, student1, ...)
+are created as usual. Generated users are named gen_student<N> and
+gen_faculty<N> and all have the password "password".
+"""
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+import database
+
+PASSWORD = 'password'
+BATCH_SIZE = 50000
+
+SUBJECTS = ['Mathematics', 'Physics', 'Chemistry', 'Programming', 'Data Structures', 'Electronics',
+            'Mechanics', 'Databases', 'Networks', 'Statistics', 'English', 'Economics']
+DEPARTMENTS = ['Computer Science', 'Electronics', 'Mechanical', 'Civil', 'Electrical', 'Mathematics']
+STUDENT_CLASSES = ['B.Tech CSE', 'B.Tech ECE', 'B.Tech ME', 'B.Tech CE', 'B.Tech EEE']
+REASONS = ['Medical appointment', 'Family function', 'Sports meet', 'Hackathon', 'Club event',
+           'Travel', 'Fever', 'Internship interview']
+PERMISSION_STATUSES = ['pending', 'approved', 'rejected']
+PERMISSION_WEIGHTS = [0.1, 0.7, 0.2]
+
+
+def _batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(conn, sql, rows):
+    count = 0
+    for batch in _batched(rows):
+        conn.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+def _next_id(conn, table):
+    return conn.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+
+
+def _drop_attendance_extras(conn):
+    # Bulk loading is far faster without per-row trigger work and random
+    # index inserts; both are put back (and the summary rebuilt) afterwards
+    saved = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = 'attendance' "
+        "AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+    ).fetchall()
+    for kind, name, _ in saved:
+        conn.execute(f'DROP {kind.upper()} {name}')
+    return [sql for _, _, sql in saved]
+
+
+def generate(conn, students, faculty, classes, attendance, permissions, events, registrations,
+             sessions, days, seed=0, log=print):
+    rng = np.random.default_rng(seed)
+    today = date.today()
+    day_list = [(today - timedelta(days=d)).isoformat() for d in range(days)]
+
+    conn.execute('BEGIN')
+    started = time.time()
+
+    # Faculty and students, with explicit ids so no lookups are needed later
+    faculty_start = _next_id(conn, 'users')
+    _insert(conn, 'INSERT INTO users (id, username, password, role, name, email, department) '
+                  'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((faculty_start + i, f'gen_faculty{i}', PASSWORD, 'faculty', f'Faculty {i}',
+              f'gen_faculty{i}@college.edu', DEPARTMENTS[i % len(DEPARTMENTS)]) for i in range(faculty)))
+    faculty_ids = np.arange(faculty_start, faculty_start + faculty)
+
+    student_start = faculty_start + faculty
+    _insert(conn, 'INSERT INTO users (id, username, password, role, name, email, class) '
+                  'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((student_start + i, f'gen_student{i}', PASSWORD, 'student', f'Student {i}',
+              f'gen_student{i}@college.edu', STUDENT_CLASSES[i % len(STUDENT_CLASSES)]) for i in range(students)))
+    student_ids = np.arange(student_start, student_start + students)
+    log(f'users: {faculty} faculty, {students} students')
+
+    class_start = _next_id(conn, 'classes')
+    class_faculty = rng.choice(faculty_ids, classes)
+    _insert(conn, 'INSERT INTO classes (id, name, faculty_id, schedule, room) VALUES (?, ?, ?, ?, ?)',
+            ((class_start + i, f'{SUBJECTS[i % len(SUBJECTS)]} {i}', int(class_faculty[i]),
+              f'Slot {i % 40}', f'Room {100 + i % 300}') for i in range(classes)))
+    class_ids = np.arange(class_start, class_start + classes)
+    log(f'classes: {classes}')
+
+    # Each class meets on `sessions` distinct days; enough students are
+    # enrolled in each class to produce the requested attendance rows
+    sessions = min(sessions, days)
+    class_days = np.sort(np.array([rng.choice(days, sessions, replace=False) for _ in range(classes)]), axis=1)
+    wanted = -(-attendance // sessions)
+    per_student = np.full(students, wanted // max(students, 1))
+    per_student[:wanted % max(students, 1)] += 1
+    per_student = np.clip(per_student, 1, classes)
+    enrolled = [np.sort(rng.choice(classes, k, replace=False)) for k in per_student]
+    enrollments = _insert(conn, 'INSERT OR IGNORE INTO class_enrollments (class_id, student_id) VALUES (?, ?)',
+                          sorted((int(class_ids[c]), int(student_ids[s]))
+                                 for s in range(students) for c in enrolled[s]))
+    log(f'enrollments: {enrollments}')
+
+    # Attendance, written in (student, class, date) order. Each student has
+    # their own attendance rate so the percentages vary realistically.
+    restore = _drop_attendance_extras(conn)
+    rates = rng.beta(8, 2, students)
+
+    def attendance_rows():
+        remaining = attendance
+        for s in range(students):
+            classes_taken = enrolled[s]
+            dates = class_days[classes_taken]
+            present = rng.random(dates.shape) < rates[s]
+            for k, c in enumerate(classes_taken):
+                for d, p in zip(dates[k], present[k]):
+                    if remaining == 0:
+                        return
+                    remaining -= 1
+                    yield (int(student_ids[s]), int(class_ids[c]), day_list[days - 1 - d],
+                           'present' if p else 'absent')
+
+    written = _insert(conn, 'INSERT INTO attendance (student_id, class_id, date, status) VALUES (?, ?, ?, ?)',
+                      attendance_rows())
+    log(f'attendance: {written} rows ({time.time() - started:.0f}s)')
+    for sql in restore:
+        conn.execute(sql)
+    conn.commit()
+    summary_rows, _ = database.rebuild_attendance_summary(conn)
+    log(f'attendance_summary: {summary_rows} rows ({time.time() - started:.0f}s)')
+
+    conn.execute('BEGIN')
+    statuses = rng.choice(PERMISSION_STATUSES, permissions, p=PERMISSION_WEIGHTS)
+    _insert(conn, 'INSERT INTO permissions (student_id, faculty_id, date, reason, status, created_at) '
+                  'VALUES (?, ?, ?, ?, ?, ?)',
+            ((int(rng.choice(student_ids)), int(rng.choice(faculty_ids)), day_list[int(d)],
+              REASONS[int(r)], str(st), day_list[min(int(d) + 1, days - 1)] + ' 09:00:00')
+             for d, r, st in zip(rng.integers(0, days, permissions), rng.integers(0, len(REASONS), permissions),
+                                 statuses)))
+    log(f'permissions: {permissions}')
+
+    event_start = _next_id(conn, 'events')
+    _insert(conn, 'INSERT INTO events (id, name, date, time, venue, description) VALUES (?, ?, ?, ?, ?, ?)',
+            ((event_start + i, f'Event {i}', (today + timedelta(days=i % 90)).isoformat(), '10:00 AM',
+              f'Hall {i % 10}', 'Generated event') for i in range(events)))
+    if events:
+        registrations = min(registrations, events)
+        _insert(conn, 'INSERT OR IGNORE INTO student_events (student_id, event_id) VALUES (?, ?)',
+                ((int(student_ids[s]), int(event_start + e))
+                 for s in range(students) for e in rng.choice(events, registrations, replace=False)))
+    log(f'events: {events}, {registrations} registrations per student')
+    conn.commit()
+    conn.execute('ANALYZE')
+    log(f'done in {time.time() - started:.0f}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic college portal database')
+    parser.add_argument('--db', default='benchmark.db', help='database to fill (created if missing)')
+    parser.add_argument('--reset', action='store_true', help='delete the database first')
+    parser.add_argument('--students', type=int, default=30000)
+    parser.add_argument('--faculty', type=int, default=800)
+    parser.add_argument('--classes', type=int, default=2000)
+    parser.add_argument('--attendance', type=int, default=10000000)
+    parser.add_argument('--permissions', type=int, default=200000)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--registrations', type=int, default=2, help='event registrations per student')
+    parser.add_argument('--sessions', type=int, default=40, help='sessions per class')
+    parser.add_argument('--days', type=int, default=120, help='days of history to spread sessions over')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.reset:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    # init_db creates the schema and the demo accounts the benchmark logs in with
+    import app
+    app.app.config['DATABASE'] = args.db
+    app.init_db()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -262144')
+    generate(conn, args.students, args.faculty, args.classes, args.attendance, args.permissions,
+             args.events, args.registrations, args.sessions, args.days, seed=args.seed)
+    conn.close()
@@ -0,0 +1,65 @@
+"""gunicorn settings for serving the portal with several processes.
+
+    PORTAL_SECRET_KEY=... PORTAL_DATABASE=/srv/portal/college_portal.db \
+        gunicorn -c gunicorn.conf.py wsgi:app
+
+Server settings come from PORTAL_BIND, PORTAL_WORKERS, PORTAL_THREADS,
+PORTAL_TIMEOUT and PORTAL_GRACEFUL_TIMEOUT; the app reads its own
+PORTAL_* settings in create_app(). PORTAL_STREAM_MAX_OPEN is read by
+both.
+"""
+import os
+import signal
+import threading
+
+import pubsub
+
+bind = os.environ.get('PORTAL_BIND', '127.0.0.1:8000')
+# One process per core. SQLite takes one writer at a time whatever the
+# process count, so more processes than cores only adds contention.
+workers = int(os.environ.get('PORTAL_WORKERS', os.cpu_count() or 1))
+# Each worker serves requests from a thread pool. An open live-update
+# stream (/api/stream) holds one of these threads for as long as it is
+# open, so the pool has PORTAL_THREADS threads for ordinary requests on
+# top of one per stream the app accepts (STREAM_MAX_OPEN); a worker that
+# is full refuses further streams rather than queueing requests behind
+# them. Raise PORTAL_STREAM_MAX_OPEN or the worker count for more open
+# dashboards.
+worker_class = 'gthread'
+stream_max_open = int(os.environ.get('PORTAL_STREAM_MAX_OPEN', pubsub.DEFAULT_MAX_SUBSCRIBERS))
+threads = int(os.environ.get('PORTAL_THREADS', 16)) + stream_max_open
+timeout = int(os.environ.get('PORTAL_TIMEOUT', 60))
+# How long a stopping worker may finish the requests it has
+graceful_timeout = int(os.environ.get('PORTAL_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Import the app and apply migrations once, in the master, before
+# forking. create_app() leaves no SQLite connection or thread behind, and
+# whatever a worker inherits anyway (the connection pool, the stream
+# relay) is set up again in the worker itself.
+preload_app = True
+
+
+def post_worker_init(worker):
+    import app as portal
+
+    # Watch for import jobs whose process died; each is claimed by
+    # exactly one worker
+    portal.resume_import_jobs()
+
+    # On SIGTERM gunicorn stops accepting and waits for open requests,
+    # which live-update streams never finish by themselves: end them
+    # first. Off the signal handler, as it takes the broker's lock.
+    stop = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(signum, frame):
+        threading.Thread(target=portal.close_streams, daemon=True).start()
+        stop(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    import app as portal
+
+    portal.shutdown()
@@ -0,0 +1,224 @@
+import csv
+import io
+import json
+from itertools import islice
+
+# pandas (and openpyxl) are imported inside the functions that use them:
+# they take a few hundred milliseconds and tens of MB to load, and only processes that actually
+# parse an upload should pay for that
+
+# Columns every row must fill in, per role. email is optional.
+REQUIRED_COLUMNS = {
+    'student': ['name', 'username', 'password', 'class'],
+    'faculty': ['name', 'username', 'password', 'department'],
+}
+OPTIONAL_COLUMNS = ['email']
+ENROLLMENT_COLUMNS = ['username', 'class_id']
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def iter_rows(file, filename):
+    """Yield the header and then each data row of an upload as a tuple.
+
+    CSV and xlsx are streamed row by row; the legacy binary xls format has
+    no streaming reader, so it is still read in one go.
+    """
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension == 'csv':
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        try:
+            yield from csv.reader(text)
+        finally:
+            # Hand the binary file back to the caller instead of closing it
+            if not text.closed:
+                text.detach()
+    elif extension == 'xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    elif extension == 'xls':
+        import pandas as pd
+        df = pd.read_excel(file, header=None, dtype=object)
+        yield from df.itertuples(index=False, name=None)
+    else:
+        raise ImportFileError(f'Unsupported file type: {extension}')
+
+
+def _chunks(rows, size):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _existing_usernames(conn, usernames):
+    rows = conn.execute('SELECT username FROM users WHERE username IN (SELECT value FROM json_each(?))',
+                        (json.dumps(usernames),))
+    return {row[0] for row in rows}
+
+
+def count_rows(path):
+    """Best-effort count of data rows in an upload, for progress reporting."""
+    extension = path.rsplit('.', 1)[-1].lower()
+    if extension == 'csv':
+        with open(path, 'rb') as f:
+            lines = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+        return max(lines - 1, 0)
+    if extension == 'xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        return max(max_row - 1, 0) if max_row else None
+    return None
+
+
+def _import(conn, rows, required, optional, insert_chunk, chunk_size=DEFAULT_CHUNK_SIZE, skip_rows=0,
+            on_chunk=None, commit_every_chunk=False):
+    """Stream ``rows`` (as produced by iter_rows) into the database.
+
+    Rows are validated and inserted ``chunk_size`` at a time inside a single
+    transaction. Blank required cells are rejected here; ``insert_chunk(conn,
+    values, errors)`` adds its own per-row errors and inserts the rows that
+    are still valid, returning how many it inserted. Returns a report with
+    the inserted/failed counts and, for each rejected row, its spreadsheet
+    row number and the reason.
+
+    ``on_chunk(conn, report, chunk_errors, rows_processed)`` is called inside
+    the transaction after every chunk. With ``commit_every_chunk`` each chunk
+    is committed on its own, and ``skip_rows`` resumes after rows that an
+    earlier, interrupted run already committed.
+    """
+    import pandas as pd
+
+    rows = iter(rows)
+    header = [str(h).strip().lower() if h is not None else '' for h in next(rows, ())]
+    for column in required:
+        if column not in header:
+            raise ImportFileError(f'Missing required column: {column}')
+    columns = required + [c for c in optional if c in header]
+    positions = [header.index(c) for c in columns]
+
+    report = {'inserted': 0, 'failed': 0, 'errors': [], 'errors_truncated': False}
+    first_row = 2 + skip_rows  # row 1 is the header
+    rows = islice(rows, skip_rows, None)
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for chunk in _chunks(rows, chunk_size):
+            records = [[row[p] if p < len(row) else None for p in positions] for row in chunk]
+            df = pd.DataFrame.from_records(records, columns=columns,
+                                           index=range(first_row, first_row + len(chunk)))
+            first_row += len(chunk)
+
+            values = df.astype('string').apply(lambda s: s.str.strip()).fillna('')
+            values = values[~values.eq('').all(axis=1)]  # skip blank lines
+            chunk_errors = []
+            if not values.empty:
+                errors = pd.Series('', index=values.index, dtype='string')
+                blank = values[required].eq('')
+                missing = blank.any(axis=1)
+                errors[missing] = 'Missing value for ' + blank[missing].idxmax(axis=1)
+
+                report['inserted'] += insert_chunk(conn, values, errors)
+
+                failed = errors[errors != '']
+                chunk_errors = [{'row': int(row), 'username': values.at[row, 'username'], 'error': message}
+                                for row, message in failed.items()]
+                report['failed'] += len(failed)
+                room = MAX_REPORTED_ERRORS - len(report['errors'])
+                if len(failed) > room:
+                    report['errors_truncated'] = True
+                report['errors'].extend(chunk_errors[:max(room, 0)])
+
+            if on_chunk:
+                on_chunk(conn, report, chunk_errors, first_row - 2)
+            if commit_every_chunk:
+                conn.commit()
+                conn.execute('BEGIN IMMEDIATE')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return report
+
+
+def import_users(conn, rows, role, **options):
+    """Insert users of ``role``; see _import for the options and report."""
+    import pandas as pd
+
+    extra_column = 'class' if role == 'student' else 'department'
+    seen = set()
+
+    def insert_chunk(conn, values, errors):
+        usernames = values['username']
+        ok = errors == ''
+        existing = _existing_usernames(conn, usernames[ok].unique().tolist())
+        errors[ok & usernames.isin(existing)] = 'Username already exists'
+        errors[ok & (usernames.duplicated() | usernames.isin(seen))] = 'Duplicate username in file'
+        seen.update(usernames[usernames != ''])
+
+        valid = values[errors == '']
+        if valid.empty:
+            return 0
+        email = valid['email'] if 'email' in valid else pd.Series('', index=valid.index)
+        email = email.astype(object).where(email != '', None)
+        # rowcount leaves out rows written by triggers (users_fts), unlike total_changes
+        return conn.executemany(
+            f'INSERT INTO users (username, password, role, name, email, {extra_column}) '
+            'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (username) DO NOTHING',
+            zip(valid['username'], valid['password'], [role] * len(valid), valid['name'],
+                email, valid[extra_column])
+        ).rowcount
+
+    return _import(conn, rows, REQUIRED_COLUMNS[role], OPTIONAL_COLUMNS, insert_chunk, **options)
+
+
+def import_enrollments(conn, rows, **options):
+    """Enroll students (by username) in classes (by id); see _import."""
+    import pandas as pd
+
+    def insert_chunk(conn, values, errors):
+        class_ids = pd.to_numeric(values['class_id'], errors='coerce')
+        errors[(errors == '') & (class_ids.isna() | (class_ids % 1 != 0))] = 'Invalid class_id'
+
+        ok = errors == ''
+        students = dict(conn.execute(
+            "SELECT username, id FROM users WHERE role = 'student' AND username IN (SELECT value FROM json_each(?))",
+            (json.dumps(values.loc[ok, 'username'].unique().tolist()),)
+        ).fetchall())
+        classes = {row[0] for row in conn.execute(
+            'SELECT id FROM classes WHERE id IN (SELECT value FROM json_each(?))',
+            (json.dumps(class_ids[ok].astype(int).unique().tolist()),)
+        )}
+        student_ids = values['username'].map(students)
+        errors[ok & student_ids.isna()] = 'Unknown student username'
+        errors[(errors == '') & ~class_ids.isin(classes)] = 'Unknown class'
+
+        valid = errors == ''
+        if not valid.any():
+            return 0
+        return conn.executemany(
+            'INSERT INTO class_enrollments (class_id, student_id) VALUES (?, ?) ON CONFLICT DO NOTHING',
+            zip(class_ids[valid].astype(int).tolist(), student_ids[valid].astype(int).tolist())
+        ).rowcount
+
+    return _import(conn, rows, ENROLLMENT_COLUMNS, [], insert_chunk, **options)
+
+
+def import_rows(conn, rows, kind, **options):
+    if kind == 'enrollment':
+        return import_enrollments(conn, rows, **options)
+    return import_users(conn, rows, kind, **options)
@@ -0,0 +1,225 @@
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cache
+import database
+import importer
+
+# A job's owner_pid is the process holding it: the web process that
+# queued it, then the pool process running it. Every web process looks
+# this often for queued or running jobs whose owner is gone and picks
+# them up again.
+DEFAULT_CHECK_SECONDS = 10
+REPORTED_ERRORS = importer.MAX_REPORTED_ERRORS
+KIND_LABELS = {'student': 'students', 'faculty': 'faculty', 'enrollment': 'enrollments'}
+# Cached pages built from these are invalidated by every imported chunk
+# (see cache.SharedVersionStamps)
+CACHE_ENTITIES = ('users', 'classes')
+
+log = logging.getLogger('college_portal.jobs')
+
+
+def create_import_job(conn, path, filename, kind, chunk_size, created_by=None):
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn.execute(
+        'INSERT INTO import_jobs (id, kind, filename, path, chunk_size, owner_pid, created_by, created_at, updated_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (job_id, kind, filename, path, chunk_size, os.getpid(), created_by, now, now)
+    )
+    conn.commit()
+    return job_id
+
+
+def get_job(conn, job_id):
+    row = conn.execute('SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+        return None
+
+    job = {key: row[key] for key in ('id', 'kind', 'filename', 'status', 'rows_total', 'rows_processed',
+                                     'rows_inserted', 'rows_failed', 'message')}
+    # Estimate the time left from the rate so far
+    job['eta_seconds'] = None
+    if row['status'] == 'running' and row['started_at'] and row['rows_total'] and row['rows_processed']:
+        rate = row['rows_processed'] / max(time.time() - row['started_at'], 1e-6)
+        job['eta_seconds'] = round(max(row['rows_total'] - row['rows_processed'], 0) / rate, 1)
+    if row['status'] in ('done', 'failed'):
+        job['errors'] = [dict(e) for e in conn.execute(
+            'SELECT row, username, error FROM import_job_errors WHERE job_id = ? ORDER BY row LIMIT ?',
+            (job_id, REPORTED_ERRORS)
+        )]
+    return job
+
+
+def run_import_job(database_path, job_id, owner_pid):
+    # Runs in a worker process: opens its own connection, never one from
+    # the web process's pool
+    conn = database.connect(database_path)
+    try:
+        job = conn.execute('SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+        if job is None or job['status'] in ('done', 'failed'):
+            return
+
+        now = time.time()
+        rows_total = job['rows_total']
+        if rows_total is None:
+            rows_total = importer.count_rows(job['path'])
+        # Take the job over from the process that queued it, unless another
+        # one claimed it meanwhile (the queuing process died)
+        claimed = conn.execute(
+            "UPDATE import_jobs SET status = 'running', owner_pid = ?, rows_total = ?, "
+            'started_at = COALESCE(started_at, ?), updated_at = ? WHERE id = ? AND owner_pid = ?',
+            (os.getpid(), rows_total, now, now, job_id, owner_pid)
+        ).rowcount
+        conn.commit()
+        if not claimed:
+            return
+
+        inserted_so_far = 0
+
+        def record_progress(conn, report, chunk_errors, rows_processed):
+            # Same transaction as the chunk's inserts, so progress and data
+            # always agree and an interrupted job can resume exactly
+            nonlocal inserted_so_far
+            conn.executemany(
+                'INSERT OR REPLACE INTO import_job_errors (job_id, row, username, error) VALUES (?, ?, ?, ?)',
+                [(job_id, e['row'], e['username'], e['error']) for e in chunk_errors]
+            )
+            conn.execute(
+                'UPDATE import_jobs SET rows_processed = ?, rows_inserted = rows_inserted + ?, '
+                'rows_failed = rows_failed + ?, updated_at = ? WHERE id = ?',
+                (rows_processed, report['inserted'] - inserted_so_far, len(chunk_errors), time.time(), job_id)
+            )
+            cache.bump_versions(conn, CACHE_ENTITIES)
+            inserted_so_far = report['inserted']
+
+        try:
+            with open(job['path'], 'rb') as f:
+                importer.import_rows(conn, importer.iter_rows(f, job['filename']), job['kind'],
+                                     chunk_size=job['chunk_size'], skip_rows=job['rows_processed'],
+                                     on_chunk=record_progress, commit_every_chunk=True)
+        except Exception as e:
+            conn.execute(
+                "UPDATE import_jobs SET status = 'failed', message = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+                (f'Error processing file: {str(e)}', time.time(), time.time(), job_id)
+            )
+        else:
+            counts = conn.execute('SELECT rows_inserted, rows_failed FROM import_jobs WHERE id = ?',
+                                  (job_id,)).fetchone()
+            message = (f"Successfully added {counts['rows_inserted']} {KIND_LABELS[job['kind']]}. "
+                       f"{counts['rows_failed']} failed.")
+            conn.execute(
+                "UPDATE import_jobs SET status = 'done', rows_processed = MAX(rows_processed, COALESCE(rows_total, 0)), "
+                'message = ?, updated_at = ?, finished_at = ? WHERE id = ?',
+                (message, time.time(), time.time(), job_id)
+            )
+        conn.commit()
+        if os.path.exists(job['path']):
+            os.remove(job['path'])
+    finally:
+        conn.close()
+
+
+def _process_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ImportJobRunner:
+    """Runs import jobs in a process pool so pandas work stays off the web threads.
+
+    start() runs a thread that resumes jobs whose owner process has gone
+    away (resume_stale) right away and then every ``check_seconds``.
+    """
+
+    def __init__(self, database_path, workers=2, check_seconds=DEFAULT_CHECK_SECONDS):
+        self.database_path = os.path.abspath(database_path)
+        self.workers = workers
+        self.check_seconds = check_seconds
+        self._executor = None
+        self._lock = threading.Lock()
+        # Jobs this process queued and has not seen finish
+        self._submitted = set()
+        self._thread = database.BackgroundThread(self._run, 'import-jobs')
+
+    def submit(self, job_id):
+        with self._lock:
+            self._submitted.add(job_id)
+            try:
+                future = self._pool().submit(run_import_job, self.database_path, job_id, os.getpid())
+            except BrokenProcessPool:
+                # A pool process died (its job is resumed like any other)
+                self._executor = None
+                future = self._pool().submit(run_import_job, self.database_path, job_id, os.getpid())
+        future.add_done_callback(lambda _: self._submitted.discard(job_id))
+        return future
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn, not fork: the children must not inherit the parent's
+            # SQLite handles or threads
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def resume_stale(self, conn):
+        """Resubmit queued/running jobs whose owner process has gone away."""
+        resumed = []
+        for job in conn.execute(
+            "SELECT id, owner_pid, updated_at FROM import_jobs WHERE status IN ('queued', 'running')"
+        ).fetchall():
+            if job['owner_pid'] == os.getpid():
+                # Ours, unless this pid was reused from a process now gone
+                if job['id'] in self._submitted:
+                    continue
+            elif _process_alive(job['owner_pid']):
+                continue
+            # Compare-and-set so only one process claims the job
+            claimed = conn.execute(
+                'UPDATE import_jobs SET owner_pid = ?, updated_at = ? '
+                'WHERE id = ? AND owner_pid IS ? AND updated_at = ?',
+                (os.getpid(), time.time(), job['id'], job['owner_pid'], job['updated_at'])
+            ).rowcount
+            conn.commit()
+            if claimed:
+                self.submit(job['id'])
+                resumed.append(job['id'])
+        return resumed
+
+    def start(self):
+        """Start watching for jobs to resume, unless this process already is."""
+        self._thread.start()
+
+    def _run(self, stop):
+        while not stop.is_set():
+            try:
+                conn = database.connect(self.database_path)
+                try:
+                    resumed = self.resume_stale(conn)
+                finally:
+                    conn.close()
+                if resumed:
+                    log.info('resumed import jobs %s', ', '.join(resumed))
+            except sqlite3.Error:
+                log.exception('checking for import jobs to resume failed')
+            stop.wait(self.check_seconds)
+
+    def shutdown(self, wait=True):
+        self._thread.stop()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
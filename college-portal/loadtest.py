@@ -0,0 +1,214 @@
+"""Load test the portal over HTTP, served by gunicorn with 1..N workers.
+
+    python generate_data.py --db benchmark.db
+    python loadtest.py --db benchmark.db --workers 1,2,4 --clients 8 --duration 20
+    python loadtest.py --url http://portal.internal:8000 --clients 32
+
+For each worker count a copy of the database is served with
+gunicorn.conf.py and --clients load processes send a read-heavy mix of
+requests (dashboards, the catalog, permission pages and a few permission
+requests) over keep-alive connections for --duration seconds. Throughput,
+latency percentiles and the speedup over the first worker count are
+printed. The load processes compete with the server for CPU, so on a
+single machine the speedup flattens out before the core count; with
+--url the load is sent to a server started elsewhere.
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# generate_data.py gives every generated user this password
+PASSWORD = 'password'
+# Logins are spread over this many generated students and faculty
+USER_SAMPLE = 200
+
+# (role, method, path): relative weight
+HTTP_MIX = {
+    ('student', 'GET', '/student/dashboard'): 30,
+    ('student', 'GET', '/api/get_clubs_events'): 20,
+    ('faculty', 'GET', '/faculty/dashboard'): 15,
+    ('faculty', 'GET', '/api/permissions?status=pending'): 15,
+    ('student', 'POST', '/api/add_permission'): 5,
+}
+
+
+def sample_users(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {role: [row[0] for row in conn.execute(
+            "SELECT username FROM users WHERE role = ? AND username LIKE 'gen_%' ORDER BY id LIMIT ?",
+            (role, USER_SAMPLE))] for role in ('student', 'faculty')}
+    finally:
+        conn.close()
+
+
+class Client:
+    """One keep-alive connection logged in as one user."""
+
+    def __init__(self, url, username, role, password=PASSWORD):
+        parts = urllib.parse.urlsplit(url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        self.login(username, role, password)
+
+    def login(self, username, role, password=PASSWORD):
+        """Log in on this connection; return the session cookie."""
+        self.cookie = ''
+        status, headers, _ = self.request('POST', '/login', urllib.parse.urlencode(
+            {'username': username, 'password': password, 'role': role}),
+            'application/x-www-form-urlencoded')
+        cookie = headers.get('Set-Cookie', '')
+        if status != 302 or not cookie:
+            raise RuntimeError(f'could not log in as {username}')
+        self.cookie = cookie.split(';', 1)[0]
+        return self.cookie
+
+    def request(self, method, path, body=None, content_type='application/json'):
+        headers = {'Cookie': self.cookie} if self.cookie else {}
+        if body is not None:
+            headers['Content-Type'] = content_type
+        self.conn.request(method, path, body, headers)
+        response = self.conn.getresponse()
+        return response.status, response.headers, response.read()
+
+
+def run_client(url, users, duration, seed):
+    """Send the mix for ``duration`` seconds; return (latencies in ms, errors)."""
+    rng = np.random.default_rng(seed)
+    clients = {role: Client(url, names[rng.integers(len(names))], role) for role, names in users.items()}
+    requests = list(HTTP_MIX)
+    weights = np.array(list(HTTP_MIX.values()), dtype=float)
+    weights /= weights.sum()
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        role, method, path = requests[rng.choice(len(requests), p=weights)]
+        body = None
+        if method == 'POST':
+            body = json.dumps({'date': '2030-01-01', 'reason': f'Load test {rng.integers(1 << 30)}'})
+        started = time.perf_counter()
+        try:
+            status, _, _ = clients[role].request(method, path, body)
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            clients[role].conn.close()
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+        if status >= 400:
+            errors += 1
+    return latencies, errors
+
+
+def drive(url, users, clients, duration):
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(run_client, [url] * clients, [users] * clients, [duration] * clients,
+                                range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies = np.array([value for values, _ in results for value in values])
+    summary = {'requests': len(latencies), 'errors': sum(errors for _, errors in results),
+               'throughput': round(len(latencies) / duration, 1), 'elapsed': round(elapsed, 2)}
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = round(float(np.percentile(latencies, p)), 2) if len(latencies) else None
+    return summary
+
+
+def wait_until_up(url, timeout=30):
+    parts = urllib.parse.urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=2)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server at {url} did not come up')
+
+
+def serve(db_path, workers, port, workdir, name=None, settings=None):
+    """Start gunicorn for a copy of ``db_path`` at <workdir>/<name>.db;
+    return the process. ``settings`` are passed on as PORTAL_* variables."""
+    name = name or f'workers-{workers}'
+    copy = os.path.join(workdir, f'{name}.db')
+    source, target = sqlite3.connect(db_path), sqlite3.connect(copy)
+    source.backup(target)
+    target.close()
+    source.close()
+    env = dict(os.environ, PORTAL_DATABASE=copy, PORTAL_UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+               PORTAL_WORKERS=str(workers), PORTAL_BIND=f'127.0.0.1:{port}',
+               PORTAL_SECRET_KEY=json.dumps(os.urandom(16).hex()))
+    env.update({f'PORTAL_{key}': json.dumps(value) for key, value in (settings or {}).items()})
+    return subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                            cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL,
+                            stderr=open(os.path.join(workdir, f'gunicorn-{name}.log'), 'w'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure throughput against the number of worker processes')
+    parser.add_argument('--db', default='benchmark.db', help='database to serve (see generate_data.py)')
+    parser.add_argument('--workers', default=None,
+                        help='comma-separated worker counts (default: 1, 2, 4, ... up to the cores)')
+    parser.add_argument('--url', help='load an already running server instead of starting gunicorn')
+    parser.add_argument('--clients', type=int, default=max(4, 2 * (os.cpu_count() or 1)),
+                        help='concurrent load processes')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load per worker count')
+    parser.add_argument('--port', type=int, default=8765, help='port for the gunicorn under test')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f'{args.db} does not exist; create it with generate_data.py')
+    users = sample_users(args.db)
+    if not users['student'] or not users['faculty']:
+        parser.error(f'{args.db} has no generated users; create it with generate_data.py')
+
+    cores = os.cpu_count() or 1
+    if args.url:
+        runs = [(None, args.url)]
+    else:
+        counts = [int(n) for n in args.workers.split(',')] if args.workers else \
+            sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+        runs = [(n, f'http://127.0.0.1:{args.port}') for n in counts]
+
+    print(f'{cores} cores, {args.clients} load processes, {args.duration:g}s per run')
+    header = f"{'workers':>7} {'requests':>9} {'err':>5} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'speedup':>8}"
+    print(header)
+    print('-' * len(header))
+    workdir = tempfile.mkdtemp(prefix='portal-load-')
+    baseline = None
+    try:
+        for workers, url in runs:
+            server = serve(args.db, workers, args.port, workdir) if workers else None
+            try:
+                wait_until_up(url)
+                result = drive(url, users, args.clients, args.duration)
+            finally:
+                if server is not None:
+                    server.send_signal(signal.SIGTERM)
+                    server.wait(60)
+            baseline = baseline or result['throughput']
+            print(f"{workers or '-':>7} {result['requests']:>9} {result['errors']:>5} {result['throughput']:>9.1f} "
+                  f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                  f"{result['throughput'] / baseline:>7.2f}x")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
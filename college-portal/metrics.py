@@ -0,0 +1,391 @@
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+import database
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_SLOW_QUERY_SECONDS = 0.1
+SLOW_QUERY_HISTORY = 100
+# Statements are labelled by their text, collapsed and cut to this length
+SQL_LABEL_LENGTH = 120
+# How often each process shares its metrics (see SharedMetrics), and how
+# long the rows of an earlier server run are kept
+DEFAULT_SHARE_SECONDS = 5
+STALE_RUN_SECONDS = 3600
+
+log = logging.getLogger('college_portal.metrics')
+slow_query_log = logging.getLogger('college_portal.slow_queries')
+
+# The route (Flask endpoint) the current thread is serving; queries are
+# tagged with it
+current_route = contextvars.ContextVar('current_route', default='-')
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+@contextlib.contextmanager
+def tagged(route):
+    """Tag queries run inside the block with ``route``."""
+    token = current_route.set(route)
+    try:
+        yield
+    finally:
+        current_route.reset(token)
+
+
+def params_shape(params, many=False):
+    """Describe bound parameters without their values, e.g. "(int, str[12])"."""
+    if many:
+        rows = params if isinstance(params, (list, tuple)) else None
+        if not rows:
+            return '[batch]'
+        return f'[{len(rows)} x {params_shape(rows[0])}]'
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{k}: {_shape(v)}' for k, v in params.items()) + '}'
+    return '(' + ', '.join(_shape(v) for v in params) + ')'
+
+
+def _shape(value):
+    if isinstance(value, (str, bytes)):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Request and query timings, in Prometheus form. Safe across threads."""
+
+    def __init__(self, slow_query_seconds=DEFAULT_SLOW_QUERY_SECONDS):
+        self.slow_query_seconds = slow_query_seconds
+        self._lock = threading.Lock()
+        self.requests = collections.defaultdict(Histogram)
+        self.queries = collections.defaultdict(Histogram)
+        self.slow_queries = collections.Counter()
+        self.slow_query_history = collections.deque(maxlen=SLOW_QUERY_HISTORY)
+
+    def observe_request(self, route, method, status, seconds):
+        with self._lock:
+            self.requests[(route, method, str(status))].observe(seconds)
+
+    def observe_query(self, conn, sql, params, many, seconds):
+        route = current_route.get()
+        label = normalize_sql(sql)[:SQL_LABEL_LENGTH]
+        with self._lock:
+            self.queries[(route, label)].observe(seconds)
+        if seconds >= self.slow_query_seconds:
+            self._record_slow(conn, route, sql, params, many, seconds)
+
+    def _record_slow(self, conn, route, sql, params, many, seconds):
+        try:
+            explain_params = params[0] if many and params else params
+            plan = [row[3] for row in sqlite3.Connection.execute(
+                conn, 'EXPLAIN QUERY PLAN ' + sql, explain_params if explain_params is not None else ())]
+        except (sqlite3.Error, TypeError, IndexError, KeyError) as e:
+            plan = [f'(no plan: {e})']
+        entry = {
+            'time': time.time(),
+            'route': route,
+            'sql': normalize_sql(sql),
+            'params': params_shape(params, many),
+            'duration_ms': round(seconds * 1000, 3),
+            'plan': plan,
+        }
+        with self._lock:
+            self.slow_queries[route] += 1
+            self.slow_query_history.append(entry)
+        slow_query_log.warning('slow query (%.1f ms) on %s: %s params=%s plan=%s',
+                               seconds * 1000, route, entry['sql'], entry['params'], ' | '.join(plan))
+
+    def recent_slow_queries(self):
+        with self._lock:
+            return list(self.slow_query_history)
+
+    def state(self):
+        """Everything recorded so far, as JSON-serializable data."""
+        with self._lock:
+            return {
+                'requests': [[labels, list(h.counts), h.total, h.count] for labels, h in self.requests.items()],
+                'queries': [[labels, list(h.counts), h.total, h.count] for labels, h in self.queries.items()],
+                'slow_queries': dict(self.slow_queries),
+                'slow_query_history': list(self.slow_query_history),
+            }
+
+
+class SharedMetrics:
+    """Reports the metrics of every process serving the app, from any one.
+
+    A scrape reaches a single worker, so each process writes its
+    registry's state, with the metrics from ``gauges()``, to the
+    metrics_processes table every ``interval`` seconds, and render()
+    merges the rows. ``connect()`` opens a connection for this.
+
+    Histograms and counters are summed over the processes of this server
+    run, including those that have exited, so they never go down while
+    workers are replaced. Gauges are reported per live process, labelled
+    with its pid.
+    """
+
+    def __init__(self, registry, connect, gauges, interval=DEFAULT_SHARE_SECONDS):
+        self.registry = registry
+        self.connect = connect
+        self.gauges = gauges
+        self.interval = interval
+        # Workers forked from this process (a preloaded app) share its run
+        self.run = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._process = (None, None)
+        self._thread = database.BackgroundThread(self._run, 'metrics')
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._thread.stop(timeout)
+        if self._process[0] == os.getpid():
+            # Last counts of an exiting process; its gauges go with it
+            try:
+                self.publish(live=False)
+            except sqlite3.Error:
+                log.exception('sharing metrics failed')
+
+    def _key(self):
+        with self._lock:
+            pid, key = self._process
+            if pid != os.getpid():
+                # Not the pid: a later process of the run may reuse it
+                key = uuid.uuid4().hex
+                self._process = (os.getpid(), key)
+            return key
+
+    def publish(self, live=True):
+        """Write this process's metrics."""
+        state = self.registry.state()
+        state['gauges'] = {name: metric for name, metric in self.gauges().items()
+                           if live or metric[0] == 'counter'}
+        now = time.time()
+        conn = self.connect()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO metrics_processes (process, run, pid, updated_at, live, state) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (self._key(), self.run, os.getpid(), now, live, json.dumps(state))
+            )
+            conn.execute('DELETE FROM metrics_processes WHERE run != ? AND updated_at < ?',
+                         (self.run, now - STALE_RUN_SECONDS))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def states(self):
+        """The latest state of each process of this run, this one's current."""
+        self.publish()
+        # A process that stopped writing without saying so was killed
+        fresh = time.time() - 3 * self.interval
+        conn = self.connect()
+        try:
+            rows = conn.execute('SELECT pid, updated_at, live, state FROM metrics_processes WHERE run = ?',
+                                (self.run,)).fetchall()
+        finally:
+            conn.close()
+        states = []
+        for pid, updated_at, live, data in rows:
+            state = json.loads(data)
+            state['pid'] = pid
+            state['live'] = bool(live) and updated_at >= fresh
+            states.append(state)
+        return states
+
+    def render(self):
+        """Return every process's metrics in the Prometheus text exposition format."""
+        states = self.states()
+        lines = []
+        _histogram(lines, 'portal_request_duration_seconds', 'Time spent serving requests',
+                   ('route', 'method', 'status'), _merge(state['requests'] for state in states))
+        _histogram(lines, 'portal_db_query_duration_seconds', 'Time spent executing and fetching SQL statements',
+                   ('route', 'query'), _merge(state['queries'] for state in states))
+        slow_queries = collections.Counter()
+        for state in states:
+            slow_queries.update(state['slow_queries'])
+        lines.append('# HELP portal_db_slow_queries_total Statements slower than the slow query threshold')
+        lines.append('# TYPE portal_db_slow_queries_total counter')
+        for route, count in sorted(slow_queries.items()):
+            lines.append(f'portal_db_slow_queries_total{{route="{_escape(route)}"}} {count}')
+        gauges = {}
+        for state in sorted(states, key=lambda state: state['pid']):
+            for name, (kind, help_text, value) in state['gauges'].items():
+                values = gauges.setdefault(name, (kind, help_text, {}))[2]
+                if kind == 'counter':
+                    values[None] = values.get(None, 0) + value
+                elif state['live']:
+                    values[state['pid']] = value
+        for name, (kind, help_text, values) in gauges.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for pid, value in values.items():
+                lines.append(f'{name} {value}' if pid is None else f'{name}{{pid="{pid}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def recent_slow_queries(self):
+        entries = [entry for state in self.states() for entry in state['slow_query_history']]
+        return sorted(entries, key=lambda entry: entry['time'])[-SLOW_QUERY_HISTORY:]
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            try:
+                self.publish()
+            except sqlite3.Error:
+                log.exception('sharing metrics failed')
+
+
+def _merge(series_lists):
+    merged = collections.defaultdict(Histogram)
+    for series in series_lists:
+        for labels, counts, total, count in series:
+            histogram = merged[tuple(labels)]
+            histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+            histogram.total += total
+            histogram.count += count
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram(lines, name, help_text, label_names, series):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for labels, histogram in sorted(series.items()):
+        base = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(label_names, labels))
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{base},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{base},le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{base}}} {histogram.total:.6f}')
+        lines.append(f'{name}_count{{{base}}} {histogram.count}')
+
+
+# The registry every TimedConnection reports to
+registry = Registry()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that times each statement, including the fetches that step it.
+
+    A statement is recorded once it is finished with: when its rows run
+    out, when the cursor runs another statement or is closed, or when the
+    cursor is garbage collected.
+    """
+
+    _sql = None
+
+    def _start(self, sql, params, many):
+        self._finish()
+        self._sql, self._params, self._many, self._elapsed = sql, params, many, 0.0
+
+    def _finish(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            registry.observe_query(self.connection, sql, self._params, self._many, self._elapsed)
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters, False)
+        self._timed(sqlite3.Cursor.execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        # Materialize generators so the parameter shape can be reported
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        self._start(sql, seq_of_parameters, True)
+        self._timed(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+        return self
+
+    def fetchone(self):
+        row = self._timed(sqlite3.Cursor.fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(sqlite3.Cursor.fetchmany, self.arraysize if size is None else size)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(sqlite3.Cursor.fetchall)
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are timed (see TimedCursor)."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
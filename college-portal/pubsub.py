@@ -0,0 +1,280 @@
+import collections
+import itertools
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import database
+
+# Messages a subscriber may have waiting before it is dropped
+DEFAULT_QUEUE_SIZE = 64
+# Open subscriptions a broker takes; each holds a server thread
+DEFAULT_MAX_SUBSCRIBERS = 64
+# How often each process polls the shared message log, and how long
+# messages are kept there
+DEFAULT_POLL_SECONDS = 0.25
+DEFAULT_RETAIN_SECONDS = 600
+RELAY_BATCH_SIZE = 500
+
+log = logging.getLogger('college_portal.pubsub')
+
+Message = collections.namedtuple('Message', 'seq channel event data')
+
+# Put on a dropped subscriber's queue to end its stream
+_CLOSED = object()
+
+
+class Subscription:
+    def __init__(self, broker, channels, queue_size):
+        self.broker = broker
+        self.channels = frozenset(channels)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.since = 0
+        self.dropped = False
+
+    def get(self, timeout=None):
+        """Return the next Message, or None if none arrived within ``timeout``.
+
+        Raises Dropped once the broker has given up on this subscriber.
+        """
+        try:
+            message = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if message is _CLOSED:
+            raise Dropped()
+        return message
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Dropped(Exception):
+    """The subscriber fell too far behind and was disconnected."""
+
+
+class Busy(Exception):
+    """The broker has as many subscribers as it takes."""
+
+
+class Broker:
+    """In-process publish/subscribe for pushing updates to open pages.
+
+    Each subscriber has a bounded queue. publish() never blocks: a
+    subscriber whose queue is full is dropped rather than buffered for,
+    and can reconnect and catch up (see LogRelay.replay).
+    subscribe() raises Busy beyond ``max_subscribers`` (None for no limit).
+    Only reaches subscribers in the same process; LogRelay carries
+    messages between processes.
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, max_subscribers=DEFAULT_MAX_SUBSCRIBERS, boot=None):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._channels = collections.defaultdict(set)
+        self._subscriptions = set()
+        self._ids = itertools.count(1)
+        # Message ids are only meaningful to the broker that issued them,
+        # unless the sequence numbers come from somewhere shared (LogRelay)
+        self.boot = boot or uuid.uuid4().hex[:8]
+        self.last_seq = 0
+        self.published = 0
+        self.dropped = 0
+        self.refused = 0
+        self.closed = False
+
+    def subscribe(self, channels):
+        """Return a Subscription; its ``since`` is the seq of the last
+        message published before it, all later ones reach its queue."""
+        subscription = Subscription(self, channels, self.queue_size)
+        with self._lock:
+            subscription.since = self.last_seq
+            if self.closed:
+                subscription.queue.put_nowait(_CLOSED)
+                return subscription
+            if self.max_subscribers is not None and len(self._subscriptions) >= self.max_subscribers:
+                self.refused += 1
+                raise Busy()
+            self._subscriptions.add(subscription)
+            for channel in subscription.channels:
+                self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._remove(subscription)
+
+    def _remove(self, subscription):
+        self._subscriptions.discard(subscription)
+        for channel in subscription.channels:
+            subscribers = self._channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[channel]
+
+    def publish(self, channel, event, data, seq=None):
+        """Publish a message; ``seq`` overrides the broker's own numbering
+        and must keep increasing."""
+        with self._lock:
+            message = Message(next(self._ids) if seq is None else seq, channel, event, data)
+            self.last_seq = message.seq
+            self.published += 1
+            for subscription in list(self._channels.get(channel, ())):
+                try:
+                    subscription.queue.put_nowait(message)
+                except queue.Full:
+                    self._drop(subscription)
+                    self.dropped += 1
+        return message
+
+    def close(self):
+        """End every stream and refuse new ones, e.g. when shutting down."""
+        with self._lock:
+            self.closed = True
+            for subscription in list(self._subscriptions):
+                self._drop(subscription)
+
+    def _drop(self, subscription):
+        self._remove(subscription)
+        subscription.dropped = True
+        # Discard the backlog so the subscriber sees the close right away
+        while True:
+            try:
+                subscription.queue.get_nowait()
+            except queue.Empty:
+                break
+        subscription.queue.put_nowait(_CLOSED)
+
+    def message_id(self, seq):
+        return f'{self.boot}-{seq}'
+
+    def parse_id(self, message_id):
+        """The sequence number in an id from message_id(), or None if the
+        id was not issued by this broker."""
+        boot, _, seq = (message_id or '').partition('-')
+        return int(seq) if boot == self.boot and seq.isdigit() else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscriptions),
+                'channels': len(self._channels),
+                'published': self.published,
+                'dropped': self.dropped,
+                'refused': self.refused,
+            }
+
+
+class LogRelay:
+    """Feeds a Broker from the stream_messages table.
+
+    Every process serving the same database has its own Broker. Publishers
+    append messages to the table (see append) and each process polls it
+    from a background thread, so subscribers in all of them get every
+    message, numbered by its row id. The ids are therefore the same in
+    every process and a browser can resume on any of them. ``connect()``
+    opens the relay's own connection.
+    """
+
+    def __init__(self, broker, connect, poll_seconds=DEFAULT_POLL_SECONDS, retain_seconds=DEFAULT_RETAIN_SECONDS):
+        self.broker = broker
+        self.connect = connect
+        self.poll_seconds = poll_seconds
+        self.retain_seconds = retain_seconds
+        self._thread = database.BackgroundThread(self._run, 'stream-relay')
+
+    def replay(self, conn, channels, last_id):
+        """Messages on ``channels`` added after ``last_id``, read from the table.
+
+        Works in any process, whether or not its relay has seen them yet.
+        Returns None when they can no longer be recovered: the id is not
+        from this log, or messages after it have been pruned.
+        """
+        seq = self.broker.parse_id(last_id)
+        if seq is None:
+            return None
+        oldest, newest = conn.execute('''
+            SELECT MIN(id), (SELECT seq FROM sqlite_sequence WHERE name = 'stream_messages')
+            FROM stream_messages
+        ''').fetchone()
+        newest = newest or 0
+        if seq > newest or (seq < newest and (oldest is None or oldest > seq + 1)):
+            return None
+        rows = conn.execute('''
+            SELECT id, channel, event, data FROM stream_messages
+            WHERE id > ? AND channel IN (SELECT value FROM json_each(?))
+            ORDER BY id
+        ''', (seq, json.dumps(sorted(channels)))).fetchall()
+        return [Message(row[0], row[1], row[2], json.loads(row[3])) for row in rows]
+
+    @staticmethod
+    def append(conn, messages):
+        """Add (channel, event, data) messages inside the caller's transaction."""
+        now = time.time()
+        conn.executemany(
+            'INSERT INTO stream_messages (channel, event, data, created_at) VALUES (?, ?, ?, ?)',
+            [(channel, event, json.dumps(data), now) for channel, event, data in messages]
+        )
+
+    def start(self):
+        """Start relaying, unless already running in this process.
+
+        Only messages added after this returns are relayed.
+        """
+        self._thread.start(self._prepare)
+
+    def _prepare(self):
+        conn = self.connect()
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM stream_messages').fetchone()[0]
+        # Subscribers start from here (Subscription.since); nothing is
+        # published in this process before the relay thread starts
+        self.broker.last_seq = max(self.broker.last_seq, last_id)
+        return conn, last_id
+
+    def stop(self, timeout=5):
+        self._thread.stop(timeout)
+
+    def _run(self, stop, conn, last_id):
+        pruned = time.monotonic()
+        try:
+            while not stop.is_set():
+                rows = []
+                try:
+                    rows = conn.execute(
+                        'SELECT id, channel, event, data FROM stream_messages WHERE id > ? ORDER BY id LIMIT ?',
+                        (last_id, RELAY_BATCH_SIZE)
+                    ).fetchall()
+                    for row in rows:
+                        self.broker.publish(row[1], row[2], json.loads(row[3]), seq=row[0])
+                        last_id = row[0]
+                    if time.monotonic() - pruned >= self.retain_seconds / 10:
+                        conn.execute('DELETE FROM stream_messages WHERE created_at < ?',
+                                     (time.time() - self.retain_seconds,))
+                        conn.commit()
+                        pruned = time.monotonic()
+                except sqlite3.Error:
+                    log.exception('relaying stream messages failed; retrying')
+                    if conn.in_transaction:
+                        conn.rollback()
+                if len(rows) < RELAY_BATCH_SIZE:
+                    stop.wait(self.poll_seconds)
+        finally:
+            conn.close()
+
+
+def format_sse(event, data, id=None):
+    """Encode one Server-Sent Events message. With ``event`` None only
+    the id is sent: the browser resumes from it but fires no event."""
+    lines = []
+    if id is not None:
+        lines.append(f'id: {id}')
+    if event is not None:
+        lines.append(f'event: {event}')
+        lines.extend(f'data: {line}' for line in json.dumps(data).splitlines())
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
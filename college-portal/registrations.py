@@ -0,0 +1,240 @@
+"""Event registration with capacity limits and a waitlist.
+
+When registration for a popular event opens, thousands of students
+register within a minute. Rather than every request taking SQLite's
+write lock for a one-row transaction of its own, requests hand their
+registration to a RegistrationQueue: one writer thread per process takes
+everything that queued up while the previous batch was being written and
+applies it in a single transaction (group commit). Capacity is checked
+inside that transaction, which holds the write lock from the start, so a
+registration can never push an event past its capacity, however many
+processes are writing.
+
+An event with capacity NULL takes any number of registrations. Once it
+is full, further registrations go on the waitlist, and whenever a
+registered student cancels, the first student on the waitlist moves up.
+"""
+import json
+import logging
+import os
+import queue
+from concurrent.futures import Future
+from datetime import date
+
+import cache
+import database
+
+REGISTERED = 'registered'
+WAITLISTED = 'waitlisted'
+
+REGISTER = 'register'
+CANCEL = 'cancel'
+
+# Results of register() / cancel(), besides REGISTERED and WAITLISTED
+ALREADY_REGISTERED = 'already_registered'
+ALREADY_WAITLISTED = 'already_waitlisted'
+NOT_REGISTERED = 'not_registered'
+CANCELLED = 'cancelled'
+NO_EVENT = 'no_event'
+CLOSED = 'closed'
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_TIMEOUT_SECONDS = 10
+
+log = logging.getLogger('college_portal.registrations')
+
+_STOP = object()
+
+
+def entity(student_id):
+    """Cache entity of a student's registrations (see cache.VersionStamps)."""
+    return f'events:{student_id}'
+
+
+class _Events:
+    """Capacity and head counts of the events a batch touches, read once
+    per batch and kept up to date as the batch is applied."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.today = date.today().isoformat()
+        self._events = {}
+
+    def get(self, event_id):
+        if event_id not in self._events:
+            row = self.conn.execute('''
+                SELECT e.capacity, e.date,
+                    (SELECT COUNT(*) FROM student_events
+                     WHERE event_id = e.id AND status = 'registered') as registered,
+                    (SELECT COUNT(*) FROM student_events
+                     WHERE event_id = e.id AND status = 'waitlisted') as waitlisted
+                FROM events e WHERE e.id = ?
+            ''', (event_id,)).fetchone()
+            self._events[event_id] = None if row is None else dict(zip(
+                ('capacity', 'date', 'registered', 'waitlisted'), row))
+        return self._events[event_id]
+
+
+def _register(conn, events, student_id, event_id):
+    event = events.get(event_id)
+    if event is None:
+        return {'result': NO_EVENT}
+    row = conn.execute('SELECT status FROM student_events WHERE student_id = ? AND event_id = ?',
+                       (student_id, event_id)).fetchone()
+    if row is not None:
+        return {'result': ALREADY_REGISTERED if row[0] == REGISTERED else ALREADY_WAITLISTED}
+    if event['date'] < events.today:
+        return {'result': CLOSED}
+    if event['capacity'] is None or event['registered'] < event['capacity']:
+        status = REGISTERED
+    else:
+        status = WAITLISTED
+    conn.execute('INSERT INTO student_events (student_id, event_id, status) VALUES (?, ?, ?)',
+                 (student_id, event_id, status))
+    event[status] += 1
+    result = {'result': status}
+    if status == WAITLISTED:
+        result['position'] = event['waitlisted']
+    return result
+
+
+def _cancel(conn, events, student_id, event_id):
+    """Returns (result, student moved up from the waitlist or None, whether
+    the waitlist moved)."""
+    event = events.get(event_id)
+    if event is None:
+        return {'result': NO_EVENT}, None, False
+    row = conn.execute('SELECT id, status FROM student_events WHERE student_id = ? AND event_id = ?',
+                       (student_id, event_id)).fetchone()
+    if row is None:
+        return {'result': NOT_REGISTERED}, None, False
+    conn.execute('DELETE FROM student_events WHERE id = ?', (row[0],))
+    event[row[1]] -= 1
+    promoted = None
+    if row[1] == REGISTERED and event['waitlisted'] and (
+            event['capacity'] is None or event['registered'] < event['capacity']):
+        first_id, promoted = conn.execute('''
+            SELECT id, student_id FROM student_events
+            WHERE event_id = ? AND status = 'waitlisted'
+            ORDER BY id LIMIT 1
+        ''', (event_id,)).fetchone()
+        conn.execute("UPDATE student_events SET status = 'registered' WHERE id = ?", (first_id,))
+        event[REGISTERED] += 1
+        event[WAITLISTED] -= 1
+    return {'result': CANCELLED}, promoted, row[1] == WAITLISTED or promoted is not None
+
+
+def apply(conn, requests):
+    """Apply (op, student_id, event_id) requests in one transaction, in order.
+
+    Returns one result dict per request, e.g. {'result': 'waitlisted',
+    'position': 3}. Cached pages of every student affected are
+    invalidated in the same transaction: those who registered or
+    cancelled, and everyone on a waitlist that moved up.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        events = _Events(conn)
+        results, students, moved = [], set(), set()
+        for op, student_id, event_id in requests:
+            if op == REGISTER:
+                result = _register(conn, events, student_id, event_id)
+            else:
+                result, promoted, waitlist_moved = _cancel(conn, events, student_id, event_id)
+                if waitlist_moved:
+                    moved.add(event_id)
+                if promoted is not None:
+                    students.add(promoted)
+            if result['result'] in (REGISTERED, WAITLISTED, CANCELLED):
+                students.add(student_id)
+            results.append(result)
+        if moved:
+            # Their waitlist positions changed
+            students.update(row[0] for row in conn.execute(
+                "SELECT student_id FROM student_events WHERE status = 'waitlisted' "
+                'AND event_id IN (SELECT value FROM json_each(?))', (json.dumps(sorted(moved)),)))
+        if students:
+            cache.bump_versions(conn, [entity(student_id) for student_id in students])
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return results
+
+
+class RegistrationQueue:
+    """Single writer that applies queued registrations in batches.
+
+    ``connect()`` opens the writer's own connection. submit() returns a
+    Future for the request's result dict. The writer thread is started on
+    first use in each process (threads do not survive a fork).
+    """
+
+    def __init__(self, connect, batch_size=DEFAULT_BATCH_SIZE):
+        self.connect = connect
+        self.batch_size = batch_size
+        self._queue = queue.SimpleQueue()
+        self._thread = database.BackgroundThread(self._run, 'registrations')
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, op, student_id, event_id):
+        if op not in (REGISTER, CANCEL):
+            raise ValueError(f'unknown operation {op!r}')
+        self.start()
+        future = Future()
+        self._queue.put((future, (op, student_id, event_id)))
+        return future
+
+    def start(self):
+        self._thread.start(self._prepare)
+
+    def _prepare(self):
+        if self._thread.pid not in (None, os.getpid()):
+            # Requests queued in the parent belong to its writer
+            self._queue = queue.SimpleQueue()
+        return (self._queue,)
+
+    def stop(self, timeout=5):
+        self._thread.stop(timeout, wake=lambda: self._queue.put(_STOP))
+
+    def stats(self):
+        return {'batches': self.batches, 'requests': self.requests, 'queued': self._queue.qsize()}
+
+    def _run(self, stop, pending):
+        conn = self.connect()
+        try:
+            while True:
+                item = pending.get()
+                batch = []
+                # Everything that arrived while the last batch was written
+                # goes into this one
+                while item is not _STOP:
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                if batch:
+                    self._write(conn, batch)
+                if item is _STOP:
+                    return
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        futures = [future for future, _ in batch]
+        try:
+            results = apply(conn, [request for _, request in batch])
+        except Exception as e:
+            # Fail this batch only; the writer keeps serving the queue
+            log.exception('writing %d registrations failed', len(batch))
+            for future in futures:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.requests += len(batch)
+        for future, result in zip(futures, results):
+            future.set_result(result)
@@ -0,0 +1,194 @@
+"""Read-only snapshot of the live database for report-class queries.
+
+    python replica.py snapshot [--db college_portal.db] [--replica PATH]
+    python replica.py status [--db college_portal.db] [--replica PATH]
+
+take_snapshot() copies the live database with SQLite's online backup API
+into a new file and renames it over the replica, so a snapshot is never
+seen half written and readers of the previous one are not disturbed. In
+WAL mode the copy is a single read transaction, which never blocks
+writers. The time the copy started is stored in the snapshot itself
+(snapshot_info), so every snapshot carries its own age.
+"""
+import logging
+import os
+import sqlite3
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots are not coordinated between processes
+    fcntl = None
+
+import database
+
+DEFAULT_INTERVAL_SECONDS = 120
+DEFAULT_MAX_STALENESS_SECONDS = 600
+
+log = logging.getLogger('college_portal.replica')
+
+
+def default_path(database_path):
+    root, ext = os.path.splitext(database_path)
+    return f'{root}.replica{ext or ".db"}'
+
+
+def take_snapshot(source_path, replica_path):
+    """Copy ``source_path`` over ``replica_path``; return the snapshot time."""
+    taken_at = time.time()
+    temp_path = f'{replica_path}.{os.getpid()}.tmp'
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(temp_path)
+    try:
+        source.backup(target)
+        # A rollback-journal file can be opened read-only without the
+        # -wal/-shm files a WAL database needs next to it
+        target.execute('PRAGMA journal_mode = DELETE')
+        target.execute('CREATE TABLE IF NOT EXISTS snapshot_info (taken_at REAL NOT NULL)')
+        target.execute('DELETE FROM snapshot_info')
+        target.execute('INSERT INTO snapshot_info (taken_at) VALUES (?)', (taken_at,))
+        target.commit()
+    except BaseException:
+        target.close()
+        os.remove(temp_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.replace(temp_path, replica_path)
+    return taken_at
+
+
+def snapshot_time(replica_path):
+    """Return when the snapshot at ``replica_path`` was taken, or None."""
+    try:
+        conn = database.connect(replica_path, pragmas={}, read_only=True)
+    except sqlite3.OperationalError:
+        return None
+    try:
+        row = conn.execute('SELECT taken_at FROM snapshot_info').fetchone()
+        return row[0] if row else None
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+class Replica:
+    """Keeps a snapshot of ``source_path`` no more than ``interval`` old.
+
+    A background thread in each process refreshes it; a lock file makes
+    sure only one process at a time does the copy. connect() hands out
+    read-only connections to the snapshot while it is fresh enough.
+    ``on_snapshot(taken_at)`` is called after every snapshot this process
+    takes.
+    """
+
+    def __init__(self, source_path, path=None, interval=DEFAULT_INTERVAL_SECONDS,
+                 max_staleness=DEFAULT_MAX_STALENESS_SECONDS, connect_options=None, on_snapshot=None):
+        self.source_path = source_path
+        self.path = path or default_path(source_path)
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self.connect_options = connect_options or {}
+        self.on_snapshot = on_snapshot
+        self._thread = database.BackgroundThread(self._run, 'replica')
+        # (mtime, taken_at) of the snapshot file last looked at
+        self._seen = (None, None)
+        self.snapshots = 0
+        self.failures = 0
+
+    def taken_at(self):
+        """When the current snapshot was taken, or None if there is none."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        seen_mtime, taken_at = self._seen
+        if mtime != seen_mtime:
+            taken_at = snapshot_time(self.path)
+            self._seen = (mtime, taken_at)
+        return taken_at
+
+    def age(self):
+        taken_at = self.taken_at()
+        return None if taken_at is None else time.time() - taken_at
+
+    def connect(self, max_staleness=None):
+        """Return (read-only connection, snapshot time), or (None, None)
+        when there is no snapshot within ``max_staleness`` seconds."""
+        self.start()
+        max_staleness = self.max_staleness if max_staleness is None else max_staleness
+        taken_at = self.taken_at()
+        if taken_at is None or time.time() - taken_at > max_staleness:
+            return None, None
+        try:
+            return database.connect(self.path, read_only=True, **self.connect_options), taken_at
+        except sqlite3.OperationalError:
+            return None, None
+
+    def refresh(self, force=False):
+        """Take a snapshot if the current one is older than the interval.
+
+        Returns the new snapshot time, or None if none was taken (it was
+        fresh enough, or another process is taking one).
+        """
+        with open(f'{self.path}.lock', 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+            # Another process may have refreshed it while we waited
+            age = self.age()
+            if not force and age is not None and age < self.interval:
+                return None
+            started = time.perf_counter()
+            taken_at = take_snapshot(self.source_path, self.path)
+            self.snapshots += 1
+            log.info('snapshot of %s taken in %.0f ms', self.source_path, (time.perf_counter() - started) * 1000)
+        if self.on_snapshot:
+            self.on_snapshot(taken_at)
+        return taken_at
+
+    def start(self):
+        """Start the refresher thread, unless it runs in this process already."""
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._thread.stop(timeout)
+
+    def _run(self, stop):
+        while not stop.is_set():
+            try:
+                self.refresh()
+            except (OSError, sqlite3.Error):
+                self.failures += 1
+                log.exception('taking a snapshot of %s failed', self.source_path)
+            age = self.age()
+            stop.wait(max(self.interval - (age or 0), 1))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Snapshot the college portal database for reports')
+    parser.add_argument('command', choices=['snapshot', 'status'])
+    parser.add_argument('--db', default='college_portal.db', help='path to the live database')
+    parser.add_argument('--replica', help='path of the snapshot (default: <db>.replica.db)')
+    args = parser.parse_args()
+
+    replica = Replica(args.db, args.replica)
+    if args.command == 'snapshot':
+        taken_at = replica.refresh(force=True)
+        if taken_at is None:
+            print('Another process is taking a snapshot')
+        else:
+            print(f'Snapshot of {args.db} written to {replica.path}')
+    else:
+        taken_at = replica.taken_at()
+        if taken_at is None:
+            print(f'No snapshot at {replica.path}')
+        else:
+            print(f'{replica.path}: taken {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(taken_at))}, '
+                  f'{time.time() - taken_at:.0f}s ago')
@@ -0,0 +1,219 @@
+import csv
+import io
+import os
+import tempfile
+
+# pandas is only needed for the xlsx summaries and is imported there
+
+FETCH_SIZE = 1000
+FILE_BLOCK_SIZE = 64 * 1024
+# An xlsx worksheet holds at most 1,048,576 rows including the header;
+# longer exports continue on further sheets
+MAX_SHEET_ROWS = 1048575
+# Fold the per-chunk summary partials together after this many chunks
+COMBINE_EVERY = 32
+
+ATTENDANCE_COLUMNS = ['date', 'class_id', 'class', 'student_id', 'username', 'student', 'status']
+PERMISSION_COLUMNS = ['id', 'date', 'student_id', 'username', 'student', 'faculty', 'reason', 'status',
+                      'created_at']
+
+
+def attendance_query(schema='main', class_id=None, student_id=None, date_from=None, date_to=None,
+                     faculty_id=None, table='attendance'):
+    """Build the export query for attendance; ``faculty_id`` limits it to that faculty's classes.
+
+    ``schema`` selects the live database or an attached term archive;
+    ``table`` is 'attendance' or the bitmap sessions' attendance_marks view.
+    """
+    where, params = [], []
+    if class_id is not None:
+        where.append('a.class_id = ?')
+        params.append(class_id)
+    if student_id is not None:
+        where.append('a.student_id = ?')
+        params.append(student_id)
+    if date_from:
+        where.append('a.date >= ?')
+        params.append(date_from)
+    if date_to:
+        where.append('a.date <= ?')
+        params.append(date_to)
+    if faculty_id is not None:
+        where.append('c.faculty_id = ?')
+        params.append(faculty_id)
+
+    # Ordered along idx_attendance_class_date so SQLite can walk the index
+    # instead of sorting the whole result first
+    sql = f'''
+        SELECT a.date, a.class_id, c.name, a.student_id, u.username, u.name, a.status
+        FROM {schema}.{table} a
+        JOIN main.classes c ON c.id = a.class_id
+        JOIN main.users u ON u.id = a.student_id
+    '''
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY a.class_id, a.date'
+    return sql, params
+
+
+def permissions_query(schema='main', status=None, date_from=None, date_to=None, faculty_id=None):
+    where, params = [], []
+    if status:
+        where.append('p.status = ?')
+        params.append(status)
+    if date_from:
+        where.append('p.date >= ?')
+        params.append(date_from)
+    if date_to:
+        where.append('p.date <= ?')
+        params.append(date_to)
+    if faculty_id is not None:
+        where.append('p.faculty_id = ?')
+        params.append(faculty_id)
+
+    sql = f'''
+        SELECT p.id, p.date, p.student_id, s.username, s.name, f.name, p.reason, p.status, p.created_at
+        FROM {schema}.permissions p
+        LEFT JOIN main.users s ON s.id = p.student_id
+        LEFT JOIN main.users f ON f.id = p.faculty_id
+    '''
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY p.id'
+    return sql, params
+
+
+def _fetch_chunks(conn, queries, size=FETCH_SIZE):
+    # queries yields (sql, params) pairs; each is run to completion, and its
+    # cursor closed, before the next one is asked for
+    for sql, params in queries:
+        cursor = conn.execute(sql, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+
+def iter_csv(conn, queries, columns):
+    """Yield the export as CSV, one encoded block per fetched chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in _fetch_chunks(conn, queries):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+# Summary sheets: partial group-bys are taken for every fetched chunk and
+# added together at the end, so the summaries never need all rows at once
+
+def _attendance_partials(df):
+    df = df.assign(present=(df['status'] == 'present').astype('int64'), total=1)
+    by_student = df.groupby(['student_id', 'username', 'student'], dropna=False)[['present', 'total']].sum()
+    by_class = df.groupby(['class_id', 'class'], dropna=False)[['present', 'total']].sum()
+    return {'By student': by_student, 'By class': by_class}
+
+
+def _attendance_summary(frame):
+    frame = frame.assign(absent=frame['total'] - frame['present'],
+                         percentage=(frame['present'] / frame['total'] * 100).round(1))
+    return frame[['present', 'absent', 'total', 'percentage']]
+
+
+def _permission_partials(df):
+    counts = df.groupby(['student_id', 'username', 'student', 'status'], dropna=False).size()
+    by_faculty = df.groupby([df['faculty'].fillna(''), 'status'], dropna=False).size()
+    return {'By student': counts, 'By faculty': by_faculty}
+
+
+def _permission_summary(counts):
+    return counts.unstack('status', fill_value=0).assign(total=lambda f: f.sum(axis=1))
+
+
+def _combine(parts):
+    import pandas as pd
+
+    grouped = pd.concat(parts)
+    return grouped.groupby(level=list(range(grouped.index.nlevels)), dropna=False).sum()
+
+
+SUMMARIES = {
+    'attendance': (_attendance_partials, _attendance_summary),
+    'permissions': (_permission_partials, _permission_summary),
+}
+
+
+def write_xlsx(conn, queries, columns, title, summary=None):
+    """Write the export to a temporary xlsx file and return its path.
+
+    The workbook is written in openpyxl's write-only mode, so rows go
+    straight to disk as they are fetched and memory stays flat. It cannot
+    be streamed, though: an xlsx file is a zip archive that is only
+    complete once every row is in, so nothing reaches the client until
+    the whole range has been read. Large ranges are better exported as
+    CSV (iter_csv), which is sent as it is fetched.
+    """
+    import pandas as pd
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheets = 0
+    sheet_rows = MAX_SHEET_ROWS
+    partials = {}
+    partial_fn, summary_fn = SUMMARIES[summary] if summary else (None, None)
+    for rows in _fetch_chunks(conn, queries):
+        for row in rows:
+            if sheet_rows == MAX_SHEET_ROWS:
+                sheets += 1
+                sheet = workbook.create_sheet(title if sheets == 1 else f'{title} ({sheets})')
+                sheet.append(columns)
+                sheet_rows = 0
+            sheet.append(tuple(row))
+            sheet_rows += 1
+        if partial_fn:
+            df = pd.DataFrame.from_records([tuple(r) for r in rows], columns=columns)
+            for name, partial in partial_fn(df).items():
+                parts = partials.setdefault(name, [])
+                parts.append(partial)
+                if len(parts) >= COMBINE_EVERY:
+                    parts[:] = [_combine(parts)]
+
+    if not sheets:
+        workbook.create_sheet(title).append(columns)
+    for name, parts in partials.items():
+        frame = summary_fn(_combine(parts)).reset_index()
+        summary_sheet = workbook.create_sheet(name)
+        summary_sheet.append([str(c) for c in frame.columns])
+        for row in frame.itertuples(index=False, name=None):
+            summary_sheet.append([v.item() if hasattr(v, 'item') else v for v in row])
+
+    handle, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(handle)
+    try:
+        workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def iter_file(path, remove=True):
+    """Yield a file in blocks, deleting it once it has been sent."""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(FILE_BLOCK_SIZE)
+                if not block:
+                    return
+                yield block
+    finally:
+        if remove and os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,182 @@
+"""Load test event registration: many students registering at once.
+
+    python generate_data.py --db benchmark.db
+    python rushtest.py --db benchmark.db --students 2000 --capacity 500 --clients 16
+    python rushtest.py --db benchmark.db --workers 4 --modes queue,direct
+
+For each mode a copy of the database is served with gunicorn.conf.py (see
+loadtest.py) and an event with --capacity places is added. The --clients
+load processes log in --students generated students between them, wait
+for each other and then register all of them as fast as the server
+answers; one registration in --duplicate-every is sent twice. The
+registrations per second and latency percentiles are printed, and the
+database is checked afterwards: the event must have exactly
+min(capacity, students) registered students, the rest waitlisted, and
+nobody twice.
+
+Modes: 'queue' (the default) hands registrations to the group-committing
+writer in each worker; 'direct' has every request write its own
+transaction (REGISTRATION_QUEUE off).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+import numpy as np
+
+from loadtest import PERCENTILES, Client, serve, wait_until_up
+
+MODES = {'queue': {'REGISTRATION_QUEUE': True}, 'direct': {'REGISTRATION_QUEUE': False}}
+
+
+def sample_students(db_path, count):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute(
+            "SELECT username FROM users WHERE role = 'student' AND username LIKE 'gen_%' ORDER BY id LIMIT ?",
+            (count,))]
+    finally:
+        conn.close()
+
+
+def add_event(url, capacity):
+    admin = Client(url, 'admin', 'admin', password='admin123')
+    status, _, body = admin.request('POST', '/api/add_event', json.dumps({
+        'name': 'Registration rush', 'date': (date.today() + timedelta(days=30)).isoformat(),
+        'venue': 'Main Auditorium', 'capacity': capacity}))
+    result = json.loads(body)
+    if status != 200 or not result['success']:
+        raise RuntimeError(f"could not add the event: {result.get('message')}")
+    return result['event_id']
+
+
+def run_client(url, usernames, event_id, duplicate_every, barrier, results):
+    """Log in every student, then register them all once the others are ready."""
+    client = Client(url, usernames[0], 'student')
+    cookies = [client.login(username, 'student') for username in usernames]
+    sends = cookies + cookies[::duplicate_every] if duplicate_every else cookies
+    path = f'/api/events/{event_id}/register'
+    latencies, outcomes = [], Counter()
+    barrier.wait()
+    started = time.time()
+    for cookie in sends:
+        client.cookie = cookie
+        sent = time.perf_counter()
+        try:
+            status, _, body = client.request('POST', path)
+        except OSError:
+            outcomes['connection error'] += 1
+            continue
+        latencies.append((time.perf_counter() - sent) * 1000)
+        if status != 200:
+            outcomes[f'HTTP {status}'] += 1
+        else:
+            outcomes[json.loads(body).get('status') or 'error'] += 1
+    results.put((started, time.time(), latencies, outcomes))
+
+
+def rush(url, students, event_id, clients, duplicate_every):
+    barrier = multiprocessing.Barrier(clients)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=run_client, args=(
+        url, students[i::clients], event_id, duplicate_every, barrier, results)) for i in range(clients)]
+    for process in processes:
+        process.start()
+    runs = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    elapsed = max(end for _, end, _, _ in runs) - min(start for start, _, _, _ in runs)
+    latencies = np.array([value for _, _, values, _ in runs for value in values])
+    outcomes = sum((outcome for _, _, _, outcome in runs), Counter())
+    summary = {'requests': len(latencies), 'elapsed': round(elapsed, 2),
+               'throughput': round(len(latencies) / elapsed, 1), 'outcomes': dict(outcomes)}
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = round(float(np.percentile(latencies, p)), 2)
+    return summary
+
+
+def check(db_path, event_id, students, capacity):
+    """Return what is wrong with the event's registrations, if anything."""
+    conn = sqlite3.connect(db_path)
+    try:
+        counts = dict(conn.execute('SELECT status, COUNT(*) FROM student_events WHERE event_id = ? GROUP BY status',
+                                   (event_id,)).fetchall())
+        twice = conn.execute('SELECT COUNT(*) FROM (SELECT student_id FROM student_events WHERE event_id = ? '
+                             'GROUP BY student_id HAVING COUNT(*) > 1)', (event_id,)).fetchone()[0]
+    finally:
+        conn.close()
+    problems = []
+    if counts.get('registered', 0) != min(capacity, students):
+        problems.append(f"{counts.get('registered', 0)} registered, expected {min(capacity, students)}")
+    if counts.get('waitlisted', 0) != max(students - capacity, 0):
+        problems.append(f"{counts.get('waitlisted', 0)} waitlisted, expected {max(students - capacity, 0)}")
+    if twice:
+        problems.append(f'{twice} students registered twice')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure event registrations per second under a rush')
+    parser.add_argument('--db', default='benchmark.db', help='database to serve (see generate_data.py)')
+    parser.add_argument('--modes', default='queue,direct', help=f"comma-separated, of: {', '.join(MODES)}")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='gunicorn worker processes')
+    parser.add_argument('--students', type=int, default=2000, help='students registering')
+    parser.add_argument('--capacity', type=int, default=500, help='places at the event')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent load processes')
+    parser.add_argument('--duplicate-every', type=int, default=20,
+                        help='send one registration in this many twice (0 for none)')
+    parser.add_argument('--port', type=int, default=8765, help='port for the gunicorn under test')
+    args = parser.parse_args()
+
+    modes = args.modes.split(',')
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"unknown mode {', '.join(unknown)}")
+    if not os.path.exists(args.db):
+        parser.error(f'{args.db} does not exist; create it with generate_data.py')
+    students = sample_students(args.db, args.students)
+    if len(students) < args.clients:
+        parser.error(f'{args.db} has too few generated students; create it with generate_data.py')
+
+    print(f'{len(students)} students, {args.capacity} places, {args.clients} load processes, '
+          f'{args.workers} workers')
+    header = f"{'mode':>7} {'requests':>9} {'reg/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  outcomes"
+    print(header)
+    print('-' * len(header))
+    workdir = tempfile.mkdtemp(prefix='portal-rush-')
+    url = f'http://127.0.0.1:{args.port}'
+    failed = False
+    try:
+        for mode in modes:
+            server = serve(args.db, args.workers, args.port, workdir, name=mode, settings=MODES[mode])
+            try:
+                wait_until_up(url)
+                event_id = add_event(url, args.capacity)
+                result = rush(url, students, event_id, args.clients, args.duplicate_every)
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(60)
+            outcomes = ', '.join(f'{name} {count}' for name, count in sorted(result['outcomes'].items()))
+            print(f"{mode:>7} {result['requests']:>9} {result['throughput']:>9.1f} {result['p50_ms']:>8.2f} "
+                  f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}  {outcomes}")
+            problems = check(os.path.join(workdir, f'{mode}.db'), event_id, len(students), args.capacity)
+            for problem in problems:
+                print(f'{mode:>7} WRONG: {problem}')
+            failed = failed or bool(problems)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
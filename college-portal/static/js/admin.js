@@ -0,0 +1,737 @@
+// Initialize when DOM is loaded
+document.addEventListener('DOMContentLoaded', function() {
+    initializeAdminDashboard();
+    initializeUserTables();
+    initializeSearch();
+    loadClubsEvents();
+});
+
+// Typeahead over /api/search. Only the answer to the latest query is
+// shown; requests still in flight for older input are cancelled.
+let searchController = null;
+
+function initializeSearch() {
+    const input = document.getElementById('search-input');
+    if (!input) {
+        return;
+    }
+    let searchTimer = null;
+
+    input.addEventListener('input', function() {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => runSearch(input.value.trim()), 80);
+    });
+    input.addEventListener('keydown', function(e) {
+        if (e.key === 'Escape') {
+            input.value = '';
+            runSearch('');
+        }
+    });
+}
+
+function runSearch(query) {
+    const results = document.getElementById('search-results');
+    const table = document.getElementById('search-results-table');
+    const hint = document.getElementById('search-hint');
+    if (searchController) {
+        searchController.abort();
+        searchController = null;
+    }
+    if (!query) {
+        results.style.display = 'none';
+        hint.style.display = 'none';
+        table.innerHTML = '';
+        return;
+    }
+
+    searchController = new AbortController();
+    fetch(`/api/search?${new URLSearchParams({ q: query })}`, { signal: searchController.signal })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            showNotification('Error: ' + data.message, 'error');
+            return;
+        }
+        table.innerHTML = '';
+        data.users.forEach(user => {
+            const details = user.role === 'student' ? user.class : user.department;
+            table.insertAdjacentHTML('beforeend', `
+                <tr>
+                    <td>${escapeHtml(user.role)}</td>
+                    <td>${escapeHtml(user.name)}</td>
+                    <td>${escapeHtml([details, user.email].filter(Boolean).join(' \u00b7 ') || 'N/A')}</td>
+                    <td>${escapeHtml(user.username)}</td>
+                    <td>
+                        <button class="action-btn btn-edit" onclick="editUser(${user.id})">Edit</button>
+                        <button class="action-btn btn-delete" onclick="deleteUser(${user.id}, '${user.role}')">Delete</button>
+                    </td>
+                </tr>
+            `);
+        });
+        data.events.forEach(event => {
+            table.insertAdjacentHTML('beforeend', `
+                <tr>
+                    <td>event</td>
+                    <td>${escapeHtml(event.name)}</td>
+                    <td>${escapeHtml([event.date, event.time, event.venue].filter(Boolean).join(' \u00b7 '))}</td>
+                    <td></td>
+                    <td></td>
+                </tr>
+            `);
+        });
+        if (!data.users.length && !data.events.length) {
+            table.innerHTML = '<tr><td colspan="5">No matches</td></tr>';
+        }
+        results.style.display = '';
+        hint.style.display = data.ranked ? 'none' : '';
+    })
+    .catch(error => {
+        if (error.name !== 'AbortError') {
+            console.error('Error searching:', error);
+        }
+    });
+}
+
+// Users are fetched a page at a time from /api/users
+const userTables = {
+    student: { table: 'students-table', more: 'students-more-btn', filter: 'students-filter', field: 'class', cursor: null },
+    faculty: { table: 'faculty-table', more: 'faculty-more-btn', filter: 'faculty-filter', field: 'department', cursor: null }
+};
+
+function initializeUserTables() {
+    Object.keys(userTables).forEach(role => {
+        const config = userTables[role];
+        const moreBtn = document.getElementById(config.more);
+        const filterInput = document.getElementById(config.filter);
+        let filterTimer = null;
+
+        if (moreBtn) {
+            moreBtn.addEventListener('click', () => loadUsers(role, false));
+        }
+
+        if (filterInput) {
+            filterInput.addEventListener('input', function() {
+                clearTimeout(filterTimer);
+                filterTimer = setTimeout(() => loadUsers(role, true), 300);
+            });
+        }
+
+        loadUsers(role, true);
+    });
+}
+
+function loadUsers(role, reset) {
+    const config = userTables[role];
+    const table = document.getElementById(config.table);
+    const moreBtn = document.getElementById(config.more);
+    if (!table) {
+        return;
+    }
+
+    const params = new URLSearchParams({ role: role, sort: 'name' });
+    const filterValue = document.getElementById(config.filter).value.trim();
+    if (filterValue) {
+        params.set(config.field, filterValue);
+    }
+    if (!reset && config.cursor) {
+        params.set('cursor', config.cursor);
+    }
+
+    fetch(`/api/users?${params}`)
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            showNotification('Error: ' + data.message, 'error');
+            return;
+        }
+        if (reset) {
+            table.innerHTML = '';
+        }
+        data.users.forEach(user => {
+            table.insertAdjacentHTML('beforeend', `
+                <tr>
+                    <td>${user.id}</td>
+                    <td>${escapeHtml(user.name)}</td>
+                    <td>${escapeHtml(user.email || 'N/A')}</td>
+                    <td>${escapeHtml(user[config.field] || 'N/A')}</td>
+                    <td>${escapeHtml(user.username)}</td>
+                    <td>
+                        <button class="action-btn btn-edit" onclick="editUser(${user.id})">Edit</button>
+                        <button class="action-btn btn-delete" onclick="deleteUser(${user.id}, '${role}')">Delete</button>
+                    </td>
+                </tr>
+            `);
+        });
+        config.cursor = data.next_cursor;
+        if (moreBtn) {
+            moreBtn.style.display = data.next_cursor ? 'inline-block' : 'none';
+        }
+    })
+    .catch(error => {
+        console.error('Error loading users:', error);
+    });
+}
+
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value;
+    return div.innerHTML;
+}
+
+function initializeAdminDashboard() {
+    // Modal functionality
+    const modals = document.querySelectorAll('.modal');
+    const closeButtons = document.querySelectorAll('.close-modal');
+    const addUserBtn = document.getElementById('add-user-btn');
+    const uploadStudentsBtn = document.getElementById('upload-students-btn');
+    const uploadFacultyBtn = document.getElementById('upload-faculty-btn');
+    const addFacultyBtn = document.getElementById('add-faculty-btn');
+    const addClubEventBtn = document.getElementById('add-club-event-btn');
+    const enrollStudentsBtn = document.getElementById('enroll-students-btn');
+    const uploadEnrollmentsBtn = document.getElementById('upload-enrollments-btn');
+
+    // Open modals
+    if (addUserBtn) {
+        addUserBtn.addEventListener('click', function() {
+            document.getElementById('add-user-modal').style.display = 'flex';
+        });
+    }
+
+    if (uploadStudentsBtn) {
+        uploadStudentsBtn.addEventListener('click', function() {
+            document.getElementById('upload-students-modal').style.display = 'flex';
+        });
+    }
+
+    if (uploadFacultyBtn) {
+        uploadFacultyBtn.addEventListener('click', function() {
+            document.getElementById('upload-faculty-modal').style.display = 'flex';
+        });
+    }
+
+    if (addFacultyBtn) {
+        addFacultyBtn.addEventListener('click', function() {
+            document.getElementById('add-faculty-modal').style.display = 'flex';
+        });
+    }
+
+    if (addClubEventBtn) {
+        addClubEventBtn.addEventListener('click', function() {
+            document.getElementById('add-club-event-modal').style.display = 'flex';
+        });
+    }
+
+    if (enrollStudentsBtn) {
+        enrollStudentsBtn.addEventListener('click', function() {
+            document.getElementById('enroll-students-modal').style.display = 'flex';
+        });
+    }
+
+    if (uploadEnrollmentsBtn) {
+        uploadEnrollmentsBtn.addEventListener('click', function() {
+            document.getElementById('upload-enrollments-modal').style.display = 'flex';
+        });
+    }
+
+    // Close modals
+    closeButtons.forEach(button => {
+        button.addEventListener('click', function() {
+            modals.forEach(modal => {
+                modal.style.display = 'none';
+            });
+        });
+    });
+
+    // Close modal when clicking outside
+    window.addEventListener('click', function(e) {
+        modals.forEach(modal => {
+            if (e.target === modal) {
+                modal.style.display = 'none';
+            }
+        });
+    });
+
+    // Form submissions
+    const addUserForm = document.getElementById('add-user-form');
+    const uploadStudentsForm = document.getElementById('upload-students-form');
+    const uploadFacultyForm = document.getElementById('upload-faculty-form');
+    const addFacultyForm = document.getElementById('add-faculty-form');
+    const addClubEventForm = document.getElementById('add-club-event-form');
+    const enrollStudentsForm = document.getElementById('enroll-students-form');
+    const uploadEnrollmentsForm = document.getElementById('upload-enrollments-form');
+
+    if (addUserForm) {
+        addUserForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+            addUser();
+        });
+    }
+
+    if (uploadStudentsForm) {
+        uploadStudentsForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+            uploadStudents(e);
+        });
+    }
+
+    if (uploadFacultyForm) {
+        uploadFacultyForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+            uploadFaculty(e);
+        });
+    }
+
+    if (addFacultyForm) {
+        addFacultyForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+            addFaculty(e);
+        });
+    }
+
+    if (addClubEventForm) {
+        addClubEventForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+            addClubEvent(e);
+        });
+    }
+
+    if (enrollStudentsForm) {
+        enrollStudentsForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+            enrollStudents(e);
+        });
+    }
+
+    if (uploadEnrollmentsForm) {
+        uploadEnrollmentsForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+            uploadEnrollments(e);
+        });
+    }
+}
+
+function loadClubsEvents() {
+    fetch('/api/get_clubs_events')
+    .then(response => response.json())
+    .then(data => {
+        const table = document.getElementById('clubs-events-table');
+        if (table) {
+            table.innerHTML = '';
+            data.clubs.forEach(club => {
+                table.innerHTML += `
+                    <tr>
+                        <td>${club.name}</td>
+                        <td>Club</td>
+                        <td>Active</td>
+                        <td>
+                            <button class="action-btn btn-edit" onclick="editClubEvent(${club.id})">Edit</button>
+                            <button class="action-btn btn-delete" onclick="deleteClubEvent(${club.id})">Delete</button>
+                        </td>
+                    </tr>
+                `;
+            });
+            data.events.forEach(event => {
+                table.innerHTML += `
+                    <tr>
+                        <td>${event.name}</td>
+                        <td>Event</td>
+                        <td>Active</td>
+                        <td>
+                            <button class="action-btn btn-edit" onclick="editClubEvent(${event.id})">Edit</button>
+                            <button class="action-btn btn-delete" onclick="deleteClubEvent(${event.id})">Delete</button>
+                        </td>
+                    </tr>
+                `;
+            });
+        }
+    })
+    .catch(error => {
+        console.error('Error loading clubs and events:', error);
+    });
+}
+
+function deleteUser(userId, role) {
+    if (confirm(`Are you sure you want to delete this ${role}?`)) {
+        showLoading(true);
+        fetch(`/api/delete_user/${userId}`, {
+            method: 'DELETE'
+        })
+        .then(response => response.json())
+        .then(data => {
+            showLoading(false);
+            if (data.success) {
+                showNotification(`${role.charAt(0).toUpperCase() + role.slice(1)} deleted successfully`, 'success');
+                setTimeout(() => location.reload(), 1000);
+            } else {
+                showNotification('Error: ' + data.message, 'error');
+            }
+        })
+        .catch(error => {
+            showLoading(false);
+            showNotification('An error occurred while deleting user.', 'error');
+        });
+    }
+}
+
+function editUser(userId) {
+    showNotification('Edit functionality would be implemented here', 'info');
+}
+
+function editClubEvent(id) {
+    showNotification('Edit club/event functionality would be implemented here', 'info');
+}
+
+function deleteClubEvent(id) {
+    if (confirm('Are you sure you want to delete this club/event?')) {
+        showNotification('Delete club/event functionality would be implemented here', 'info');
+    }
+}
+
+// Add new user
+function addUser() {
+    showLoading(true);
+    
+    const form = document.getElementById('add-user-form');
+    const formData = new FormData(form);
+    const data = {
+        username: formData.get('username'),
+        password: formData.get('password'),
+        name: formData.get('name'),
+        email: formData.get('email'),
+        class: formData.get('class')
+    };
+    
+    fetch('/api/add_user', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(data)
+    })
+    .then(response => response.json())
+    .then(data => {
+        showLoading(false);
+        if (data.success) {
+            document.getElementById('add-user-modal').style.display = 'none';
+            form.reset();
+            showNotification('Student added successfully!', 'success');
+            setTimeout(() => {
+                location.reload();
+            }, 1000);
+        } else {
+            showNotification('Error: ' + data.message, 'error');
+        }
+    })
+    .catch(error => {
+        showLoading(false);
+        console.error('Error:', error);
+        showNotification('An error occurred while adding student.', 'error');
+    });
+}
+
+// Upload students from Excel/CSV (runs as a background job)
+function uploadStudents(e) {
+    e.preventDefault();
+    showLoading(true);
+    
+    const formData = new FormData(document.getElementById('upload-students-form'));
+    
+    fetch('/api/upload_students', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        showLoading(false);
+        if (data.success) {
+            document.getElementById('upload-students-form').reset();
+            showImportReport('students-import-report', null);
+            trackImportJob(data.job_id, 'students-import-progress', job => {
+                showImportReport('students-import-report', job);
+                if (job.status === 'done' && !job.rows_failed) {
+                    document.getElementById('upload-students-modal').style.display = 'none';
+                }
+                showNotification(job.message, job.status === 'failed' ? 'error' : (job.rows_failed ? 'info' : 'success'));
+                loadUsers('student', true);
+            });
+        } else {
+            showNotification('Error: ' + data.message, 'error');
+        }
+    })
+    .catch(error => {
+        showLoading(false);
+        showNotification('An error occurred while uploading students.', 'error');
+    });
+}
+
+// Upload faculty from Excel/CSV (runs as a background job)
+function uploadFaculty(e) {
+    e.preventDefault();
+    showLoading(true);
+    
+    const formData = new FormData(document.getElementById('upload-faculty-form'));
+    
+    fetch('/api/upload_faculty', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        showLoading(false);
+        if (data.success) {
+            document.getElementById('upload-faculty-form').reset();
+            showImportReport('faculty-import-report', null);
+            trackImportJob(data.job_id, 'faculty-import-progress', job => {
+                showImportReport('faculty-import-report', job);
+                if (job.status === 'done' && !job.rows_failed) {
+                    document.getElementById('upload-faculty-modal').style.display = 'none';
+                }
+                showNotification(job.message, job.status === 'failed' ? 'error' : (job.rows_failed ? 'info' : 'success'));
+                loadUsers('faculty', true);
+            });
+        } else {
+            showNotification('Error: ' + data.message, 'error');
+        }
+    })
+    .catch(error => {
+        showLoading(false);
+        showNotification('An error occurred while uploading faculty.', 'error');
+    });
+}
+
+// Enroll a list of students in one class
+function enrollStudents(e) {
+    e.preventDefault();
+    showLoading(true);
+    
+    const form = document.getElementById('enroll-students-form');
+    const formData = new FormData(form);
+    const data = {
+        class_id: formData.get('class_id'),
+        usernames: formData.get('usernames').split(/[\s,]+/).filter(u => u)
+    };
+    
+    fetch('/api/enrollments', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(data)
+    })
+    .then(response => response.json())
+    .then(data => {
+        showLoading(false);
+        if (data.success) {
+            const unknown = data.unknown.length ? ' Not found: ' + data.unknown.join(', ') : '';
+            showNotification(data.message + unknown, data.unknown.length ? 'info' : 'success');
+            if (!data.unknown.length) {
+                document.getElementById('enroll-students-modal').style.display = 'none';
+                form.reset();
+            }
+            setTimeout(() => location.reload(), 2000);
+        } else {
+            showNotification('Error: ' + data.message, 'error');
+        }
+    })
+    .catch(error => {
+        showLoading(false);
+        showNotification('An error occurred while enrolling students.', 'error');
+    });
+}
+
+// Upload enrollments from Excel/CSV (runs as a background job)
+function uploadEnrollments(e) {
+    e.preventDefault();
+    showLoading(true);
+    
+    const formData = new FormData(document.getElementById('upload-enrollments-form'));
+    
+    fetch('/api/upload_enrollments', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        showLoading(false);
+        if (data.success) {
+            document.getElementById('upload-enrollments-form').reset();
+            showImportReport('enrollments-import-report', null);
+            trackImportJob(data.job_id, 'enrollments-import-progress', job => {
+                showImportReport('enrollments-import-report', job);
+                if (job.status === 'done' && !job.rows_failed) {
+                    document.getElementById('upload-enrollments-modal').style.display = 'none';
+                }
+                showNotification(job.message, job.status === 'failed' ? 'error' : (job.rows_failed ? 'info' : 'success'));
+            });
+        } else {
+            showNotification('Error: ' + data.message, 'error');
+        }
+    })
+    .catch(error => {
+        showLoading(false);
+        showNotification('An error occurred while uploading enrollments.', 'error');
+    });
+}
+
+// List the rows a finished import job rejected, with their spreadsheet row numbers
+function showImportReport(containerId, job) {
+    const container = document.getElementById(containerId);
+    if (!container) {
+        return;
+    }
+    if (!job || !job.errors || job.errors.length === 0) {
+        container.innerHTML = '';
+        return;
+    }
+    let rows = '';
+    job.errors.forEach(error => {
+        rows += `
+            <tr>
+                <td>${error.row}</td>
+                <td>${escapeHtml(error.username || '')}</td>
+                <td>${escapeHtml(error.error)}</td>
+            </tr>
+        `;
+    });
+    const shown = job.errors.length < job.rows_failed ? ` (first ${job.errors.length} shown)` : '';
+    container.innerHTML = `
+        <p>${job.rows_inserted} added, ${job.rows_failed} rejected${shown}:</p>
+        <table>
+            <thead>
+                <tr>
+                    <th>Row</th>
+                    <th>Username</th>
+                    <th>Error</th>
+                </tr>
+            </thead>
+            <tbody>${rows}</tbody>
+        </table>
+    `;
+}
+
+// Add faculty
+function addFaculty(e) {
+    e.preventDefault();
+    showLoading(true);
+    
+    const form = document.getElementById('add-faculty-form');
+    const formData = new FormData(form);
+    const data = {
+        username: formData.get('username'),
+        password: formData.get('password'),
+        name: formData.get('name'),
+        email: formData.get('email'),
+        department: formData.get('department')
+    };
+    
+    fetch('/api/add_faculty', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(data)
+    })
+    .then(response => response.json())
+    .then(data => {
+        showLoading(false);
+        if (data.success) {
+            document.getElementById('add-faculty-modal').style.display = 'none';
+            form.reset();
+            showNotification(data.message, 'success');
+            setTimeout(() => location.reload(), 2000);
+        } else {
+            showNotification('Error: ' + data.message, 'error');
+        }
+    })
+    .catch(error => {
+        showLoading(false);
+        showNotification('An error occurred while adding faculty.', 'error');
+    });
+}
+
+// Add club/event
+function addClubEvent(e) {
+    e.preventDefault();
+    showLoading(true);
+    
+    const form = document.getElementById('add-club-event-form');
+    const formData = new FormData(form);
+    const data = {
+        name: formData.get('name'),
+        type: formData.get('type')
+    };
+    
+    fetch('/api/add_club_event', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(data)
+    })
+    .then(response => response.json())
+    .then(data => {
+        showLoading(false);
+        if (data.success) {
+            document.getElementById('add-club-event-modal').style.display = 'none';
+            form.reset();
+            showNotification(data.message, 'success');
+            loadClubsEvents();
+        } else {
+            showNotification('Error: ' + data.message, 'error');
+        }
+    })
+    .catch(error => {
+        showLoading(false);
+        showNotification('An error occurred while adding club/event.', 'error');
+    });
+}
+
+// Show loading state
+function showLoading(show) {
+    const buttons = document.querySelectorAll('button[type="submit"]');
+    buttons.forEach(button => {
+        if (show) {
+            button.disabled = true;
+            button.innerHTML = 'Processing...';
+            button.classList.add('loading');
+        } else {
+            button.disabled = false;
+            button.innerHTML = button.getAttribute('data-original-text') || 'Submit';
+            button.classList.remove('loading');
+        }
+    });
+}
+
+// Show notification
+function showNotification(message, type = 'info') {
+    // Remove any existing notifications
+    const existingNotifications = document.querySelectorAll('.custom-notification');
+    existingNotifications.forEach(notification => notification.remove());
+
+    const notification = document.createElement('div');
+    notification.className = `custom-notification flash-message ${type}`;
+    notification.textContent = message;
+    notification.style.position = 'fixed';
+    notification.style.top = '80px';
+    notification.style.right = '20px';
+    notification.style.zIndex = '1000';
+    notification.style.maxWidth = '300px';
+    notification.style.padding = '16px 20px';
+    notification.style.borderRadius = '10px';
+    notification.style.color = 'white';
+    notification.style.boxShadow = '0 10px 30px rgba(0, 0, 0, 0.08)';
+    
+    if (type === 'success') {
+        notification.style.background = '#06d6a0';
+    } else if (type === 'error') {
+        notification.style.background = '#ef476f';
+    } else {
+        notification.style.background = '#4361ee';
+    }
+    
+    document.body.appendChild(notification);
+    
+    setTimeout(() => {
+        notification.style.opacity = '0';
+        notification.style.transition = 'opacity 0.5s ease';
+        setTimeout(() => {
+            if (notification.parentNode) {
+                notification.remove();
+            }
+        }, 500);
+    }, 5000);
+}
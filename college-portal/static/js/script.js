@@ -90,22 +90,14 @@ function initializeApp() {
         }, 5000);
     });
     
-    // Handle permission status updates
-    const approveButtons = document.querySelectorAll('.btn-approve');
-    const rejectButtons = document.querySelectorAll('.btn-reject');
-    
-    approveButtons.forEach(button => {
-        button.addEventListener('click', function() {
-            const permissionId = this.getAttribute('data-id');
-            updatePermissionStatus(permissionId, 'approved');
-        });
-    });
-    
-    rejectButtons.forEach(button => {
-        button.addEventListener('click', function() {
-            const permissionId = this.getAttribute('data-id');
-            updatePermissionStatus(permissionId, 'rejected');
-        });
+    // Handle permission status updates (delegated, so rows pushed in later
+    // by the live stream work too)
+    document.addEventListener('click', function(e) {
+        const button = e.target.closest('.btn-approve, .btn-reject');
+        if (button) {
+            const permissionId = button.getAttribute('data-id');
+            updatePermissionStatus(permissionId, button.classList.contains('btn-approve') ? 'approved' : 'rejected');
+        }
     });
     
     // Add user form submission
@@ -150,12 +142,33 @@ function initializeApp() {
         addClubEventForm.addEventListener('submit', addClubEvent);
     }
 
+    // Take attendance for a whole class session
+    document.querySelectorAll('.take-attendance-btn').forEach(button => {
+        button.addEventListener('click', function() {
+            openAttendanceModal(this.getAttribute('data-class-id'), this.getAttribute('data-class-name'));
+        });
+    });
+
+    const attendanceForm = document.getElementById('attendance-form');
+    if (attendanceForm) {
+        attendanceForm.addEventListener('submit', submitAttendance);
+        document.getElementById('attendance-date').addEventListener('change', loadAttendanceRoster);
+        document.getElementById('attendance-all-present').addEventListener('click', () => setAllAttendance(true));
+        document.getElementById('attendance-all-absent').addEventListener('click', () => setAllAttendance(false));
+    }
+
     // Change password form submission
     const changePasswordForm = document.getElementById('change-password-form');
     if (changePasswordForm) {
         changePasswordForm.addEventListener('submit', changePassword);
     }
     
+    // Keep the permissions table and pending count up to date
+    connectLiveUpdates();
+    initializePermissionHistory();
+    initializePermissionSelection();
+    initializeUpcomingEvents();
+    
     // Initialize charts if any
     initializeCharts();
     
@@ -182,10 +195,9 @@ function updatePermissionStatus(permissionId, status) {
         showLoading(false);
         if (data.success) {
             showNotification(`Permission ${status} successfully!`, 'success');
-            // Reload after 1 second to show updated status
-            setTimeout(() => {
-                location.reload();
-            }, 1000);
+            if (data.permission) {
+                showPermission(data.permission);
+            }
         } else {
             showNotification('Error: ' + data.message, 'error');
         }
@@ -197,6 +209,324 @@ function updatePermissionStatus(permissionId, status) {
     });
 }
 
+// Listen for permission requests and decisions pushed by the server.
+// EventSource reconnects by itself and the server replays what was missed.
+function connectLiveUpdates() {
+    const table = document.getElementById('permissions-table');
+    if (!table || !window.EventSource) {
+        return;
+    }
+    
+    const source = new EventSource('/api/stream');
+    source.addEventListener('permission_created', function(e) {
+        const data = JSON.parse(e.data);
+        // The faculty table lists newest first
+        showPermission(data.permission, table.getAttribute('data-view') === 'faculty');
+        setPendingCount(data.pending);
+        if (table.getAttribute('data-view') === 'faculty') {
+            showNotification(`New permission request from ${data.permission.student_name}`, 'info');
+        }
+    });
+    source.addEventListener('permission_updated', function(e) {
+        const data = JSON.parse(e.data);
+        showPermission(data.permission);
+        setPendingCount(data.pending);
+        if (table.getAttribute('data-view') === 'student') {
+            showNotification(`Your permission for ${data.permission.date} was ${data.permission.status}`,
+                             data.permission.status === 'approved' ? 'success' : 'error');
+        }
+    });
+    source.addEventListener('resync', function(e) {
+        // Updates were missed (e.g. the server restarted); counts are fresh
+        // but the table may be behind
+        setPendingCount(JSON.parse(e.data).pending);
+        showNotification('Some live updates were missed. Reload the page to see all changes.', 'info');
+    });
+}
+
+function setPendingCount(count) {
+    const element = document.getElementById('pending-permissions-count');
+    if (element && count !== undefined) {
+        element.textContent = count;
+    }
+}
+
+// Add or refresh a row of the permissions table
+function showPermission(permission, prepend = false) {
+    const table = document.getElementById('permissions-table');
+    if (!table || !permission) {
+        return;
+    }
+    
+    const faculty = table.getAttribute('data-view') === 'faculty';
+    const pending = permission.status === 'pending';
+    let row = table.querySelector(`tr[data-permission-id="${permission.id}"]`);
+    if (!row) {
+        row = document.createElement('tr');
+        row.setAttribute('data-permission-id', permission.id);
+        row.innerHTML = faculty ? '<td></td><td></td><td></td><td></td><td></td><td></td>' : '<td></td><td></td><td></td><td></td>';
+        table.insertBefore(row, prepend ? table.firstChild : null);
+    }
+    
+    // Faculty rows start with a selection checkbox for pending requests
+    const cells = faculty
+        ? [permission.student_name, permission.date, permission.reason]
+        : [permission.date, permission.reason];
+    const offset = faculty ? 1 : 0;
+    if (faculty && !pending) {
+        row.cells[0].innerHTML = '';
+    } else if (faculty && !row.cells[0].querySelector('input')) {
+        row.cells[0].innerHTML = `<input type="checkbox" class="permission-select" value="${permission.id}">`;
+    }
+    cells.forEach((value, i) => {
+        row.cells[offset + i].textContent = value;
+    });
+    const statusCell = row.cells[offset + cells.length];
+    statusCell.className = `status-${permission.status}`;
+    statusCell.textContent = permission.status.charAt(0).toUpperCase() + permission.status.slice(1);
+    const lastCell = row.cells[offset + cells.length + 1];
+    if (faculty) {
+        lastCell.innerHTML = pending ? `
+            <button class="action-btn btn-approve" data-id="${permission.id}">Approve</button>
+            <button class="action-btn btn-reject" data-id="${permission.id}">Reject</button>
+        ` : '';
+        updateSelectedCount();
+    } else if (!lastCell.textContent) {
+        lastCell.textContent = permission.faculty_name || '';
+    }
+}
+
+// Multi-select on the faculty permissions table, applied with one
+// request to /api/permissions/status
+function initializePermissionSelection() {
+    const selectAll = document.getElementById('permissions-select-all');
+    const approveBtn = document.getElementById('approve-selected-btn');
+    const rejectBtn = document.getElementById('reject-selected-btn');
+    if (!selectAll || !approveBtn || !rejectBtn) {
+        return;
+    }
+    
+    selectAll.addEventListener('change', function() {
+        document.querySelectorAll('.permission-select').forEach(checkbox => {
+            checkbox.checked = selectAll.checked;
+        });
+        updateSelectedCount();
+    });
+    document.getElementById('permissions-table').addEventListener('change', function(e) {
+        if (e.target.classList.contains('permission-select')) {
+            updateSelectedCount();
+        }
+    });
+    approveBtn.addEventListener('click', () => updateSelectedPermissions('approved'));
+    rejectBtn.addEventListener('click', () => updateSelectedPermissions('rejected'));
+}
+
+function selectedPermissionIds() {
+    return Array.from(document.querySelectorAll('.permission-select:checked')).map(checkbox => parseInt(checkbox.value, 10));
+}
+
+function updateSelectedCount() {
+    const label = document.getElementById('permissions-selected-count');
+    if (!label) {
+        return;
+    }
+    const count = selectedPermissionIds().length;
+    label.textContent = count ? `${count} selected` : '';
+    document.getElementById('approve-selected-btn').disabled = !count;
+    document.getElementById('reject-selected-btn').disabled = !count;
+}
+
+function updateSelectedPermissions(status) {
+    const permissionIds = selectedPermissionIds();
+    if (!permissionIds.length) {
+        return;
+    }
+    
+    fetch('/api/permissions/status', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ permission_ids: permissionIds, status: status })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            showNotification('Error: ' + data.message, 'error');
+            return;
+        }
+        data.permissions.forEach(permission => showPermission(permission));
+        const skipped = data.results.filter(r => r.result === 'not_found' || r.result === 'forbidden').length;
+        showNotification(skipped ? `${data.message} (${skipped} could not be changed)` : data.message,
+                         skipped ? 'error' : 'success');
+        document.getElementById('permissions-select-all').checked = false;
+        document.querySelectorAll('.permission-select:checked').forEach(checkbox => {
+            checkbox.checked = false;
+        });
+        updateSelectedCount();
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        showNotification('An error occurred while updating permissions.', 'error');
+    });
+}
+
+// The faculty dashboard renders the first page of pending requests. The
+// rest of the pending ones, then the decided ones, are fetched from
+// /api/permissions a page at a time as the table is scrolled to its end.
+function initializePermissionHistory() {
+    const table = document.getElementById('permissions-table');
+    const moreBtn = document.getElementById('permissions-more-btn');
+    if (!table || !moreBtn) {
+        return;
+    }
+    
+    const phases = ['pending', 'approved,rejected'];
+    let phase = 0;
+    let cursor = table.getAttribute('data-next-cursor') || null;
+    let loading = false;
+    if (!cursor) {
+        phase = 1;
+    }
+    
+    function loadMore() {
+        if (loading || phase >= phases.length) {
+            return;
+        }
+        loading = true;
+        
+        const params = new URLSearchParams({ status: phases[phase] });
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        fetch(`/api/permissions?${params}`)
+        .then(response => response.json())
+        .then(data => {
+            loading = false;
+            if (!data.success) {
+                showNotification('Error: ' + data.message, 'error');
+                return;
+            }
+            data.permissions.forEach(permission => showPermission(permission));
+            cursor = data.next_cursor;
+            if (!cursor) {
+                phase += 1;
+            }
+            if (phase >= phases.length) {
+                moreBtn.style.display = 'none';
+                if (observer) {
+                    observer.disconnect();
+                }
+            } else if (isVisible(moreBtn)) {
+                // Short pages leave the button on screen; keep filling
+                loadMore();
+            }
+        })
+        .catch(error => {
+            loading = false;
+            console.error('Error loading permissions:', error);
+        });
+    }
+    
+    function isVisible(element) {
+        const rect = element.getBoundingClientRect();
+        return rect.top < window.innerHeight && rect.bottom > 0;
+    }
+    
+    moreBtn.addEventListener('click', loadMore);
+    const observer = window.IntersectionObserver ? new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadMore();
+        }
+    }) : null;
+    if (observer) {
+        observer.observe(moreBtn);
+    }
+}
+
+// Open the attendance modal for a class, defaulting to today's session
+function openAttendanceModal(classId, className) {
+    document.getElementById('attendance-class-id').value = classId;
+    document.getElementById('attendance-class-name').textContent = className;
+    document.getElementById('attendance-date').value = new Date().toISOString().split('T')[0];
+    document.getElementById('attendance-modal').style.display = 'flex';
+    loadAttendanceRoster();
+}
+
+function loadAttendanceRoster() {
+    const classId = document.getElementById('attendance-class-id').value;
+    const sessionDate = document.getElementById('attendance-date').value;
+    const roster = document.getElementById('attendance-roster');
+    roster.innerHTML = '';
+
+    fetch(`/api/attendance/roster?class_id=${classId}&date=${sessionDate}`)
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            showNotification('Error: ' + data.message, 'error');
+            return;
+        }
+        data.students.forEach(student => {
+            const row = document.createElement('tr');
+            row.innerHTML = `
+                <td></td>
+                <td></td>
+                <td><input type="checkbox" class="attendance-present" data-student-id="${student.id}"></td>
+            `;
+            row.cells[0].textContent = student.name;
+            row.cells[1].textContent = student.username;
+            // Unmarked students default to present
+            row.querySelector('input').checked = student.status !== 'absent';
+            roster.appendChild(row);
+        });
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        showNotification('An error occurred while loading the roster.', 'error');
+    });
+}
+
+function setAllAttendance(present) {
+    document.querySelectorAll('.attendance-present').forEach(checkbox => {
+        checkbox.checked = present;
+    });
+}
+
+// Submit the whole roster in a single request
+function submitAttendance(e) {
+    e.preventDefault();
+    showLoading(true);
+
+    const records = Array.from(document.querySelectorAll('.attendance-present')).map(checkbox => ({
+        student_id: parseInt(checkbox.getAttribute('data-student-id'), 10),
+        status: checkbox.checked ? 'present' : 'absent'
+    }));
+    const data = {
+        class_id: parseInt(document.getElementById('attendance-class-id').value, 10),
+        date: document.getElementById('attendance-date').value,
+        records: records
+    };
+
+    fetch('/api/attendance', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(data)
+    })
+    .then(response => response.json())
+    .then(data => {
+        showLoading(false);
+        if (data.success) {
+            document.getElementById('attendance-modal').style.display = 'none';
+            showNotification(data.message, 'success');
+        } else {
+            showNotification('Error: ' + data.message, 'error');
+        }
+    })
+    .catch(error => {
+        showLoading(false);
+        console.error('Error:', error);
+        showNotification('An error occurred while saving attendance.', 'error');
+    });
+}
+
 // Add new user
 function addUser() {
     showLoading(true);
@@ -266,10 +596,7 @@ function applyPermission() {
             document.getElementById('apply-permission-modal').style.display = 'none';
             form.reset();
             showNotification('Permission request submitted successfully!', 'success');
-            // Reload after 1 second to show new permission
-            setTimeout(() => {
-                location.reload();
-            }, 1000);
+            showPermission(data.permission);
         } else {
             showNotification('Error: ' + data.message, 'error');
         }
@@ -281,7 +608,7 @@ function applyPermission() {
     });
 }
 
-// Upload students from Excel
+// Upload students from Excel/CSV (runs as a background job)
 function uploadStudents(e) {
     e.preventDefault();
     showLoading(true);
@@ -296,10 +623,13 @@ function uploadStudents(e) {
     .then(data => {
         showLoading(false);
         if (data.success) {
-            document.getElementById('upload-students-modal').style.display = 'none';
             document.getElementById('upload-students-form').reset();
-            showNotification(data.message, 'success');
-            setTimeout(() => location.reload(), 2000);
+            trackImportJob(data.job_id, 'students-import-progress', job => {
+                showNotification(job.message, job.status === 'done' ? 'success' : 'error');
+                if (job.status === 'done') {
+                    setTimeout(() => location.reload(), 2000);
+                }
+            });
         } else {
             showNotification('Error: ' + data.message, 'error');
         }
@@ -310,7 +640,7 @@ function uploadStudents(e) {
     });
 }
 
-// Upload faculty from Excel
+// Upload faculty from Excel/CSV (runs as a background job)
 function uploadFaculty(e) {
     e.preventDefault();
     showLoading(true);
@@ -325,10 +655,13 @@ function uploadFaculty(e) {
     .then(data => {
         showLoading(false);
         if (data.success) {
-            document.getElementById('upload-faculty-modal').style.display = 'none';
             document.getElementById('upload-faculty-form').reset();
-            showNotification(data.message, 'success');
-            setTimeout(() => location.reload(), 2000);
+            trackImportJob(data.job_id, 'faculty-import-progress', job => {
+                showNotification(job.message, job.status === 'done' ? 'success' : 'error');
+                if (job.status === 'done') {
+                    setTimeout(() => location.reload(), 2000);
+                }
+            });
         } else {
             showNotification('Error: ' + data.message, 'error');
         }
@@ -339,6 +672,46 @@ function uploadFaculty(e) {
     });
 }
 
+// Poll a background import job and show its progress until it finishes
+function trackImportJob(jobId, progressId, onDone) {
+    const progress = document.getElementById(progressId);
+
+    function poll() {
+        fetch(`/api/jobs/${jobId}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                showNotification('Error: ' + data.message, 'error');
+                return;
+            }
+            const job = data.job;
+            if (progress) {
+                const total = job.rows_total ? ` of ${job.rows_total}` : '';
+                const percent = job.rows_total ? Math.min(100, Math.round(job.rows_processed * 100 / job.rows_total)) : 0;
+                const eta = job.eta_seconds !== null ? `, about ${Math.ceil(job.eta_seconds)}s left` : '';
+                progress.innerHTML = `
+                    <div class="progress-bar"><div class="progress-fill" style="width: ${percent}%"></div></div>
+                    <p>${job.status === 'queued' ? 'Waiting to start' : `${job.rows_processed}${total} rows processed, ${job.rows_failed} failed${eta}`}</p>
+                `;
+            }
+            if (job.status === 'done' || job.status === 'failed') {
+                if (progress) {
+                    progress.innerHTML = '';
+                }
+                onDone(job);
+            } else {
+                setTimeout(poll, 1000);
+            }
+        })
+        .catch(error => {
+            console.error('Error polling import job:', error);
+            setTimeout(poll, 3000);
+        });
+    }
+
+    poll();
+}
+
 // Add faculty
 function addFaculty(e) {
     e.preventDefault();
@@ -491,6 +864,76 @@ function loadClubsEvents() {
     });
 }
 
+// Upcoming events with their free places; students register or cancel
+// from here and the list is reloaded with the new head counts
+function initializeUpcomingEvents() {
+    const table = document.getElementById('upcoming-events-table');
+    if (!table) {
+        return;
+    }
+    
+    table.addEventListener('click', function(e) {
+        const button = e.target.closest('button[data-event-id]');
+        if (button) {
+            button.disabled = true;
+            changeRegistration(button.getAttribute('data-event-id'), button.getAttribute('data-action'));
+        }
+    });
+    loadUpcomingEvents();
+}
+
+function loadUpcomingEvents() {
+    const table = document.getElementById('upcoming-events-table');
+    fetch('/api/events')
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            return;
+        }
+        table.innerHTML = '';
+        data.events.forEach(event => {
+            const row = document.createElement('tr');
+            row.innerHTML = '<td></td><td></td><td></td><td></td><td></td>';
+            let places = 'Open';
+            if (event.capacity !== null) {
+                const free = Math.max(event.capacity - event.registered, 0);
+                places = free ? `${free} of ${event.capacity} left` : `Full (${event.waitlisted} waiting)`;
+            }
+            [event.name, event.date, event.venue || '', places].forEach((value, i) => {
+                row.cells[i].textContent = value;
+            });
+            const button = document.createElement('button');
+            button.setAttribute('data-event-id', event.id);
+            if (event.status) {
+                button.className = 'action-btn btn-delete';
+                button.setAttribute('data-action', 'cancel');
+                button.textContent = event.status === 'waitlisted' ? 'Leave waitlist' : 'Cancel';
+            } else {
+                button.className = 'action-btn btn-approve';
+                button.setAttribute('data-action', 'register');
+                button.textContent = event.capacity !== null && event.registered >= event.capacity
+                    ? 'Join waitlist' : 'Register';
+            }
+            row.cells[4].appendChild(button);
+            table.appendChild(row);
+        });
+    });
+}
+
+function changeRegistration(eventId, action) {
+    fetch(`/api/events/${eventId}/${action}`, {method: 'POST'})
+    .then(response => response.json())
+    .then(data => {
+        showNotification(data.message, data.success ? 'success' : 'error');
+        loadUpcomingEvents();
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        showNotification('An error occurred while updating your registration.', 'error');
+        loadUpcomingEvents();
+    });
+}
+
 // Show loading state
 function showLoading(show) {
     const buttons = document.querySelectorAll('button[type="submit"]');
@@ -0,0 +1,53 @@
+import pytest
+
+import archive
+import bitmaps
+import database
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = database.connect(str(tmp_path / 'portal.db'))
+    database.migrate(conn)
+    conn.execute("INSERT INTO users (username, password, role, name) VALUES ('faculty1', 'x', 'faculty', 'F')")
+    conn.execute("INSERT INTO classes (name, faculty_id) VALUES ('Mathematics', 1)")
+    conn.executemany("INSERT INTO users (username, password, role, name) VALUES (?, 'x', 'student', ?)",
+                     [(f's{i}', f'S {i}') for i in range(6)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_convert_merges_leftover_rows_into_existing_session(conn):
+    students = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'student' ORDER BY id")]
+    bitmaps.roster_positions(conn, 1, students)
+    bitmaps.write_session(conn, 1, '2024-01-08', {students[4]: 'present', students[5]: 'present'})
+    conn.execute("INSERT INTO attendance (student_id, class_id, date, status) VALUES (?, 1, '2024-01-08', 'absent')",
+                 (students[4],))
+    conn.commit()
+
+    assert bitmaps.convert(conn) == (1, 1)
+    # The bitmap mark is newer than the leftover row, and student 5 keeps theirs
+    assert bitmaps.session_marks(conn, 1, '2024-01-08') == {students[4]: 'present', students[5]: 'present'}
+
+
+def test_archive_term_moves_sessions(conn, tmp_path):
+    students = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'student' ORDER BY id")]
+    conn.execute("INSERT INTO attendance (student_id, class_id, date, status) VALUES (?, 1, '2024-01-01', 'present')",
+                 (students[0],))
+    bitmaps.write_session(conn, 1, '2024-01-08', {students[0]: 'present', students[1]: 'absent'})
+    bitmaps.write_session(conn, 1, '2024-07-01', {students[0]: 'present'})
+    conn.commit()
+
+    assert archive.archive_term(conn, '2024-odd', '2024-01-01', '2024-06-30', str(tmp_path)) == (3, 0)
+    assert [tuple(row) for row in conn.execute('SELECT date FROM attendance_sessions')] == [('2024-07-01',)]
+    archived = database.connect(str(tmp_path / '2024-odd.db'))
+    assert [tuple(row) for row in archived.execute(
+        'SELECT id < 0, student_id, date, status FROM attendance ORDER BY date, student_id')] == [
+        (0, students[0], '2024-01-01', 'present'),
+        (1, students[0], '2024-01-08', 'present'),
+        (1, students[1], '2024-01-08', 'absent'),
+    ]
+    archived.close()
+    # Running it again moves nothing twice
+    assert archive.archive_term(conn, '2024-odd', '2024-01-01', '2024-06-30', str(tmp_path)) == (0, 0)
@@ -0,0 +1,46 @@
+import io
+
+import pytest
+
+import database
+import importer
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = database.connect(str(tmp_path / 'portal.db'))
+    database.migrate(conn)
+    conn.execute("INSERT INTO users (username, password, role, name) VALUES ('faculty1', 'x', 'faculty', 'F')")
+    conn.execute("INSERT INTO classes (name, faculty_id) VALUES ('Mathematics', 1)")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def csv_rows(text):
+    return importer.iter_rows(io.BytesIO(text.encode()), 'upload.csv')
+
+
+def count(conn, table):
+    return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_import_users_reports_rows_inserted(conn):
+    before = count(conn, 'users')
+    report = importer.import_users(conn, csv_rows(
+        'name,username,password,class\n'
+        'Ann,ann,pw,B.Tech CSE\n'
+        'Bob,bob,pw,B.Tech ECE\n'
+        'Ann again,ann,pw,B.Tech CSE\n'), 'student')
+    assert count(conn, 'users') - before == 2
+    assert report['inserted'] == 2
+    assert report['failed'] == 1
+
+
+def test_import_enrollments_reports_rows_inserted(conn):
+    importer.import_users(conn, csv_rows('name,username,password,class\nAnn,ann,pw,CSE\nBob,bob,pw,CSE\n'),
+                          'student')
+    report = importer.import_enrollments(conn, csv_rows('username,class_id\nann,1\nbob,1\nann,1\nnobody,1\n'))
+    assert count(conn, 'class_enrollments') == 2
+    assert report['inserted'] == 2
+    assert report['failed'] == 1
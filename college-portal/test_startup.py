@@ -0,0 +1,12 @@
+import os
+import subprocess
+import sys
+
+import check_startup
+
+
+def test_startup_within_budget():
+    # Fresh interpreters, as check_startup.py measures a new worker
+    result = subprocess.run([sys.executable, os.path.join(check_startup.APP_DIR, 'check_startup.py'), '--runs', '3'],
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr